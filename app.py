@@ -32,6 +32,123 @@ app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 # Set up Google Cloud API keys
 app.config["GOOGLE_VISION_API_KEY"] = os.environ.get("GOOGLE_VISION_API_KEY", "")
 app.config["GOOGLE_MAPS_API_KEY"] = os.environ.get("GOOGLE_MAPS_API_KEY", "")
+app.config["GOOGLE_VISION_API_ENDPOINT"] = os.environ.get("GOOGLE_VISION_API_ENDPOINT", "https://vision.googleapis.com/v1/images:annotate")
+app.config["GOOGLE_MAPS_API_BASE_URL"] = os.environ.get("GOOGLE_MAPS_API_BASE_URL", "https://maps.googleapis.com/maps/api")
+
+# Keep-alive connections per upstream host in each worker process
+app.config["HTTP_POOL_SIZE"] = int(os.environ.get("HTTP_POOL_SIZE", 10))
+
+# Google API resilience: connect/read timeouts and total budget per call in
+# seconds, retries, hedging delay (0 disables) and circuit breaker settings
+app.config["UPSTREAM_CONNECT_TIMEOUT"] = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", 3.05))
+app.config["MAPS_READ_TIMEOUT"] = float(os.environ.get("MAPS_READ_TIMEOUT", 5))
+app.config["MAPS_DEADLINE"] = float(os.environ.get("MAPS_DEADLINE", 8))
+app.config["MAPS_HEDGE_DELAY_MS"] = int(os.environ.get("MAPS_HEDGE_DELAY_MS", 1000))
+app.config["VISION_READ_TIMEOUT"] = float(os.environ.get("VISION_READ_TIMEOUT", 20))
+app.config["VISION_DEADLINE"] = float(os.environ.get("VISION_DEADLINE", 30))
+app.config["VISION_HEDGE_DELAY_MS"] = int(os.environ.get("VISION_HEDGE_DELAY_MS", 0))
+app.config["UPSTREAM_RETRIES"] = int(os.environ.get("UPSTREAM_RETRIES", 2))
+app.config["CIRCUIT_FAILURE_THRESHOLD"] = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", 5))
+app.config["CIRCUIT_RESET_TIMEOUT"] = float(os.environ.get("CIRCUIT_RESET_TIMEOUT", 30))
+
+# Coalesce concurrent Vision requests into batches (a window of 0 disables batching)
+app.config["VISION_BATCH_WINDOW_MS"] = int(os.environ.get("VISION_BATCH_WINDOW_MS", 20))
+app.config["VISION_BATCH_MAX_SIZE"] = int(os.environ.get("VISION_BATCH_MAX_SIZE", 16))
+
+# Largest accepted image upload and how much of it is buffered in memory
+# before spilling to a temporary file
+app.config["MAX_UPLOAD_BYTES"] = int(os.environ.get("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+app.config["UPLOAD_SPOOL_BYTES"] = int(os.environ.get("UPLOAD_SPOOL_BYTES", 1024 * 1024))
+
+# Resumable /api/uploads: where partial uploads are kept and for how long
+# they can be resumed (or their result fetched again)
+app.config["RESUMABLE_UPLOAD_PATH"] = os.environ.get("RESUMABLE_UPLOAD_PATH", os.path.join(app.instance_path, "uploads"))
+app.config["RESUMABLE_UPLOAD_TTL"] = int(os.environ.get("RESUMABLE_UPLOAD_TTL", 24 * 3600))
+
+# Bulk classification (/api/classify/bulk): request size, images per request
+# and decode processes (0 = one per CPU)
+app.config["BULK_MAX_UPLOAD_BYTES"] = int(os.environ.get("BULK_MAX_UPLOAD_BYTES", 512 * 1024 * 1024))
+app.config["BULK_MAX_IMAGES"] = int(os.environ.get("BULK_MAX_IMAGES", 500))
+app.config["BULK_DECODE_WORKERS"] = int(os.environ.get("BULK_DECODE_WORKERS", 0))
+
+# Uploads are rotated upright, downsized and re-encoded before classification
+app.config["VISION_MAX_DIMENSION"] = int(os.environ.get("VISION_MAX_DIMENSION", 1024))
+app.config["VISION_JPEG_QUALITY"] = int(os.environ.get("VISION_JPEG_QUALITY", 85))
+
+# Content-addressed store for uploaded images and their square thumbnails
+app.config["IMAGE_STORE_PATH"] = os.environ.get("IMAGE_STORE_PATH", os.path.join(app.instance_path, "images"))
+app.config["IMAGE_THUMBNAIL_SIZE"] = int(os.environ.get("IMAGE_THUMBNAIL_SIZE", 256))
+
+# Background classification for /api/classify?async=1: worker threads and
+# pending jobs per process, how long finished jobs stay pollable, after how
+# long an unfinished job is failed as abandoned, and how long an event stream
+# holds a worker before the client reconnects (polling status_url is the
+# default, the stream is an optional shortcut and is kept short on purpose)
+app.config["CLASSIFICATION_WORKERS"] = int(os.environ.get("CLASSIFICATION_WORKERS", 4))
+app.config["CLASSIFICATION_MAX_PENDING"] = int(os.environ.get("CLASSIFICATION_MAX_PENDING", 64))
+app.config["CLASSIFICATION_JOB_TTL"] = int(os.environ.get("CLASSIFICATION_JOB_TTL", 24 * 3600))
+app.config["CLASSIFICATION_JOB_TIMEOUT"] = int(os.environ.get("CLASSIFICATION_JOB_TIMEOUT", 10 * 60))
+app.config["CLASSIFICATION_EVENTS_TIMEOUT"] = int(os.environ.get("CLASSIFICATION_EVENTS_TIMEOUT", 5))
+
+# Admission control for the classification endpoints, shared by all workers
+# of a host: token buckets (refill per second, burst) per user and overall,
+# requests in flight overall and per user (keep the overall limit below the
+# worker count so cheap pages always find a free worker), the lease
+# lifetime of a request whose worker died and the bulk upload bytes charged
+# as one token
+app.config["ADMISSION_ENABLED"] = os.environ.get("ADMISSION_ENABLED", "1") not in ("0", "false")
+app.config["ADMISSION_DB_PATH"] = os.environ.get("ADMISSION_DB_PATH", os.path.join(app.instance_path, "admission.sqlite"))
+app.config["ADMISSION_USER_RATE"] = float(os.environ.get("ADMISSION_USER_RATE", 0.5))
+app.config["ADMISSION_USER_BURST"] = int(os.environ.get("ADMISSION_USER_BURST", 10))
+app.config["ADMISSION_GLOBAL_RATE"] = float(os.environ.get("ADMISSION_GLOBAL_RATE", 20))
+app.config["ADMISSION_GLOBAL_BURST"] = int(os.environ.get("ADMISSION_GLOBAL_BURST", 60))
+app.config["ADMISSION_MAX_IN_FLIGHT"] = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", 4))
+app.config["ADMISSION_USER_MAX_IN_FLIGHT"] = int(os.environ.get("ADMISSION_USER_MAX_IN_FLIGHT", 2))
+app.config["ADMISSION_LEASE_TTL"] = int(os.environ.get("ADMISSION_LEASE_TTL", 300))
+app.config["ADMISSION_BULK_BYTES_PER_TOKEN"] = int(os.environ.get("ADMISSION_BULK_BYTES_PER_TOKEN", 1024 * 1024))
+
+# Local-first classification: escalate to Vision below this confidence or when
+# the two best categories are closer than the margin
+app.config["CASCADE_CONFIDENCE_THRESHOLD"] = float(os.environ.get("CASCADE_CONFIDENCE_THRESHOLD", 0.8))
+app.config["CASCADE_AMBIGUITY_MARGIN"] = float(os.environ.get("CASCADE_AMBIGUITY_MARGIN", 0.2))
+
+# Offline waste classifier exported by `flask train-waste-model`
+app.config["OFFLINE_MODEL_PATH"] = os.environ.get("OFFLINE_MODEL_PATH", os.path.join(app.instance_path, "waste_model"))
+
+# Classification result cache (in-process LRU entries, TTL in seconds, database rows)
+app.config["CLASSIFICATION_CACHE_SIZE"] = int(os.environ.get("CLASSIFICATION_CACHE_SIZE", 1024))
+app.config["CLASSIFICATION_CACHE_TTL"] = int(os.environ.get("CLASSIFICATION_CACHE_TTL", 30 * 24 * 3600))
+app.config["CLASSIFICATION_CACHE_MAX_ROWS"] = int(os.environ.get("CLASSIFICATION_CACHE_MAX_ROWS", 100000))
+
+# Near-duplicate photo detection (max Hamming distance between 64-bit dHashes),
+# how long a fingerprint stays reusable and how many are kept per classifier
+app.config["NEAR_DUPLICATE_MAX_DISTANCE"] = int(os.environ.get("NEAR_DUPLICATE_MAX_DISTANCE", 6))
+app.config["NEAR_DUPLICATE_REFRESH_INTERVAL"] = int(os.environ.get("NEAR_DUPLICATE_REFRESH_INTERVAL", 30))
+app.config["NEAR_DUPLICATE_TTL"] = int(os.environ.get("NEAR_DUPLICATE_TTL", 180 * 24 * 3600))
+app.config["NEAR_DUPLICATE_MAX_ROWS"] = int(os.environ.get("NEAR_DUPLICATE_MAX_ROWS", 1000000))
+
+# Seconds between checks for newly published emission factor versions
+app.config["EMISSION_FACTORS_REFRESH_INTERVAL"] = int(os.environ.get("EMISSION_FACTORS_REFRESH_INTERVAL", 30))
+
+# In-memory index of recycling center locations: seconds between pulls of
+# centers added by other workers and between full reloads
+app.config["CENTER_INDEX_REFRESH_INTERVAL"] = int(os.environ.get("CENTER_INDEX_REFRESH_INTERVAL", 30))
+app.config["CENTER_INDEX_REBUILD_INTERVAL"] = int(os.environ.get("CENTER_INDEX_REBUILD_INTERVAL", 600))
+
+# Places nearby-search cache (in-process LRU entries, seconds served fresh,
+# further seconds served stale while refreshed, database rows)
+app.config["PLACES_CACHE_SIZE"] = int(os.environ.get("PLACES_CACHE_SIZE", 2048))
+app.config["PLACES_CACHE_TTL"] = int(os.environ.get("PLACES_CACHE_TTL", 24 * 3600))
+app.config["PLACES_CACHE_STALE_TTL"] = int(os.environ.get("PLACES_CACHE_STALE_TTL", 6 * 24 * 3600))
+app.config["PLACES_CACHE_MAX_ROWS"] = int(os.environ.get("PLACES_CACHE_MAX_ROWS", 50000))
+
+# Place Details enrichment (in-process LRU entries, TTL in seconds, database
+# rows, concurrent fetches per process, seconds a request waits for them)
+app.config["PLACE_DETAILS_CACHE_SIZE"] = int(os.environ.get("PLACE_DETAILS_CACHE_SIZE", 4096))
+app.config["PLACE_DETAILS_TTL"] = int(os.environ.get("PLACE_DETAILS_TTL", 30 * 24 * 3600))
+app.config["PLACE_DETAILS_MAX_ROWS"] = int(os.environ.get("PLACE_DETAILS_MAX_ROWS", 100000))
+app.config["PLACE_DETAILS_WORKERS"] = int(os.environ.get("PLACE_DETAILS_WORKERS", 16))
+app.config["PLACE_DETAILS_DEADLINE"] = float(os.environ.get("PLACE_DETAILS_DEADLINE", 2.0))
 
 # Initialize the database with the app
 db.init_app(app)
@@ -47,10 +164,17 @@ with app.app_context():
     db.create_all()
     logger.info("Database tables created")
 
+    # Tables created by an earlier version get the columns added since
+    from utils.schema import add_missing_columns
+    add_missing_columns(db)
+
 # The user_loader is defined in models.py
 # No need to duplicate it here
 
 # Import routes directly (we'll use blueprints in a future update)
 import routes
 
+# Register command line tools (flask train-waste-model, ...)
+import cli
+
 logger.info("Application initialized successfully")
@@ -0,0 +1,77 @@
+"""
+Benchmark the vectorized carbon calculation against calculate_carbon_savings()
+and get_carbon_equivalents() called per entry, and check that both give
+exactly the same values.
+
+Weights are drawn so that many products land on rounding ties (weights with
+few decimals, as users enter them), which is where np.round() and round()
+disagree.
+
+Run from the repository root:
+
+    python -m benchmarks.carbon_batch --entries 1000000
+"""
+import logging
+import argparse
+import timeit
+import numpy as np
+from utils.carbon_calculator import (
+    CARBON_SAVINGS, calculate_carbon_savings, calculate_carbon_savings_batch,
+    get_carbon_equivalents, get_carbon_equivalents_batch
+)
+
+def make_entries(count, seed):
+    rng = np.random.default_rng(seed)
+    waste_types = np.array(list(CARBON_SAVINGS) + ['unknown'], dtype=object)
+    subtypes = np.array(['plastic', 'paper', 'metal', 'food', 'battery', 'electronic', 'general', None], dtype=object)
+
+    types = waste_types[rng.integers(0, len(waste_types), count)]
+    specific = subtypes[rng.integers(0, len(subtypes), count)]
+    weights = np.where(
+        rng.random(count) < 0.5,
+        rng.integers(0, 100000, count) / 1000.0,
+        rng.uniform(0, 50, count)
+    )
+    # A few NULL weights, as read from the database
+    weights[rng.random(count) < 0.01] = np.nan
+    return types, specific, weights
+
+def scalar_savings(types, specific, weights):
+    return [calculate_carbon_savings(t, None if np.isnan(w) else float(w), s)
+            for t, s, w in zip(types, specific, weights)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    # The scalar function logs every unknown type and missing weight
+    logging.disable(logging.CRITICAL)
+
+    types, specific, weights = make_entries(args.entries, args.seed)
+
+    expected = scalar_savings(types, specific, weights)
+    batch = calculate_carbon_savings_batch(types, weights, specific)
+    mismatches = sum(1 for a, b in zip(expected, batch.tolist()) if a != b)
+    print(f"savings: {mismatches} mismatches in {args.entries} entries")
+
+    expected = [get_carbon_equivalents(value) for value in batch.tolist()]
+    equivalents = get_carbon_equivalents_batch(batch)
+    mismatches = sum(1 for i, values in enumerate(expected)
+                     for name, value in values.items() if equivalents[name][i] != value)
+    print(f"equivalents: {mismatches} mismatches in {args.entries * len(equivalents)} values")
+
+    scalar = min(timeit.repeat(lambda: scalar_savings(types, specific, weights), number=1, repeat=args.repeat))
+    vectorized = min(timeit.repeat(lambda: calculate_carbon_savings_batch(types, weights, specific),
+                                   number=1, repeat=args.repeat))
+    print(f"savings     per entry: {scalar:.3f}s  batch: {vectorized:.3f}s  ({scalar / vectorized:.0f}x)")
+
+    values = batch.tolist()
+    scalar = min(timeit.repeat(lambda: [get_carbon_equivalents(value) for value in values],
+                               number=1, repeat=args.repeat))
+    vectorized = min(timeit.repeat(lambda: get_carbon_equivalents_batch(batch), number=1, repeat=args.repeat))
+    print(f"equivalents per entry: {scalar:.3f}s  batch: {vectorized:.3f}s  ({scalar / vectorized:.0f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Benchmark recycling center radius queries through the spatial index against
+the full table scan find_centers_from_db() used to do, for growing catalogs,
+and check that both find the same centers. Also times k-nearest and whole
+catalog distance orderings against a per-center Python sort.
+
+Centers are clustered around random cities, like a real catalog; query
+points are drawn near the same cities plus a few anywhere, including near
+the poles and the antimeridian.
+
+Run from the repository root:
+
+    python -m benchmarks.center_queries --sizes 1000,10000,100000,300000 --queries 200
+"""
+import os
+import random
+import logging
+import argparse
+import tempfile
+from time import perf_counter
+import numpy as np
+
+def make_centers(count, rng):
+    cities = [(rng.uniform(-60, 70), rng.uniform(-180, 180)) for _ in range(max(count // 500, 20))]
+    cities += [(89.5, 0.0), (-0.5, 179.95), (0.5, -179.95)]
+    centers = []
+    for _ in range(count):
+        lat, lng = rng.choice(cities)
+        lat = max(-90.0, min(90.0, lat + rng.gauss(0, 0.3)))
+        lng = (lng + rng.gauss(0, 0.3) + 180.0) % 360.0 - 180.0
+        centers.append((lat, lng))
+    return centers, cities
+
+def full_scan(latitude, longitude, radius):
+    # What find_centers_from_db() did before the index
+    from models import RecyclingCenter
+    from utils.maps_helper import calculate_distance
+
+    nearby = []
+    for center in RecyclingCenter.query.all():
+        distance = calculate_distance(latitude, longitude, center.latitude, center.longitude)
+        if distance <= radius:
+            nearby.append((round(distance, 2), center.name))
+    nearby.sort()
+    return nearby
+
+def percentiles(latencies):
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return f"p50 {p50:8.2f} ms  p95 {p95:8.2f} ms  p99 {p99:8.2f} ms"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000', help='Comma separated catalog sizes')
+    parser.add_argument('--queries', type=int, default=200, help='Queries per size')
+    parser.add_argument('--radius', type=float, default=10.0, help='Search radius in km')
+    parser.add_argument('--scan-queries', type=int, default=10, help='Full scan queries per size (they are slow)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    database = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    database.close()
+    os.environ['DATABASE_URL'] = f"sqlite:///{database.name}"
+    logging.disable(logging.CRITICAL)
+
+    from app import app, db
+    from models import RecyclingCenter
+    from utils.maps_helper import find_centers_from_db
+    from utils.center_index import get_center_index
+
+    rng = random.Random(args.seed)
+    inserted = 0
+    try:
+        with app.app_context():
+            index = get_center_index()
+            for size in [int(size) for size in args.sizes.split(',')]:
+                centers, cities = make_centers(size - inserted, rng)
+                db.session.execute(db.insert(RecyclingCenter), [
+                    {'name': f"Center {inserted + i}", 'latitude': lat, 'longitude': lng}
+                    for i, (lat, lng) in enumerate(centers)
+                ])
+                db.session.commit()
+                inserted = size
+
+                # Bulk inserts skip the ORM events; load them like another worker's
+                index.refresh_interval = 0
+                start = perf_counter()
+                index.sync()
+                index.refresh_interval = 3600
+                load = perf_counter() - start
+
+                points = [(lat + rng.gauss(0, 0.1), lng + rng.gauss(0, 0.1)) for lat, lng in
+                          (rng.choice(cities) for _ in range(args.queries))]
+                points += [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(args.queries // 10)]
+
+                latencies, found = [], 0
+                for lat, lng in points:
+                    start = perf_counter()
+                    found += len(find_centers_from_db(lat, lng, args.radius))
+                    latencies.append(perf_counter() - start)
+                print(f"{size:>7} centers  index   {percentiles(latencies)}  "
+                      f"{found / len(points):6.1f} found/query  (index load {load:.2f}s)")
+
+                latencies, mismatches = [], 0
+                for lat, lng in points[:args.scan_queries]:
+                    start = perf_counter()
+                    expected = full_scan(lat, lng, args.radius)
+                    latencies.append(perf_counter() - start)
+                    got = sorted((c['distance'], c['name']) for c in find_centers_from_db(lat, lng, args.radius))
+                    mismatches += got != expected
+                db.session.remove()
+                print(f"{size:>7} centers  scan    {percentiles(latencies)}  "
+                      f"{mismatches} of {len(latencies)} queries differ")
+
+                # Per-center Python baseline for the orderings
+                from utils.geo import haversine_distance
+                positions = [(center.id, center.latitude, center.longitude) for center in
+                             db.session.query(RecyclingCenter.id, RecyclingCenter.latitude, RecyclingCenter.longitude)]
+                db.session.remove()
+
+                nearest_mismatches, sort_mismatches = 0, 0
+                latencies = {'nearest': [], 'sorted': [], 'python sort': []}
+                for lat, lng in points[:args.scan_queries]:
+                    start = perf_counter()
+                    brute = sorted((haversine_distance(lat, lng, c_lat, c_lng), c_id) for c_id, c_lat, c_lng in positions)
+                    latencies['python sort'].append(perf_counter() - start)
+
+                    start = perf_counter()
+                    distances, _ = index.nearest(lat, lng, 5)
+                    latencies['nearest'].append(perf_counter() - start)
+                    nearest_mismatches += not np.allclose(distances, [d for d, _ in brute[:5]], rtol=0, atol=1e-9)
+
+                    start = perf_counter()
+                    distances, ids = index.sorted_by_distance(lat, lng)
+                    latencies['sorted'].append(perf_counter() - start)
+                    sort_mismatches += (len(ids) != len(brute) or
+                                        not np.allclose(distances, [d for d, _ in brute], rtol=0, atol=1e-9))
+                for name, values in latencies.items():
+                    print(f"{size:>7} centers  {name:<11} {percentiles(values)}")
+                print(f"{size:>7} centers  {nearest_mismatches} of {args.scan_queries} k=5 queries and "
+                      f"{sort_mismatches} orderings differ")
+    finally:
+        os.unlink(database.name)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+"""
+Local stand-in for the Google APIs the app calls: Vision images:annotate,
+Places nearbysearch/details and Directions.
+
+Responses are generated deterministically from the request (the same image
+always gets the same labels, the same location the same places), after a
+configurable delay, with a configurable share of failed or stalled calls.
+Canned responses can replace the generated ones.
+
+Run from the repository root:
+
+    python -m benchmarks.google_standin --port 8085 --latency 120 --jitter 40 --error-rate 0.02
+
+and point the app at it:
+
+    GOOGLE_VISION_API_ENDPOINT=http://127.0.0.1:8085/v1/images:annotate
+    GOOGLE_MAPS_API_BASE_URL=http://127.0.0.1:8085/maps/api
+
+GET /__stats returns the number of calls per endpoint.
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENDPOINTS = {
+    ('POST', '/v1/images:annotate'): 'vision',
+    ('GET', '/maps/api/place/nearbysearch/json'): 'nearbysearch',
+    ('GET', '/maps/api/place/details/json'): 'details',
+    ('GET', '/maps/api/directions/json'): 'directions',
+}
+
+# Label sets covering every waste category, picked by image content
+LABEL_SETS = [
+    [('Plastic bottle', 0.97), ('Bottle', 0.93), ('Drinkware', 0.81), ('Plastic', 0.78)],
+    [('Cardboard', 0.95), ('Paper', 0.88), ('Carton', 0.74), ('Box', 0.7)],
+    [('Food', 0.94), ('Fruit', 0.9), ('Vegetable', 0.71), ('Produce', 0.66)],
+    [('Battery', 0.92), ('Electronic device', 0.83), ('Gadget', 0.6)],
+    [('Tin can', 0.9), ('Metal', 0.86), ('Aluminum can', 0.8)],
+    [('Plastic bag', 0.89), ('Wrapper', 0.7), ('Packaging', 0.64)],
+    [('Font', 0.6), ('Pattern', 0.55), ('Rectangle', 0.5)],
+]
+
+OBJECT_SETS = [
+    [('Bottle', 0.88)], [('Box', 0.8)], [('Food', 0.77)], [('Mobile phone', 0.7)], [('Tin can', 0.75)],
+    [('Bag', 0.72)], [],
+]
+
+WEEKDAY_TEXT = [f"{day}: 8:00 AM – 6:00 PM" for day in
+                ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday')] + ["Sunday: Closed"]
+
+class StandinConfig:
+    """
+    Behaviour of the stand-in server.
+
+    Args:
+        latency_ms (float): Mean delay before answering a call
+        jitter_ms (float): Delay is drawn uniformly from latency_ms +/- jitter_ms
+        per_image_ms (float): Extra Vision delay per image in a batch
+        error_rate (float): Share of calls answered with `error_status`
+        error_status (int): HTTP status of failed calls
+        stall_rate (float): Share of calls that hang for `stall_ms` first
+        stall_ms (float): How long stalled calls hang
+        places (int): Places returned by nearbysearch
+        canned (dict, optional): Endpoint name to a fixed response body
+        seed (int, optional): Seed for the delay and failure draws
+    """
+
+    def __init__(self, latency_ms=100.0, jitter_ms=0.0, per_image_ms=0.0, error_rate=0.0,
+                 error_status=503, stall_rate=0.0, stall_ms=30000.0, places=10, canned=None, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.per_image_ms = per_image_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stall_rate = stall_rate
+        self.stall_ms = stall_ms
+        self.places = places
+        self.canned = canned or {}
+        self.random = random.Random(seed)
+
+def load_canned(directory):
+    """
+    Read canned responses named after their endpoint (vision.json, details.json, ...)
+
+    Args:
+        directory (str): Directory holding the JSON files
+
+    Returns:
+        dict: Endpoint name to response body
+    """
+    canned = {}
+    for endpoint in ENDPOINTS.values():
+        path = os.path.join(directory, f"{endpoint}.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                canned[endpoint] = json.load(f)
+    return canned
+
+def _digest_index(value, count):
+    return int(hashlib.sha1(value.encode('utf-8')).hexdigest()[:8], 16) % count
+
+def vision_response(body):
+    responses = []
+    for request in body.get('requests', []):
+        content = request.get('image', {}).get('content', '')
+        choice = _digest_index(content[-4096:], len(LABEL_SETS))
+        response = {'labelAnnotations': [
+            {'description': description, 'score': score, 'topicality': score}
+            for description, score in LABEL_SETS[choice]
+        ]}
+        features = {feature.get('type') for feature in request.get('features', [])}
+        if 'OBJECT_LOCALIZATION' in features:
+            response['localizedObjectAnnotations'] = [
+                {'name': name, 'score': score} for name, score in OBJECT_SETS[choice]
+            ]
+        responses.append(response)
+    return {'responses': responses}
+
+def nearbysearch_response(params, count):
+    lat, lng = (float(value) for value in params.get('location', '0,0').split(','))
+    rng = random.Random(f"{lat:.4f},{lng:.4f}")
+    results = []
+    for i in range(count):
+        place_lat = lat + rng.uniform(-0.03, 0.03)
+        place_lng = lng + rng.uniform(-0.03, 0.03)
+        results.append({
+            'place_id': f"standin-{place_lat:.5f}-{place_lng:.5f}",
+            'name': f"Stand-in Recycling Center {i + 1}",
+            'vicinity': f"{100 + i} Green St",
+            'geometry': {'location': {'lat': place_lat, 'lng': place_lng}},
+            'rating': round(rng.uniform(3.0, 5.0), 1),
+            'types': ['point_of_interest', 'establishment'],
+            'opening_hours': {'open_now': rng.random() < 0.7}
+        })
+    return {'status': 'OK', 'results': results}
+
+def details_response(params):
+    place_id = params.get('place_id', '')
+    number = _digest_index(place_id, 10000)
+    return {'status': 'OK', 'result': {
+        'place_id': place_id,
+        'formatted_phone_number': f"(555) 555-{number:04d}",
+        'website': f"https://example.com/centers/{number}",
+        'formatted_address': f"{number} Green St, Springfield",
+        'opening_hours': {'weekday_text': WEEKDAY_TEXT}
+    }}
+
+def directions_response(params):
+    steps = [{
+        'html_instructions': f"Continue for step {i + 1}",
+        'distance': {'text': '0.4 km', 'value': 400},
+        'duration': {'text': '1 min', 'value': 60}
+    } for i in range(5)]
+    return {'status': 'OK', 'routes': [{'legs': [{
+        'distance': {'text': '2.0 km', 'value': 2000},
+        'duration': {'text': '6 mins', 'value': 360},
+        'start_address': params.get('origin', ''),
+        'end_address': params.get('destination', ''),
+        'steps': steps
+    }]}]}
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self, method):
+        server = self.server
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+
+        if method == 'GET' and url.path == '/__stats':
+            return self._send(200, server.stats())
+
+        endpoint = ENDPOINTS.get((method, url.path))
+        if endpoint is None:
+            return self._send(404, {'error': {'code': 404, 'message': f"No stand-in for {method} {url.path}"}})
+        server.count(endpoint)
+
+        config = server.config
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        body = json.loads(raw) if raw else {}
+
+        with server.random_lock:
+            delay = config.latency_ms + config.random.uniform(-config.jitter_ms, config.jitter_ms)
+            stalled = config.random.random() < config.stall_rate
+            failed = config.random.random() < config.error_rate
+        if endpoint == 'vision':
+            delay += config.per_image_ms * len(body.get('requests', []))
+        if stalled:
+            delay += config.stall_ms
+        time.sleep(max(delay, 0) / 1000.0)
+
+        if failed:
+            server.count(endpoint + '_errors')
+            return self._send(config.error_status, {
+                'error': {'code': config.error_status, 'message': 'Injected stand-in failure'},
+                'status': 'UNKNOWN_ERROR'
+            })
+
+        if endpoint in config.canned:
+            return self._send(200, config.canned[endpoint])
+        if endpoint == 'vision':
+            return self._send(200, vision_response(body))
+        if endpoint == 'nearbysearch':
+            return self._send(200, nearbysearch_response(params, config.places))
+        if endpoint == 'details':
+            return self._send(200, details_response(params))
+        return self._send(200, directions_response(params))
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class StandinServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server answering like the Google APIs.
+
+    Start it in-process with start_standin(), or from the command line.
+    """
+
+    daemon_threads = True
+    # Benchmarks open many keep-alive connections at once
+    request_queue_size = 256
+
+    def __init__(self, address, config):
+        super().__init__(address, StandinHandler)
+        self.config = config
+        self.random_lock = threading.Lock()
+        self._counts_lock = threading.Lock()
+        self._counts = {}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle_error(self, request, client_address):
+        # Clients give up on stalled calls; that is expected here
+        pass
+
+    def count(self, name):
+        with self._counts_lock:
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def stats(self):
+        with self._counts_lock:
+            return dict(self._counts)
+
+def start_standin(config=None, host='127.0.0.1', port=0):
+    """
+    Start a stand-in server on a background thread
+
+    Args:
+        config (StandinConfig, optional): Server behaviour
+        host (str): Interface to listen on
+        port (int): Port to listen on, 0 picks a free one
+
+    Returns:
+        StandinServer: The running server; call shutdown() to stop it
+    """
+    server = StandinServer((host, port), config or StandinConfig())
+    thread = threading.Thread(target=server.serve_forever, name='google-standin', daemon=True)
+    thread.start()
+    return server
+
+def add_standin_arguments(parser):
+    """Add the options shared by the stand-in and the benchmarks that start one."""
+    parser.add_argument('--latency', type=float, default=100.0, help='Mean upstream latency in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Latency varies by +/- this many ms')
+    parser.add_argument('--per-image', type=float, default=0.0, help='Extra Vision latency per batched image in ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of calls that fail')
+    parser.add_argument('--error-status', type=int, default=503, help='HTTP status of failed calls')
+    parser.add_argument('--stall-rate', type=float, default=0.0, help='Share of calls that hang')
+    parser.add_argument('--stall', type=float, default=30000.0, help='How long hanging calls hang in ms')
+    parser.add_argument('--places', type=int, default=10, help='Places returned by nearbysearch')
+    parser.add_argument('--canned', default=None, help='Directory of canned <endpoint>.json responses')
+    parser.add_argument('--seed', type=int, default=None)
+
+def config_from_arguments(args):
+    """Build a StandinConfig from options added by add_standin_arguments()."""
+    return StandinConfig(
+        latency_ms=args.latency,
+        jitter_ms=args.jitter,
+        per_image_ms=args.per_image,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        stall_rate=args.stall_rate,
+        stall_ms=args.stall,
+        places=args.places,
+        canned=load_canned(args.canned) if args.canned else None,
+        seed=args.seed
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8085)
+    add_standin_arguments(parser)
+    args = parser.parse_args()
+
+    server = StandinServer((args.host, args.port), config_from_arguments(args))
+    print(f"Google API stand-in listening on {server.url}")
+    print(f"  GOOGLE_VISION_API_ENDPOINT={server.url}/v1/images:annotate")
+    print(f"  GOOGLE_MAPS_API_BASE_URL={server.url}/maps/api")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""
+Measure throughput and latency of the outbound Google API paths against the
+local stand-in server, without network access or API keys.
+
+Each target is driven at every concurrency level with distinct inputs (new
+images and locations, so caches do not answer for the upstream) and
+reported as requests/sec with p50/p95/p99 latency:
+
+    utils_vision       utils.py classify_waste_image()
+    utils_places       utils.py get_nearby_recycling_centers()
+    classifier         utils/waste_classifier.py classify_waste_image()
+    maps_nearby        utils/maps_api.py get_nearby_recycling_centers()
+    maps_directions    utils/maps_api.py get_directions()
+    maps_helper        utils/maps_helper.py find_nearby_centers()
+
+Run from the repository root:
+
+    python -m benchmarks.google_throughput --concurrency 1,8,32 --requests 200 --latency 80 --jitter 30
+"""
+import io
+import os
+import sys
+import json
+import random
+import logging
+import tempfile
+import argparse
+import importlib.util
+from time import perf_counter
+from urllib.request import urlopen
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from benchmarks.google_standin import add_standin_arguments, config_from_arguments, start_standin
+
+TARGETS = ['utils_vision', 'utils_places', 'classifier', 'maps_nearby', 'maps_directions', 'maps_helper']
+
+def random_location(rng):
+    return rng.uniform(-60.0, 60.0), rng.uniform(-170.0, 170.0)
+
+def make_images(count, seed):
+    # Noise images: every one is distinct, so neither the classification
+    # cache nor the near-duplicate index can answer for Vision
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        pixels = rng.integers(0, 256, (240, 320, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='JPEG', quality=80)
+        images.append(buffer.getvalue())
+    return images
+
+def configure_environment(base_url, database_path):
+    # Read by app.py and utils.py at import time
+    os.environ['DATABASE_URL'] = f"sqlite:///{database_path}"
+    os.environ['GOOGLE_VISION_API_ENDPOINT'] = f"{base_url}/v1/images:annotate"
+    os.environ['GOOGLE_MAPS_API_BASE_URL'] = f"{base_url}/maps/api"
+    os.environ['GOOGLE_VISION_API_KEY'] = 'standin'
+    os.environ['GOOGLE_MAPS_API_KEY'] = 'standin'
+    os.environ.setdefault('SESSION_SECRET', 'benchmark')
+
+def load_legacy_utils():
+    # utils.py is shadowed by the utils/ package, so load it by path
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'utils.py')
+    spec = importlib.util.spec_from_file_location('legacy_utils', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def build_target(name, app, args):
+    """
+    Prepare a target: its inputs and a call returning whether the upstream answered
+
+    Functions that fall back silently are judged by their result, so
+    fallbacks count as errors.
+    """
+    rng = random.Random(args.seed)
+
+    if name in ('utils_vision', 'utils_places'):
+        legacy = load_legacy_utils()
+        if name == 'utils_vision':
+            fallback = legacy.fallback_waste_classification(None)
+
+            def classify(content):
+                with app.app_context():
+                    return legacy.classify_waste_image(content, 'standin') != fallback
+            return make_images, classify
+
+        def nearby(location):
+            with app.app_context():
+                centers = legacy.get_nearby_recycling_centers(location[0], location[1], 5, 'standin')
+            return centers != legacy.fallback_recycling_centers(*location)
+        return lambda n, seed: [random_location(rng) for _ in range(n)], nearby
+
+    if name == 'classifier':
+        from utils.waste_classifier import classify_waste_image
+
+        def classify(content):
+            with app.app_context():
+                return classify_waste_image(io.BytesIO(content))[0] is not None
+        return make_images, classify
+
+    if name in ('maps_nearby', 'maps_directions'):
+        from utils import maps_api
+
+        if name == 'maps_nearby':
+            def nearby(location):
+                with app.app_context():
+                    return bool(maps_api.get_nearby_recycling_centers(*location))
+            return lambda n, seed: [random_location(rng) for _ in range(n)], nearby
+
+        def directions(location):
+            with app.app_context():
+                return bool(maps_api.get_directions(location[0], location[1], location[0] + 0.01, location[1] + 0.01))
+        return lambda n, seed: [random_location(rng) for _ in range(n)], directions
+
+    from utils.maps_helper import find_nearby_centers
+
+    def helper(location):
+        with app.app_context():
+            centers = find_nearby_centers(*location)
+            # Database fallback results carry no place_id
+            return bool(centers) and 'place_id' in centers[0]
+    return lambda n, seed: [random_location(rng) for _ in range(n)], helper
+
+def run_level(call, inputs, concurrency):
+    def timed(item):
+        start = perf_counter()
+        try:
+            ok = call(item)
+        except Exception:
+            ok = False
+        return perf_counter() - start, ok
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, inputs))
+    elapsed = perf_counter() - start
+
+    latencies = np.array([latency for latency, _ in results]) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'requests': len(results),
+        'errors': sum(1 for _, ok in results if not ok),
+        'seconds': round(elapsed, 3),
+        'rps': round(len(results) / elapsed, 1),
+        'p50_ms': round(float(p50), 1),
+        'p95_ms': round(float(p95), 1),
+        'p99_ms': round(float(p99), 1),
+    }
+
+def upstream_stats(server, base_url):
+    if server is not None:
+        return server.stats()
+    with urlopen(f"{base_url}/__stats") as response:
+        return json.load(response)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--targets', default=','.join(TARGETS), help='Comma separated targets')
+    parser.add_argument('--concurrency', default='1,8,32', help='Comma separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=200, help='Calls per target and level')
+    parser.add_argument('--standin-url', default=None, help='Use a running stand-in instead of starting one')
+    parser.add_argument('--allow-local', action='store_true',
+                        help='Let the classifier answer confident images locally instead of always calling Vision')
+    parser.add_argument('--json', default=None, help='Also write the results to this file')
+    parser.add_argument('--verbose', action='store_true', help='Show application logging')
+    add_standin_arguments(parser)
+    args = parser.parse_args()
+
+    targets = [target for target in args.targets.split(',') if target]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"Unknown targets: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    server = None
+    if args.standin_url:
+        base_url = args.standin_url.rstrip('/')
+    else:
+        server = start_standin(config_from_arguments(args))
+        base_url = server.url
+
+    database = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    database.close()
+    configure_environment(base_url, database.name)
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    from app import app
+    if not args.allow_local:
+        # The local tier is never confident enough, so every image reaches Vision
+        app.config['CASCADE_CONFIDENCE_THRESHOLD'] = 1.01
+    if 'classifier' in targets and app.config.get('VISION_BATCH_WINDOW_MS', 0) <= 0:
+        # Without batching the classifier uses the gRPC client, which cannot be redirected
+        print("classifier: skipped, VISION_BATCH_WINDOW_MS must be above 0 to use the stand-in", file=sys.stderr)
+        targets.remove('classifier')
+
+    print(f"Stand-in at {base_url}: {args.latency:.0f} ms +/- {args.jitter:.0f} ms, "
+          f"{args.error_rate:.1%} errors, {args.stall_rate:.1%} stalls")
+    print(f"{'target':<16} {'conc':>5} {'reqs':>6} {'errors':>7} {'req/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  upstream calls")
+
+    results = []
+    try:
+        for target in targets:
+            make_inputs, call = build_target(target, app, args)
+            for seed, concurrency in enumerate(levels):
+                inputs = make_inputs(args.requests, (args.seed or 0) + seed)
+                before = upstream_stats(server, base_url)
+                result = run_level(call, inputs, concurrency)
+                after = upstream_stats(server, base_url)
+                result['upstream'] = {name: after[name] - before.get(name, 0)
+                                      for name in after if after[name] != before.get(name, 0)}
+                result.update(target=target, concurrency=concurrency)
+                results.append(result)
+
+                upstream = ', '.join(f"{name}={count}" for name, count in sorted(result['upstream'].items()))
+                print(f"{target:<16} {concurrency:>5} {result['requests']:>6} {result['errors']:>7} "
+                      f"{result['rps']:>8.1f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+                      f"{result['p99_ms']:>8.1f}  {upstream}")
+    finally:
+        if server is not None:
+            server.shutdown()
+        os.unlink(database.name)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark the compiled label matcher against the nested substring loops it
+replaced in utils/waste_classifier.py and utils/vision_api.py.
+
+Run from the repository root:
+
+    python -m benchmarks.label_matching --keywords 5000
+"""
+import random
+import string
+import argparse
+import timeit
+from utils.label_matcher import LabelMatcher
+
+CATEGORIES = ['recyclable', 'organic', 'hazardous', 'non-recyclable']
+
+def loop_score(labels, keyword_categories):
+    # Former utils/waste_classifier.py mapping
+    scores = {category: 0.0 for category in CATEGORIES}
+    for description, score in labels:
+        label_name = description.lower()
+        if label_name in keyword_categories:
+            scores[keyword_categories[label_name]] += score
+        else:
+            for keyword, category in keyword_categories.items():
+                if keyword in label_name:
+                    scores[category] += score * 0.7
+    return scores
+
+def loop_score_bidirectional(labels, category_items):
+    # Former utils/vision_api.py mapping
+    scores = {category: 0.0 for category in category_items}
+    for description, score in labels:
+        label_name = description.lower()
+        for category, items in category_items.items():
+            for item in items:
+                if item in label_name or label_name in item:
+                    scores[category] += score
+    return scores
+
+def random_word(rng):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 12)))
+
+def build_tables(keyword_count, rng):
+    from utils.waste_classifier import WASTE_CATEGORIES
+
+    keyword_categories = dict(WASTE_CATEGORIES)
+    while len(keyword_categories) < keyword_count:
+        words = ' '.join(random_word(rng) for _ in range(rng.randint(1, 2)))
+        keyword_categories.setdefault(words, rng.choice(CATEGORIES))
+
+    category_items = {category: [] for category in CATEGORIES}
+    for keyword, category in keyword_categories.items():
+        category_items[category].append(keyword)
+    return keyword_categories, category_items
+
+def build_labels(keyword_categories, rng, count=10):
+    keywords = list(keyword_categories)
+    labels = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.3:
+            description = rng.choice(keywords).title()
+        elif kind < 0.6:
+            description = f"{random_word(rng)} {rng.choice(keywords)}"
+        else:
+            description = random_word(rng)
+        labels.append((description, round(rng.random(), 3)))
+    return labels
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--keywords', type=int, default=1000, help='Keyword table size')
+    parser.add_argument('--responses', type=int, default=200, help='Vision responses to score')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    keyword_categories, category_items = build_tables(args.keywords, rng)
+    responses = [build_labels(keyword_categories, rng) for _ in range(args.responses)]
+
+    start = timeit.default_timer()
+    matcher = LabelMatcher(keyword_categories.items(), CATEGORIES)
+    bidirectional = LabelMatcher(
+        [(item, category) for category, items in category_items.items() for item in items], CATEGORIES
+    )
+    bidirectional.keywords_containing('warm-up')
+    compile_ms = (timeit.default_timer() - start) * 1000
+
+    for labels in responses:
+        assert matcher.score(labels) == loop_score(labels, keyword_categories)
+        assert bidirectional.score_bidirectional(labels) == loop_score_bidirectional(labels, category_items)
+
+    cases = [
+        ('exact/partial loops', lambda: [loop_score(labels, keyword_categories) for labels in responses]),
+        ('exact/partial matcher', lambda: [matcher.score(labels) for labels in responses]),
+        ('bidirectional loops', lambda: [loop_score_bidirectional(labels, category_items) for labels in responses]),
+        ('bidirectional matcher', lambda: [bidirectional.score_bidirectional(labels) for labels in responses]),
+    ]
+
+    print(f"{len(keyword_categories)} keywords, {len(responses)} responses of 10 labels, "
+          f"compiled in {compile_ms:.1f} ms, results identical")
+    for name, case in cases:
+        seconds = min(timeit.repeat(case, number=1, repeat=3))
+        print(f"  {name:<24} {seconds / len(responses) * 1e6:10.1f} us per response")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Benchmark near-duplicate lookups on uniform and skewed dHash distributions,
+against the dict-of-buckets index the NumPy HammingIndex replaced, and time
+how long the first lookup of a fresh NearDuplicateIndex waits for its table.
+
+Real photo hashes are skewed: plain backgrounds and recurring scenes make
+many hashes share chunks, so some multi-index buckets hold a large share of
+all hashes. The skewed set draws most hashes from a few hundred Zipf
+weighted clusters to reproduce that. The former index is built under
+tracemalloc to measure its memory, which slows its build down.
+
+Run from the repository root:
+
+    python -m benchmarks.near_duplicates --size 1000000 --warm-rows 1000000
+"""
+import os
+import logging
+import argparse
+import tempfile
+import tracemalloc
+from array import array
+from itertools import combinations
+from time import perf_counter, sleep
+from datetime import datetime
+import numpy as np
+
+class LegacyHammingIndex:
+    # The former utils/image_hashing.py index: one array of positions per
+    # chunk value and candidates verified one by one in Python
+
+    def __init__(self):
+        self._hashes = array('Q')
+        self._values = []
+        self._tables = [{} for _ in range(4)]
+
+    def add(self, value_hash, value):
+        position = len(self._hashes)
+        self._hashes.append(value_hash)
+        self._values.append(value)
+        for index, table in enumerate(self._tables):
+            chunk = (value_hash >> (index * 16)) & 0xFFFF
+            bucket = table.get(chunk)
+            if bucket is None:
+                bucket = table[chunk] = array('I')
+            bucket.append(position)
+
+    def search(self, query_hash, max_distance):
+        radius = max_distance // 4
+        hashes = self._hashes
+        seen = set()
+        best = None
+        for index, table in enumerate(self._tables):
+            chunk = (query_hash >> (index * 16)) & 0xFFFF
+            variants = [chunk]
+            for distance in range(1, radius + 1):
+                for bits in combinations(range(16), distance):
+                    variants.append(chunk ^ sum(1 << bit for bit in bits))
+            for variant in variants:
+                for position in table.get(variant, ()):
+                    if position in seen:
+                        continue
+                    seen.add(position)
+                    distance = (hashes[position] ^ query_hash).bit_count()
+                    if distance <= max_distance and (best is None or distance < best[0]):
+                        best = (distance, position)
+        return None if best is None else (best[0], self._values[best[1]])
+
+def uniform_hashes(count, rng):
+    return rng.integers(0, np.iinfo(np.int64).max, count, dtype=np.int64).view(np.uint64) * np.uint64(2) \
+        + rng.integers(0, 2, count, dtype=np.int64).view(np.uint64)
+
+def skewed_hashes(count, rng, clusters=300, share=0.8):
+    centers = uniform_hashes(clusters, rng)
+    weights = 1.0 / np.arange(1, clusters + 1) ** 1.1
+    hashes = centers[rng.choice(clusters, count, p=weights / weights.sum())]
+    # A few flipped bits per hash, like re-encoded or reframed photos
+    for _ in range(10):
+        bits = np.left_shift(np.uint64(1), rng.integers(0, 64, count).astype(np.uint64))
+        hashes ^= np.where(rng.random(count) < 0.4, bits, np.uint64(0))
+    unclustered = rng.random(count) >= share
+    hashes[unclustered] = uniform_hashes(int(unclustered.sum()), rng)
+    return hashes
+
+def make_queries(hashes, count, rng):
+    # Half near-duplicates of stored hashes, half unrelated photos
+    near = hashes[rng.integers(0, len(hashes), count // 2)].copy()
+    for _ in range(3):
+        near ^= np.left_shift(np.uint64(1), rng.integers(0, 64, len(near)).astype(np.uint64))
+    return [int(value) for value in np.concatenate([near, uniform_hashes(count - len(near), rng)])]
+
+def time_queries(index, queries, max_distance):
+    timings = []
+    results = []
+    for query in queries:
+        start = perf_counter()
+        results.append(index.search(query, max_distance))
+        timings.append(perf_counter() - start)
+    timings = np.array(timings) * 1000
+    return results, np.percentile(timings, 50), np.percentile(timings, 99), timings.max()
+
+def run_distribution(name, hashes, args, rng):
+    from utils.image_hashing import HammingIndex
+
+    queries = make_queries(hashes, args.queries, rng)
+    values = np.arange(len(hashes), dtype=np.int64)
+
+    start = perf_counter()
+    index = HammingIndex(hashes, values)
+    build = perf_counter() - start
+    memory = sum(part.nbytes for part in [index._hashes, index._values] + index._orders + index._offsets)
+    results, p50, p99, worst = time_queries(index, queries, args.max_distance)
+    rows = [('numpy', build, memory, p50, p99, worst)]
+
+    if not args.skip_legacy:
+        tracemalloc.start()
+        start = perf_counter()
+        legacy = LegacyHammingIndex()
+        for value_hash, value in zip(hashes.tolist(), range(len(hashes))):
+            legacy.add(value_hash, value)
+        legacy_build = perf_counter() - start
+        legacy_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        legacy_results, legacy_p50, legacy_p99, legacy_worst = time_queries(legacy, queries, args.max_distance)
+        rows.insert(0, ('legacy', legacy_build, legacy_memory, legacy_p50, legacy_p99, legacy_worst))
+
+        # Ties may pick different hashes, the distances must agree
+        distances = [None if result is None else result[0] for result in results]
+        assert distances == [None if result is None else result[0] for result in legacy_results]
+
+    matches = sum(result is not None for result in results)
+    print(f"{name}: {len(hashes)} hashes, {len(queries)} queries, {matches} matched")
+    for label, build, memory, p50, p99, worst in rows:
+        print(f"  {label:<7} build {build:6.2f} s  {memory / 2 ** 20:7.1f} MiB  "
+              f"lookup p50 {p50:7.3f} ms  p99 {p99:7.3f} ms  max {worst:7.2f} ms")
+
+def run_warm(rows, rng):
+    from app import app, db
+    from models import ImageFingerprint
+    from utils.image_hashing import NearDuplicateIndex
+
+    hashes = skewed_hashes(rows, rng).view(np.int64)
+    now = datetime.utcnow()
+    with app.app_context():
+        table = ImageFingerprint.__table__
+        with db.engine.begin() as conn:
+            for offset in range(0, rows, 50000):
+                conn.execute(db.insert(table), [
+                    {'namespace': 'benchmark', 'dhash': int(value_hash), 'result': '["recyclable", 0.9]',
+                     'created_at': now}
+                    for value_hash in hashes[offset:offset + 50000].tolist()
+                ])
+
+        index = NearDuplicateIndex()
+        probe = int(hashes[rows // 2].view(np.uint64))
+        start = perf_counter()
+        first = index.lookup('benchmark', probe)
+        first_ms = (perf_counter() - start) * 1000
+        while index.stats()['loading']:
+            sleep(0.01)
+        warm = perf_counter() - start
+        after = index.lookup('benchmark', probe)
+
+    print(f"warm-up: {rows} stored fingerprints, first lookup answered in {first_ms:.1f} ms "
+          f"({'hit' if first else 'miss'}), index loaded in the background in {warm:.2f} s, "
+          f"then {'hit' if after else 'miss'}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=200000, help='Hashes per distribution')
+    parser.add_argument('--queries', type=int, default=400, help='Lookups per distribution')
+    parser.add_argument('--max-distance', type=int, default=6, help='Largest accepted Hamming distance')
+    parser.add_argument('--warm-rows', type=int, default=200000, help='Fingerprint rows for the warm-up timing, 0 to skip')
+    parser.add_argument('--skip-legacy', action='store_true', help='Do not build the former index (slow at 1M)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    database = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    database.close()
+    os.environ['DATABASE_URL'] = f"sqlite:///{database.name}"
+    logging.disable(logging.CRITICAL)
+
+    rng = np.random.default_rng(args.seed)
+    try:
+        run_distribution('uniform', uniform_hashes(args.size, rng), args, rng)
+        run_distribution('skewed', skewed_hashes(args.size, rng), args, rng)
+        if args.warm_rows:
+            run_warm(args.warm_rows, rng)
+    finally:
+        os.unlink(database.name)
+
+if __name__ == '__main__':
+    main()
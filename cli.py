@@ -0,0 +1,109 @@
+import json
+import logging
+import click
+from app import app
+
+# app.py imports this module at the end of its own import, which may have
+# been triggered by importing models or a utils module first; those are
+# imported inside the commands so they are never found half-initialized
+
+logger = logging.getLogger(__name__)
+
+@app.cli.command('train-waste-model')
+@click.argument('data_dir', type=click.Path(exists=True, file_okay=False))
+@click.option('--output', default=None, help='Model directory (default: OFFLINE_MODEL_PATH)')
+@click.option('--epochs', default=500, show_default=True, help='Gradient descent iterations')
+@click.option('--l2', default=1e-3, show_default=True, help='L2 regularization strength')
+def train_waste_model(data_dir, output, epochs, l2):
+    """Train the offline waste classifier from DATA_DIR/<category>/ image folders."""
+    from utils.offline_model import CATEGORIES, load_training_images, train_model, export_model
+
+    output = output or app.config['OFFLINE_MODEL_PATH']
+
+    features, labels = load_training_images(data_dir)
+    if len(labels) == 0:
+        raise click.ClickException(f"No training images found, expected sub-folders named {', '.join(CATEGORIES)}")
+
+    weights, accuracy = train_model(features, labels, epochs=epochs, l2=l2)
+    export_model(weights, output, metadata={
+        'training_images': int(len(labels)),
+        'training_accuracy': round(accuracy, 4)
+    })
+
+    click.echo(f"Trained on {len(labels)} images, training accuracy {accuracy:.1%}, model written to {output}")
+
+@app.cli.command('rescore-waste-entries')
+@click.option('--chunk-size', type=int, default=None, help='Entries per chunk and transaction [default: 1000]')
+@click.option('--dry-run', is_flag=True, help='Report changes without writing them')
+def rescore_entries(chunk_size, dry_run):
+    """Re-map past entries' stored Vision labels with the current WASTE_CATEGORIES."""
+    from utils.annotations import LabelScorer, rescore_waste_entries, DEFAULT_CHUNK_SIZE
+    from utils.waste_classifier import LABEL_MATCHER, PARTIAL_MATCH_WEIGHT, OBJECT_FALLBACK_THRESHOLD
+
+    scorer = LabelScorer(LABEL_MATCHER, partial_weight=PARTIAL_MATCH_WEIGHT,
+                         object_threshold=OBJECT_FALLBACK_THRESHOLD)
+
+    def report(totals):
+        click.echo(f"{totals['scanned']} entries scanned, {totals['changed']} changed")
+
+    totals = rescore_waste_entries(scorer, chunk_size=chunk_size or DEFAULT_CHUNK_SIZE, dry_run=dry_run,
+                                   progress=report)
+
+    for move, count in sorted(totals['moves'].items()):
+        click.echo(f"  {move}: {count}")
+    click.echo(f"{'Would change' if dry_run else 'Changed'} {totals['changed']} of {totals['scanned']} annotated entries")
+
+@app.cli.command('sweep-uploads')
+def sweep_uploads():
+    """Delete expired resumable uploads (also swept as new uploads arrive)."""
+    from utils.resumable_uploads import get_upload_store
+
+    deleted = get_upload_store().sweep()
+    click.echo(f"Deleted {deleted} expired uploads")
+
+@app.cli.command('emission-factors')
+def emission_factors():
+    """List emission factor versions and how far entries were recomputed."""
+    from models import EmissionFactorVersion
+
+    versions = EmissionFactorVersion.query.order_by(EmissionFactorVersion.version).all()
+    if not versions:
+        click.echo("No emission factor versions yet, the built-in factors are stored as version 1 on first use")
+    for version in versions:
+        status = 'recomputed' if version.recompute_finished_at else f"recompute at entry {version.recompute_last_id or 0}"
+        click.echo(f"v{version.version}  {version.created_at:%Y-%m-%d %H:%M}  {status}, "
+                   f"{version.recomputed_entries or 0} entries, {version.carbon_delta or 0:+.2f} kg CO2e"
+                   f"{'  ' + version.note if version.note else ''}")
+
+@app.cli.command('publish-emission-factors')
+@click.argument('factors_file', type=click.File())
+@click.option('--note', default=None, help='Why the factors changed, e.g. their source')
+def publish_factors(factors_file, note):
+    """Store FACTORS_FILE (JSON shaped like CARBON_SAVINGS) as the new current factor version."""
+    from utils.emission_factors import publish_emission_factors
+
+    try:
+        version = publish_emission_factors(json.load(factors_file), note=note)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Published emission factor version {version}, run `flask recompute-carbon` to update past entries")
+
+@app.cli.command('recompute-carbon')
+@click.option('--chunk-size', type=int, default=None, help='Entries per chunk and transaction [default: 1000]')
+@click.option('--pause', type=float, default=None, help='Seconds to wait between chunks [default: 0.05]')
+@click.option('--restart', is_flag=True, help='Start over instead of resuming an interrupted run')
+def recompute_carbon(chunk_size, pause, restart):
+    """Recompute carbon_saved of entries computed with older emission factors."""
+    from utils.emission_factors import recompute_carbon_saved, DEFAULT_CHUNK_SIZE, DEFAULT_PAUSE
+
+    def report(totals):
+        click.echo(f"{totals['updated']} entries moved to v{totals['version']}")
+
+    totals = recompute_carbon_saved(chunk_size=chunk_size or DEFAULT_CHUNK_SIZE,
+                                    pause=DEFAULT_PAUSE if pause is None else pause,
+                                    restart=restart, progress=report)
+
+    if totals['superseded_by']:
+        click.echo(f"Stopped: version {totals['superseded_by']} was published meanwhile, run again to recompute for it")
+    click.echo(f"Updated {totals['updated']} entries to v{totals['version']} "
+               f"(resumed after entry {totals['resumed_after']}), total carbon saved {totals['carbon_delta']:+.2f} kg CO2e")
@@ -26,12 +26,13 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
     
-    def add_points(self, points):
+    def add_points(self, points, commit=True):
         self.points += points
         # Check for level up (every 100 points)
         if self.points >= self.level * 100:
             self.level += 1
-        db.session.commit()
+        if commit:
+            db.session.commit()
 
 class WasteEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -46,6 +47,12 @@ class WasteEntry(db.Model):
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
     location_name = db.Column(db.String(128))
+    
+    # SHA-256 of the classified image, links the entry to its ImageAnnotation
+    image_hash = db.Column(db.String(64), index=True)
+    
+    # EmissionFactorVersion carbon_saved was computed with (NULL: before versioning)
+    factor_version = db.Column(db.Integer, index=True)
 
 class EcoActivity(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -57,6 +64,10 @@ class EcoActivity(db.Model):
     
     # Additional details in JSON format
     details = db.Column(db.Text)  # JSON string
+    
+    # Entry a waste_classification activity logged, so recomputed carbon
+    # reaches the activity too (NULL: other activities and older rows)
+    waste_entry_id = db.Column(db.Integer, db.ForeignKey('waste_entry.id'), index=True)
 
 class RecyclingCenter(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -72,3 +83,65 @@ class RecyclingCenter(db.Model):
     
     # Operating hours (JSON string)
     hours = db.Column(db.Text)
+    
+    # Geohash of the location, kept up to date by utils/center_index.py
+    geohash = db.Column(db.String(12), index=True)
+    
+    # Google Places place_id of centers found through Places
+    place_id = db.Column(db.String(256), unique=True, index=True)
+
+class ClassificationResult(db.Model):
+    # Content-addressed cache of image classifications ("<classifier>:<sha256>")
+    cache_key = db.Column(db.String(96), primary_key=True)
+    result = db.Column(db.Text, nullable=False)  # JSON string
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class PlacesCacheEntry(db.Model):
+    # Places nearby-search results per "<type>|<keyword>|<radius>|<geohash cell>"
+    cache_key = db.Column(db.String(160), primary_key=True)
+    results = db.Column(db.Text, nullable=False)  # JSON string, Places `results`
+    fetched_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_used_at = db.Column(db.DateTime, index=True)
+
+class PlaceDetailsEntry(db.Model):
+    # Place Details (phone, website, hours) per Places place_id
+    place_id = db.Column(db.String(256), primary_key=True)
+    details = db.Column(db.Text, nullable=False)  # JSON string
+    fetched_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class ImageFingerprint(db.Model):
+    # Perceptual hashes of classified uploads for near-duplicate reuse
+    id = db.Column(db.Integer, primary_key=True)
+    namespace = db.Column(db.String(32), nullable=False, index=True)
+    dhash = db.Column(db.BigInteger, nullable=False)  # 64-bit dHash, stored signed
+    result = db.Column(db.Text, nullable=False)  # JSON string
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ClassificationJob(db.Model):
+    # Uploads queued by /api/classify?async=1 and processed in the background
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued, running, done, failed
+    result = db.Column(db.Text)  # JSON string
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    finished_at = db.Column(db.DateTime)
+
+class ImageAnnotation(db.Model):
+    # Raw Vision output per image, replayed by `flask rescore-waste-entries`
+    content_hash = db.Column(db.String(64), primary_key=True)  # sha256 of the image
+    annotations = db.Column(db.Text, nullable=False)  # compact JSON, see utils/annotations.py
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class EmissionFactorVersion(db.Model):
+    # Versioned carbon emission factor tables, the highest version is current
+    version = db.Column(db.Integer, primary_key=True)
+    factors = db.Column(db.Text, nullable=False)  # JSON, shaped like CARBON_SAVINGS
+    note = db.Column(db.String(256))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Progress of `flask recompute-carbon` towards this version
+    recompute_last_id = db.Column(db.Integer, default=0)  # last WasteEntry.id processed
+    recomputed_entries = db.Column(db.Integer, default=0)
+    carbon_delta = db.Column(db.Float, default=0.0)  # change of the total carbon_saved
+    recompute_finished_at = db.Column(db.DateTime)
@@ -1,18 +1,36 @@
 import os
 import json
+import time
+import zipfile
 import logging
 from datetime import datetime
-from flask import render_template, request, redirect, url_for, flash, jsonify, session
+from flask import render_template, request, redirect, url_for, flash, jsonify, session, Response, stream_with_context, send_file
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge, ClientDisconnected
+from werkzeug.http import http_date
+from werkzeug.formparser import parse_form_data
 from app import app, db
 from models import User, WasteEntry, EcoActivity, RecyclingCenter
-from utils.waste_classifier import classify_waste_image
+from utils.waste_classifier import classify_upload
 from utils.maps_helper import find_nearby_centers
-from utils.carbon_calculator import calculate_carbon_savings
+from utils.uploads import read_image_upload, spool_stream, UploadTooLargeError
+from utils.image_store import get_image_store, save_upload, sniff_mimetype, CONTENT_HASH_PATTERN
+from utils.resumable_uploads import get_upload_store, UploadOffsetError, UploadBusyError
+from utils.resilience import upstream_health
+from utils.admission import admission_controlled, bulk_upload_cost
+from utils.http_clients import get_connection_stats
+from utils.places_cache import get_places_cache, get_place_details_cache
+from utils.bulk_classification import BulkClassification, iter_upload_images, iter_zip_images, ZIP_MIMETYPES
+from utils.classification_jobs import (
+    get_classification_queue, get_job, record_classification, JobQueueFullError, FINISHED_STATUSES
+)
 
 logger = logging.getLogger(__name__)
 
+# Stored images never change, so browsers may keep them for a year
+IMAGE_MAX_AGE = 365 * 24 * 3600
+
 # Home route
 @app.route('/')
 def index():
@@ -96,76 +114,347 @@ def logout():
 def classify_page():
     return render_template('classify.html', google_maps_api_key=app.config["GOOGLE_MAPS_API_KEY"])
 
+def _classification_details(fields):
+    return {
+        # Get location data if provided
+        'latitude': fields.get('latitude', type=float),
+        'longitude': fields.get('longitude', type=float),
+        'location_name': fields.get('location_name', ''),
+        # Get estimated weight if provided
+        'weight': fields.get('weight', type=float, default=0.5)
+    }
+
 @app.route('/api/classify', methods=['POST'])
 @login_required
+@admission_controlled
 def classify_waste():
-    if 'image' not in request.files:
+    # Multipart form or raw image body, spooled rather than read into memory;
+    # bodies announced or streamed beyond MAX_UPLOAD_BYTES are refused
+    try:
+        image_file = read_image_upload(request)
+    except UploadTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    if image_file is None:
         return jsonify({'error': 'No image provided'}), 400
     
-    file = request.files['image']
-    if file.filename == '':
-        return jsonify({'error': 'No image selected'}), 400
+    # The other fields come from the form, or the query string with a raw body
+    fields = request.form if request.mimetype == 'multipart/form-data' else request.args
+    details = _classification_details(fields)
+    
+    # Async mode: queue the upload and free this worker right away
+    if request.values.get('async') in ('1', 'true'):
+        if request.mimetype == 'multipart/form-data':
+            # Flask closes the form's files when this request ends, so the
+            # job gets its own spooled copy (in memory up to UPLOAD_SPOOL_BYTES)
+            image_file.seek(0)
+            image_file = spool_stream(image_file, app.config["MAX_UPLOAD_BYTES"], app.config["UPLOAD_SPOOL_BYTES"])
+        try:
+            # The queue closes the file once the job has finished with it
+            job_id = get_classification_queue().submit(current_user.id, image_file, details)
+        except JobQueueFullError as e:
+            logger.warning(f"Rejected async classification: {e}")
+            return jsonify({'error': 'Too many pending classifications, please retry shortly'}), 503, {'Retry-After': '5'}
+        
+        # Clients poll status_url (it answers with Retry-After), events_url
+        # streams the same updates in short reconnecting stretches
+        status_url = url_for('classification_job_status', job_id=job_id)
+        return jsonify({
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': status_url,
+            'events_url': url_for('classification_job_events', job_id=job_id)
+        }), 202, {'Location': status_url}
     
     try:
         # Process image for classification
-        waste_type, confidence = classify_waste_image(file)
+        classification = classify_upload(image_file)
+        stored_url = save_upload(image_file, classification.content_hash)
         
-        # Get location data if provided
-        latitude = request.form.get('latitude', type=float)
-        longitude = request.form.get('longitude', type=float)
-        location_name = request.form.get('location_name', '')
-        
-        # Get estimated weight if provided
-        weight = request.form.get('weight', type=float, default=0.5)
-        
-        # Calculate carbon savings
-        carbon_saved = calculate_carbon_savings(waste_type, weight)
-        
-        # Save the waste entry
-        waste_entry = WasteEntry(
-            user_id=current_user.id,
-            waste_type=waste_type,
-            weight=weight,
-            carbon_saved=carbon_saved,
-            latitude=latitude,
-            longitude=longitude,
-            location_name=location_name
-        )
-        
-        db.session.add(waste_entry)
-        
-        # Award points to the user
-        points_earned = 10 if waste_type == 'recyclable' else 5
-        current_user.add_points(points_earned)
-        
-        # Record the activity
-        activity = EcoActivity(
-            user_id=current_user.id,
-            activity_type="waste_classification",
-            points_earned=points_earned,
-            carbon_saved=carbon_saved,
-            details=json.dumps({
-                "waste_type": waste_type,
-                "weight": weight,
-                "confidence": confidence
-            })
-        )
-        db.session.add(activity)
-        
-        db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'waste_type': waste_type,
-            'confidence': confidence,
-            'carbon_saved': carbon_saved,
-            'points_earned': points_earned,
-            'message': f'Successfully classified as {waste_type} waste!'
-        })
+        return jsonify(record_classification(current_user, classification.waste_type, classification.confidence,
+                                             image_hash=classification.content_hash,
+                                             image_url=stored_url, **details))
         
     except Exception as e:
         logger.error(f"Error in classification: {e}")
         return jsonify({'error': str(e)}), 500
+    finally:
+        image_file.close()
+
+@app.route('/api/classify/bulk', methods=['POST'])
+@login_required
+@admission_controlled(cost=bulk_upload_cost)
+def classify_waste_bulk():
+    # Collection drives: many images (or ZIP archives of them) in one request,
+    # answered with one NDJSON line per image as it is classified
+    max_bytes = app.config["BULK_MAX_UPLOAD_BYTES"]
+    max_image_bytes = app.config["MAX_UPLOAD_BYTES"]
+    if request.content_length is not None and request.content_length > max_bytes:
+        return jsonify({'error': f'Upload exceeds {max_bytes} bytes'}), 413
+    
+    try:
+        if request.mimetype == 'multipart/form-data':
+            # Parsed outside request.files: Flask closes those when the view
+            # returns, before the response has been streamed
+            _, form, files = parse_form_data(request.environ, max_content_length=max_bytes)
+            uploads = [f for f in files.getlist('images') if f.filename]
+            if not uploads:
+                return jsonify({'error': 'No images provided'}), 400
+            images = iter_upload_images(uploads, max_image_bytes)
+            details = _classification_details(form)
+        elif request.mimetype in ZIP_MIMETYPES:
+            archive = spool_stream(request.stream, max_bytes, app.config["UPLOAD_SPOOL_BYTES"])
+            if not zipfile.is_zipfile(archive):
+                archive.close()
+                return jsonify({'error': 'Not a valid ZIP archive'}), 400
+            uploads = [archive]
+            images = iter_zip_images(archive, max_image_bytes)
+            details = _classification_details(request.args)
+        else:
+            return jsonify({'error': 'Send multipart/form-data images or a ZIP archive'}), 415
+    except (UploadTooLargeError, RequestEntityTooLarge):
+        return jsonify({'error': f'Upload exceeds {max_bytes} bytes'}), 413
+    
+    bulk = BulkClassification(current_user.id, details)
+    
+    def generate():
+        try:
+            for result in bulk.run(images):
+                yield json.dumps(result) + '\n'
+        finally:
+            for upload in uploads:
+                upload.close()
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no'})
+
+# Resumable Upload Routes
+def _owned_upload(upload_id):
+    upload = get_upload_store().get(upload_id)
+    if upload is None or upload['user_id'] != current_user.id:
+        return None
+    return upload
+
+def _upload_headers(upload):
+    return {
+        'Upload-Offset': str(upload['offset']),
+        'Upload-Length': str(upload['length']),
+        'Upload-Expires': http_date(upload['expires_at']),
+        'Cache-Control': 'no-store'
+    }
+
+@app.route('/api/uploads', methods=['POST'])
+@login_required
+def create_upload():
+    # Resumable uploads for flaky connections: create, PATCH chunks at the
+    # reported offset (HEAD tells where to resume), then finalize
+    length = request.headers.get('Upload-Length', type=int)
+    if length is None:
+        length = request.values.get('length', type=int)
+    if length is None or length <= 0:
+        return jsonify({'error': 'Upload-Length header required'}), 400
+    
+    try:
+        upload = get_upload_store().create(current_user.id, length, _classification_details(request.values))
+    except UploadTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    
+    upload_url = url_for('upload_status', upload_id=upload['id'])
+    headers = _upload_headers(upload)
+    headers['Location'] = upload_url
+    return jsonify({
+        'upload_id': upload['id'],
+        'upload_url': upload_url,
+        'finalize_url': url_for('finalize_upload', upload_id=upload['id']),
+        'offset': 0,
+        'length': length
+    }), 201, headers
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    upload = _owned_upload(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify({
+        'upload_id': upload_id,
+        'offset': upload['offset'],
+        'length': upload['length'],
+        'finalized': upload['result'] is not None
+    }), 200, _upload_headers(upload)
+
+@app.route('/api/uploads/<upload_id>', methods=['PATCH'])
+@login_required
+def append_upload(upload_id):
+    upload = _owned_upload(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    if request.mimetype not in ('application/offset+octet-stream', 'application/octet-stream'):
+        return jsonify({'error': 'Send chunks as application/offset+octet-stream'}), 415
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Upload-Offset header required'}), 400
+    
+    store = get_upload_store()
+    try:
+        upload['offset'] = store.append(upload, offset, request.stream, request.content_length)
+    except UploadOffsetError as e:
+        upload['offset'] = e.offset
+        return jsonify({'error': str(e), 'offset': e.offset}), 409, _upload_headers(upload)
+    except UploadBusyError as e:
+        return jsonify({'error': str(e)}), 409
+    except UploadTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    except ClientDisconnected:
+        # Whatever arrived is kept; the client resumes from HEAD's offset
+        logger.info(f"Upload {upload_id} interrupted")
+        return '', 400
+    
+    return '', 204, _upload_headers(upload)
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def delete_upload(upload_id):
+    if _owned_upload(upload_id) is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    get_upload_store().delete(upload_id)
+    return '', 204
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+@login_required
+@admission_controlled
+def finalize_upload(upload_id):
+    upload = _owned_upload(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    store = get_upload_store()
+    try:
+        # A retried finalize gets the stored result instead of a second entry
+        if upload['result'] is None:
+            with store.finalizing(upload) as image_file:
+                classification = classify_upload(image_file)
+                stored_url = save_upload(image_file, classification.content_hash)
+                result = record_classification(current_user, classification.waste_type, classification.confidence,
+                                               image_hash=classification.content_hash,
+                                               image_url=stored_url, **upload['details'])
+                store.complete(upload, result)
+            return jsonify(result)
+    except UploadOffsetError as e:
+        upload['offset'] = e.offset
+        return jsonify({'error': 'Upload is incomplete', 'offset': e.offset}), 409, _upload_headers(upload)
+    except UploadBusyError:
+        # Finalized by a concurrent request in the meantime
+        upload = _owned_upload(upload_id)
+        if upload is None or upload['result'] is None:
+            return jsonify({'error': 'Upload is being written by another request'}), 409
+    except Exception as e:
+        logger.error(f"Error finalizing upload {upload_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify(upload['result'])
+
+def _job_response(job):
+    response = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'created_at': job['created_at'].isoformat() if job['created_at'] else None,
+        'finished_at': job['finished_at'].isoformat() if job['finished_at'] else None
+    }
+    if job['status'] == 'done':
+        response['result'] = job['result']
+    elif job['status'] == 'failed':
+        response['error'] = job['error']
+    return response
+
+def _get_user_job(job_id):
+    job = get_job(job_id)
+    if job is None or job['user_id'] != current_user.id:
+        return None
+    
+    # The process running the job may have died, fail it instead of polling forever
+    queue = get_classification_queue()
+    if queue.is_abandoned(job):
+        queue.fail_abandoned()
+        job = get_job(job_id)
+    return job
+
+@app.route('/api/jobs/<job_id>')
+@login_required
+def classification_job_status(job_id):
+    job = _get_user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if job['status'] in FINISHED_STATUSES:
+        return jsonify(_job_response(job))
+    
+    # Still working: tell pollers when to come back
+    return jsonify(_job_response(job)), 200, {'Retry-After': '1'}
+
+@app.route('/api/jobs/<job_id>/events')
+@login_required
+def classification_job_events(job_id):
+    job = _get_user_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    queue = get_classification_queue()
+    timeout = app.config["CLASSIFICATION_EVENTS_TIMEOUT"]
+    
+    def generate(job):
+        # Server-Sent Events: one event per status change, ending with the result.
+        # Each stream holds a sync worker, so it closes after a few seconds and
+        # the retry hint makes EventSource reconnect for the next stretch
+        yield "retry: 1000\n\n"
+        deadline = time.monotonic() + timeout
+        last_status = None
+        while True:
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield f"event: {last_status}\ndata: {json.dumps(_job_response(job))}\n\n"
+            if last_status in FINISHED_STATUSES:
+                return
+            if time.monotonic() >= deadline:
+                yield "event: timeout\ndata: {}\n\n"
+                return
+            if not queue.wait(job_id, timeout=1.0):
+                yield ": keep-alive\n\n"
+            job = get_job(job_id)
+    
+    return Response(stream_with_context(generate(job)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Stored Image Routes
+def _send_stored_image(content_hash, thumbnail):
+    # Users can only fetch images of their own entries
+    if not CONTENT_HASH_PATTERN.match(content_hash) or not db.session.query(
+        WasteEntry.query.filter_by(user_id=current_user.id, image_hash=content_hash).exists()
+    ).scalar():
+        return jsonify({'error': 'Image not found'}), 404
+    
+    path = get_image_store().path(content_hash, thumbnail=thumbnail)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Image not found'}), 404
+    
+    # The content behind a URL never changes: strong ETag, cached for a year,
+    # conditional and range requests answered by send_file
+    response = send_file(path, mimetype='image/jpeg' if thumbnail else sniff_mimetype(path),
+                         conditional=True, etag=content_hash + ('-thumbnail' if thumbnail else ''),
+                         max_age=IMAGE_MAX_AGE)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/images/<content_hash>')
+@login_required
+def stored_image(content_hash):
+    return _send_stored_image(content_hash, thumbnail=False)
+
+@app.route('/images/<content_hash>/thumbnail')
+@login_required
+def stored_image_thumbnail(content_hash):
+    return _send_stored_image(content_hash, thumbnail=True)
 
 # Waste Map Routes
 @app.route('/map')
@@ -305,6 +594,23 @@ def profile():
                           next_level_points=next_level_points,
                           badges=badges)
 
+# Monitoring Routes
+@app.route('/api/health/upstreams')
+@login_required
+def upstream_health_status():
+    # Circuit state, retry and hedging counters of the Google APIs, plus
+    # connection reuse of their keep-alive sessions and Places cache hits
+    upstreams = upstream_health()
+    degraded = sorted(name for name, stats in upstreams.items() if stats['circuit']['state'] != 'closed')
+    return jsonify({
+        'status': 'degraded' if degraded else 'ok',
+        'degraded': degraded,
+        'upstreams': upstreams,
+        'connections': get_connection_stats(),
+        'places_cache': get_places_cache().stats(),
+        'place_details_cache': get_place_details_cache().stats()
+    })
+
 # Error handlers
 @app.errorhandler(404)
 def not_found_error(error):
@@ -5,8 +5,11 @@ from models import User, WasteEntry, RecyclingCenter, EcoActivity
 from utils.vision_api import classify_waste_image
 from utils.maps_api import find_nearby_centers
 from utils.carbon_calculator import calculate_carbon_impact
+from utils.uploads import read_image_upload, UploadTooLargeError
+from utils.image_store import save_upload
+from utils.admission import admission_controlled
+import io
 import base64
-import uuid
 import os
 from datetime import datetime
 import json
@@ -15,14 +18,31 @@ api_bp = Blueprint('api', __name__, url_prefix='/api')
 
 @api_bp.route('/classify-waste', methods=['POST'])
 @login_required
+@admission_controlled
 def classify_waste():
+    image_file = None
     try:
-        # Get image data from request
-        data = request.json
-        image_data = data.get('image')  # Base64 encoded image
+        if request.is_json:
+            # Legacy clients send the image as a base64 data URL inside JSON
+            data = request.json
+            image_data = data.get('image')  # Base64 encoded image
+            if image_data:
+                image_file = io.BytesIO(base64.b64decode(image_data.split(',')[1]))
+        else:
+            # Multipart form or raw image body, streamed into a spooled
+            # temporary file; the other fields come from the form or query string
+            image_file = read_image_upload(request)
+            fields = request.form if request.mimetype == 'multipart/form-data' else request.args
+            data = {
+                'category_id': fields.get('category_id', type=int),
+                'quantity': fields.get('quantity', 1.0, type=float),
+                'disposed_properly': fields.get('disposed_properly', 'true').lower() not in ('0', 'false', 'no'),
+                'latitude': fields.get('latitude', type=float),
+                'longitude': fields.get('longitude', type=float)
+            }
         manual_category_id = data.get('category_id')
         
-        if not image_data and not manual_category_id:
+        if image_file is None and not manual_category_id:
             return jsonify({'error': 'No image or category provided'}), 400
         
         # If manual category is provided, use it
@@ -33,15 +53,13 @@ def classify_waste():
             category_id = category.id
             category_name = category.name
         else:
-            # Use Vision API to classify the waste
-            image_bytes = base64.b64decode(image_data.split(',')[1])
-            
             # Call the Vision API
             if current_app.config['GOOGLE_VISION_API_KEY']:
-                result = classify_waste_image(image_bytes, current_app.config['GOOGLE_VISION_API_KEY'])
+                # The classifier reads the file object in place
+                result = classify_waste_image(image_file)
                 
                 # Map Vision API result to our waste categories
-                category_name = result['category']
+                category_name = result['label']
                 category = WasteCategory.query.filter_by(name=category_name).first()
                 
                 if not category:
@@ -66,13 +84,10 @@ def classify_waste():
         
         carbon_impact = calculate_carbon_impact(category_id, quantity, disposed_properly)
         
-        # Generate a unique filename and save the image if provided
+        # Keep the image in the content-addressed store if provided
         image_url = None
-        if image_data:
-            filename = f"{uuid.uuid4().hex}.jpg"
-            # In a real app, you'd save the image to a cloud storage service
-            # For now, let's just generate a URL
-            image_url = f"/static/uploads/{filename}"
+        if image_file is not None:
+            image_url = save_upload(image_file)
         
         # Create waste record
         waste_record = WasteRecord(
@@ -111,8 +126,15 @@ def classify_waste():
             'total_carbon_saved': current_user.carbon_saved
         })
     
+    except UploadTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    
+    finally:
+        if image_file is not None:
+            image_file.close()
 
 @api_bp.route('/nearby-centers', methods=['GET'])
 @login_required
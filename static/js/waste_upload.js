@@ -99,6 +99,8 @@ function classifyWasteImage() {
     
     // Create form data for submission
     const formData = new FormData(classifyForm);
+    const imageFile = formData.get('image');
+    formData.delete('image');
     
     // Add location data if available
     const locationData = getLocationData();
@@ -108,17 +110,9 @@ function classifyWasteImage() {
         formData.append('location_name', locationData.name || '');
     }
     
-    // Submit the form
-    fetch('/api/classify', {
-        method: 'POST',
-        body: formData
-    })
-    .then(response => {
-        if (!response.ok) {
-            throw new Error('Network response was not ok');
-        }
-        return response.json();
-    })
+    // Upload in resumable chunks so a dropped connection only resends the
+    // chunk that was in flight
+    uploadResumable(imageFile, formData)
     .then(data => {
         if (loadingSpinner) {
             loadingSpinner.style.display = 'none';
@@ -144,6 +138,140 @@ function classifyWasteImage() {
     });
 }
 
+// Resumable upload settings
+const UPLOAD_CHUNK_SIZE = 256 * 1024;
+const UPLOAD_MAX_RETRIES = 5;
+
+// Upload a file through /api/uploads and return its classification
+async function uploadResumable(file, fields) {
+    if (!file || !file.size) {
+        throw new Error('No image selected');
+    }
+    
+    // Remember the upload so a reload or a new attempt resumes it
+    const storageKey = `waste-upload:${file.name}:${file.size}:${file.lastModified}`;
+    let upload = await resumeUpload(localStorage.getItem(storageKey));
+    if (!upload) {
+        upload = await createUpload(file, fields);
+        localStorage.setItem(storageKey, upload.upload_url);
+    }
+    
+    let retries = 0;
+    while (upload.offset < file.size) {
+        try {
+            const response = await fetch(upload.upload_url, {
+                method: 'PATCH',
+                headers: {
+                    'Content-Type': 'application/offset+octet-stream',
+                    'Upload-Offset': String(upload.offset)
+                },
+                body: file.slice(upload.offset, upload.offset + UPLOAD_CHUNK_SIZE)
+            });
+            
+            if (response.ok || response.status === 409) {
+                // 409: the server has a different offset, continue from there
+                const offset = parseInt(response.headers.get('Upload-Offset'), 10);
+                if (!isNaN(offset)) {
+                    if (offset > upload.offset) {
+                        retries = 0;
+                    }
+                    upload.offset = offset;
+                    continue;
+                }
+            }
+            if (response.status === 404) {
+                localStorage.removeItem(storageKey);
+            }
+            if (response.status < 500) {
+                throw new Error(await uploadErrorMessage(response));
+            }
+        } catch (error) {
+            if (!(error instanceof TypeError)) {
+                throw error;
+            }
+            // Network failure: fall through and retry
+        }
+        
+        if (++retries > UPLOAD_MAX_RETRIES) {
+            throw new Error('Upload failed, please check your connection and try again');
+        }
+        await waitBeforeRetry(retries);
+        
+        // Ask the server how much of the chunk arrived
+        const resumed = await resumeUpload(upload.upload_url);
+        if (resumed) {
+            upload.offset = resumed.offset;
+        }
+    }
+    
+    // Finalizing twice returns the same result, so it is safe to retry
+    for (let attempt = 0; ; attempt++) {
+        try {
+            const response = await fetch(upload.finalize_url, { method: 'POST' });
+            if (response.ok) {
+                localStorage.removeItem(storageKey);
+                return response.json();
+            }
+            if (response.status < 500 || attempt >= UPLOAD_MAX_RETRIES) {
+                throw new Error(await uploadErrorMessage(response));
+            }
+        } catch (error) {
+            if (!(error instanceof TypeError) || attempt >= UPLOAD_MAX_RETRIES) {
+                throw error;
+            }
+        }
+        await waitBeforeRetry(attempt + 1);
+    }
+}
+
+// Start a new upload, sending the classification fields along
+async function createUpload(file, fields) {
+    const response = await fetch('/api/uploads', {
+        method: 'POST',
+        headers: { 'Upload-Length': String(file.size) },
+        body: fields
+    });
+    if (!response.ok) {
+        throw new Error(await uploadErrorMessage(response));
+    }
+    return response.json();
+}
+
+// Look up an earlier upload's offset, or null if it cannot be resumed
+async function resumeUpload(uploadUrl) {
+    if (!uploadUrl) return null;
+    
+    try {
+        const response = await fetch(uploadUrl, { cache: 'no-store' });
+        if (!response.ok) return null;
+        
+        const data = await response.json();
+        return {
+            upload_url: uploadUrl,
+            finalize_url: `${uploadUrl}/finalize`,
+            offset: data.offset
+        };
+    } catch (error) {
+        return null;
+    }
+}
+
+// Exponential backoff with jitter between retries
+function waitBeforeRetry(attempt) {
+    const delay = Math.min(1000 * 2 ** (attempt - 1), 15000) * (0.5 + Math.random() / 2);
+    return new Promise(resolve => setTimeout(resolve, delay));
+}
+
+// Read the error message of a failed upload request
+async function uploadErrorMessage(response) {
+    try {
+        const data = await response.json();
+        return data.error || `Upload failed (${response.status})`;
+    } catch (error) {
+        return `Upload failed (${response.status})`;
+    }
+}
+
 // Display classification result
 function displayClassificationResult(data) {
     const resultContainer = document.getElementById('classification-result');
@@ -0,0 +1,11 @@
+import os
+import tempfile
+
+# app.py reads DATABASE_URL at import time; point it at a throwaway SQLite
+# file so tests importing app never touch instance/waste_management.db
+_database = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+_database.close()
+os.environ['DATABASE_URL'] = f"sqlite:///{_database.name}"
+
+def pytest_unconfigure(config):
+    os.unlink(_database.name)
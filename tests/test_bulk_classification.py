@@ -0,0 +1,57 @@
+import io
+import pytest
+from PIL import Image
+from app import app, db
+from models import User, WasteEntry, EcoActivity
+from utils.bulk_classification import BulkClassification, STORE_ERROR
+
+def make_image(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+@pytest.fixture
+def user(tmp_path):
+    app.config.update(IMAGE_STORE_PATH=str(tmp_path), BULK_DECODE_WORKERS=2, GOOGLE_VISION_API_KEY=None)
+    with app.app_context():
+        user = User(username=f'bulk-{tmp_path.name}', email=f'{tmp_path.name}@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        yield user
+        EcoActivity.query.filter_by(user_id=user.id).delete()
+        WasteEntry.query.filter_by(user_id=user.id).delete()
+        db.session.delete(user)
+        db.session.commit()
+
+def uploads(count):
+    images = [('broken.jpg', None, 'Not an image')]
+    images += [(f'{index}.png', make_image((index * 40 % 256, 120, 60)), None) for index in range(count)]
+    return images
+
+def test_results_are_streamed_after_their_rows_are_stored(user):
+    bulk = BulkClassification(user.id, {'weight': 1.0})
+    results = list(bulk.run(uploads(40)))
+
+    summary = results.pop()['summary']
+    classified = [result for result in results if 'error' not in result]
+    assert len(classified) == summary['classified'] == 40
+    assert summary['failed'] == 1
+    assert WasteEntry.query.filter_by(user_id=user.id).count() == 40
+    assert EcoActivity.query.filter_by(user_id=user.id).filter(EcoActivity.waste_entry_id.isnot(None)).count() == 40
+    assert db.session.get(User, user.id).points == summary['points_earned']
+
+def test_images_whose_rows_were_rolled_back_are_reported_failed(user, monkeypatch):
+    def fail(self, points, commit=True):
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr(User, 'add_points', fail)
+
+    bulk = BulkClassification(user.id, {})
+    results = list(bulk.run(uploads(5)))
+
+    summary = results.pop()['summary']
+    assert sorted(result['index'] for result in results) == list(range(6))
+    assert all('error' in result for result in results)
+    assert sum(result['error'] == STORE_ERROR for result in results) == 5
+    assert summary['classified'] == 0 and summary['failed'] == 6
+    assert summary['carbon_saved'] == 0 and summary['points_earned'] == 0
+    assert WasteEntry.query.filter_by(user_id=user.id).count() == 0
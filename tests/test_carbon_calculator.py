@@ -0,0 +1,31 @@
+import random
+import numpy as np
+from utils.carbon_calculator import CARBON_SAVINGS, calculate_carbon_savings, calculate_carbon_savings_batch
+
+def test_batch_matches_scalar_per_entry():
+    rng = random.Random(3)
+    waste_types = list(CARBON_SAVINGS) + ['unknown']
+    subtypes = [None, 'general', 'nonexistent'] + [
+        subtype for table in CARBON_SAVINGS.values() if isinstance(table, dict) for subtype in table
+    ]
+
+    entries = [
+        (rng.choice(waste_types), round(rng.uniform(0, 50), rng.randint(0, 3)), rng.choice(subtypes))
+        for _ in range(5000)
+    ]
+    # Weights whose products land on a rounding tie
+    entries += [('recyclable', weight, 'plastic') for weight in (0.001, 0.003, 0.005, 1.005, 2.675)]
+
+    waste_type_list, weights, specific_types = zip(*entries)
+    batch = calculate_carbon_savings_batch(waste_type_list, weights, specific_types)
+
+    expected = [calculate_carbon_savings(*entry[:2], specific_type=entry[2]) for entry in entries]
+    assert batch.tolist() == expected
+
+def test_batch_missing_weights_save_nothing():
+    batch = calculate_carbon_savings_batch(['recyclable', 'organic', 'hazardous'], [None, np.nan, 2.0])
+    assert batch.tolist() == [0.0, 0.0, calculate_carbon_savings('hazardous', 2.0)]
+
+def test_batch_without_subtypes_uses_general_factor():
+    batch = calculate_carbon_savings_batch(['recyclable', 'non-recyclable', 'unknown'], [2.0, 2.0, 2.0])
+    assert batch.tolist() == [calculate_carbon_savings('recyclable', 2.0), 0.0, 0.0]
@@ -0,0 +1,60 @@
+import pytest
+from app import app, db
+from models import User, WasteEntry, EcoActivity
+from utils.carbon_calculator import CARBON_SAVINGS
+from utils import emission_factors
+from utils.emission_factors import publish_emission_factors, recompute_carbon_saved
+
+@pytest.fixture
+def user():
+    with app.app_context():
+        user = User(username='recompute', email='recompute@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        yield user
+        EcoActivity.query.filter_by(user_id=user.id).delete()
+        WasteEntry.query.filter_by(user_id=user.id).delete()
+        db.session.delete(user)
+        db.session.commit()
+
+def add_entries(user, count):
+    ids = []
+    for _ in range(count):
+        entry = WasteEntry(user_id=user.id, waste_type='organic', weight=2.0, carbon_saved=1.0)
+        db.session.add(entry)
+        db.session.flush()
+        db.session.add(EcoActivity(user_id=user.id, activity_type='waste_classification',
+                                   carbon_saved=1.0, waste_entry_id=entry.id))
+        ids.append(entry.id)
+    db.session.commit()
+    return ids
+
+def test_entries_moved_concurrently_are_not_counted_or_overwritten(user, monkeypatch):
+    ids = add_entries(user, 6)
+    savings = dict(CARBON_SAVINGS, organic=3.0)
+    version = publish_emission_factors(savings, note='test')
+    moved = ids[:2]
+
+    # Another run moves two entries between the read and the update
+    calculate = emission_factors.calculate_carbon_savings_batch
+    def concurrent_run(*args, **kwargs):
+        with db.engine.begin() as conn:
+            conn.execute(
+                db.update(WasteEntry.__table__).where(WasteEntry.id.in_(moved))
+                .values(carbon_saved=7.0, factor_version=version)
+            )
+            conn.execute(
+                db.update(EcoActivity.__table__).where(EcoActivity.waste_entry_id.in_(moved))
+                .values(carbon_saved=7.0)
+            )
+        return calculate(*args, **kwargs)
+    monkeypatch.setattr(emission_factors, 'calculate_carbon_savings_batch', concurrent_run)
+
+    totals = recompute_carbon_saved(pause=0, restart=True)
+
+    assert totals['updated'] == 4
+    assert totals['carbon_delta'] == 4 * 5.0
+    row = db.session.get(emission_factors.EmissionFactorVersion, version)
+    assert row.recomputed_entries == 4 and row.carbon_delta == 20.0
+    activities = EcoActivity.query.filter(EcoActivity.waste_entry_id.in_(ids)).all()
+    assert {a.waste_entry_id: a.carbon_saved for a in activities} == {i: 7.0 if i in moved else 6.0 for i in ids}
@@ -0,0 +1,65 @@
+import math
+import pytest
+from utils.geo import EARTH_RADIUS_KM, bounding_box, covering_cells, encode_geohash, haversine_distance
+
+def covered_points(latitude, longitude, radius_km, steps=72):
+    # Points inside the circle, walked along bearings from the center
+    lat1, lng1 = math.radians(latitude), math.radians(longitude)
+    for fraction in (0.5, 0.99):
+        angle = radius_km * fraction / EARTH_RADIUS_KM
+        for step in range(steps):
+            bearing = 2 * math.pi * step / steps
+            lat2 = math.asin(math.sin(lat1) * math.cos(angle) + math.cos(lat1) * math.sin(angle) * math.cos(bearing))
+            lng2 = lng1 + math.atan2(math.sin(bearing) * math.sin(angle) * math.cos(lat1),
+                                     math.cos(angle) - math.sin(lat1) * math.sin(lat2))
+            yield math.degrees(lat2), (math.degrees(lng2) + 540.0) % 360.0 - 180.0
+
+def test_bounding_box_plain():
+    min_lat, max_lat, min_lng, max_lng = bounding_box(52.52, 13.405, 10)
+    assert min_lat < 52.52 < max_lat and min_lng < 13.405 < max_lng
+    assert haversine_distance(52.52, 13.405, max_lat, 13.405) == pytest.approx(10)
+
+@pytest.mark.parametrize('latitude', [89.99, -89.99])
+def test_bounding_box_containing_a_pole_spans_all_longitudes(latitude):
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, 45.0, 50)
+    assert (min_lng, max_lng) == (-180.0, 180.0)
+    assert -90.0 <= min_lat and max_lat <= 90.0
+    assert (max_lat == 90.0) if latitude > 0 else (min_lat == -90.0)
+
+def test_bounding_box_crossing_the_antimeridian():
+    min_lat, max_lat, min_lng, max_lng = bounding_box(-16.5, 179.95, 20)
+    assert min_lng < 179.95 < 180.0 < max_lng
+    assert bounding_box(-16.5, -179.95, 20)[2] < -180.0
+
+@pytest.mark.parametrize('latitude, longitude, radius_km, precision', [
+    (52.52, 13.405, 5, 5),
+    (-16.5, 179.98, 8, 5),
+    (-16.5, -179.98, 8, 5),
+    (89.95, 10.0, 15, 4),
+    (-89.95, -170.0, 15, 4),
+    (0.0, 0.0, 3, 6),
+])
+def test_covering_cells_contain_the_circle(latitude, longitude, radius_km, precision):
+    cells = covering_cells(latitude, longitude, radius_km, precision)
+    assert len(cells) == len(set(cells))
+    assert all(len(cell) == precision for cell in cells)
+    cells = set(cells)
+    assert encode_geohash(latitude, longitude, precision) in cells
+    for point in covered_points(latitude, longitude, radius_km):
+        assert encode_geohash(*point, precision) in cells
+
+def test_covering_cells_at_a_pole_cover_every_column():
+    # Precision 3 has 256 columns of 1.40625 degrees; the circle stays in
+    # the top row of cells
+    cells = covering_cells(89.9, 0.0, 20, 3)
+    assert len(cells) == 256
+    assert {encode_geohash(89.9, -180.0 + (column + 0.5) * 1.40625, 3) for column in range(256)} == set(cells)
+
+def test_covering_cells_wrap_across_the_antimeridian():
+    cells = covering_cells(0.0, 179.99, 5, 5)
+    assert encode_geohash(0.0, 179.99, 5) in cells
+    assert encode_geohash(0.0, -179.99, 5) in cells
+
+def test_covering_cells_limit():
+    assert covering_cells(52.52, 13.405, 50, 7, limit=100) is None
+    assert covering_cells(52.52, 13.405, 1, 5, limit=100)
@@ -0,0 +1,103 @@
+import random
+import string
+import pytest
+from utils.label_matcher import LabelMatcher
+
+CATEGORIES = ['recyclable', 'organic', 'hazardous', 'non-recyclable']
+
+def loop_score(labels, keyword_categories, partial_weight=0.7):
+    # Former utils/waste_classifier.py mapping
+    scores = {category: 0.0 for category in CATEGORIES}
+    for description, score in labels:
+        label_name = description.lower()
+        if label_name in keyword_categories:
+            scores[keyword_categories[label_name]] += score
+        else:
+            for keyword, category in keyword_categories.items():
+                if keyword in label_name:
+                    scores[category] += score * partial_weight
+    return scores
+
+def loop_score_bidirectional(labels, category_items):
+    # Former utils/vision_api.py mapping
+    scores = {category: 0.0 for category in category_items}
+    for description, score in labels:
+        label_name = description.lower()
+        for category, items in category_items.items():
+            for item in items:
+                if item in label_name or label_name in item:
+                    scores[category] += score
+    return scores
+
+def loop_score_any(labels, category_keywords):
+    # Former utils.py mapping
+    scores = {category: 0.0 for category in category_keywords}
+    for description, score in labels:
+        label_name = description.lower()
+        for category, keywords in category_keywords.items():
+            if any(keyword in label_name for keyword in keywords):
+                scores[category] += score
+    return scores
+
+def random_word(rng):
+    return ''.join(rng.choice(string.ascii_lowercase[:8]) for _ in range(rng.randint(1, 6)))
+
+@pytest.fixture(scope='module')
+def tables():
+    from utils.waste_classifier import WASTE_CATEGORIES
+
+    rng = random.Random(11)
+    keyword_categories = dict(WASTE_CATEGORIES)
+    # Short words over a small alphabet, so keywords often overlap and
+    # contain one another
+    while len(keyword_categories) < len(WASTE_CATEGORIES) + 300:
+        words = ' '.join(random_word(rng) for _ in range(rng.randint(1, 2)))
+        keyword_categories.setdefault(words, rng.choice(CATEGORIES))
+
+    category_items = {category: [] for category in CATEGORIES}
+    for keyword, category in keyword_categories.items():
+        category_items[category].append(keyword)
+    return keyword_categories, category_items
+
+@pytest.fixture(scope='module')
+def responses(tables):
+    rng = random.Random(12)
+    keywords = list(tables[0])
+    responses = []
+    for _ in range(300):
+        labels = []
+        for _ in range(rng.randint(0, 10)):
+            kind = rng.random()
+            if kind < 0.3:
+                description = rng.choice(keywords).title()
+            elif kind < 0.6:
+                description = f"{random_word(rng)} {rng.choice(keywords)}"
+            elif kind < 0.7:
+                description = rng.choice(keywords)[1:]
+            else:
+                description = random_word(rng)
+            labels.append((description, round(rng.random(), 3)))
+        responses.append(labels)
+    return responses
+
+def test_score_matches_loops(tables, responses):
+    keyword_categories, _ = tables
+    matcher = LabelMatcher(keyword_categories.items(), CATEGORIES)
+    for labels in responses:
+        assert matcher.score(labels) == pytest.approx(loop_score(labels, keyword_categories))
+
+def test_score_bidirectional_matches_loops(tables, responses):
+    _, category_items = tables
+    matcher = LabelMatcher(
+        [(item, category) for category, items in category_items.items() for item in items], CATEGORIES
+    )
+    for labels in responses:
+        assert matcher.score_bidirectional(labels) == pytest.approx(loop_score_bidirectional(labels, category_items))
+
+def test_score_any_matches_loops(tables, responses):
+    _, category_items = tables
+    matcher = LabelMatcher(
+        [(item, category) for category, items in category_items.items() for item in items], category_items
+    )
+    for labels in responses:
+        assert matcher.score_any(labels) == pytest.approx(loop_score_any(labels, category_items))
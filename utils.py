@@ -4,7 +4,32 @@ import logging
 import requests
 import os
 from io import BytesIO
-from math import radians, sin, cos, sqrt, asin
+import numpy as np
+from utils.resilience import get_upstream
+from utils.geo import haversine_distances
+from utils.label_matcher import LabelMatcher
+
+# Map labels to waste categories
+WASTE_KEYWORDS = {
+    "plastic": ["plastic", "bottle", "container", "packaging", "polymer"],
+    "paper": ["paper", "cardboard", "carton", "newspaper", "magazine", "book"],
+    "glass": ["glass", "bottle", "jar", "window"],
+    "metal": ["metal", "aluminum", "steel", "tin", "can", "foil"],
+    "organic": ["food", "fruit", "vegetable", "meat", "leaf", "plant", "wood", "garden"],
+    "electronic": ["electronic", "device", "computer", "phone", "battery", "cable"],
+    "textile": ["clothing", "fabric", "textile", "shirt", "pants", "cloth"],
+    "hazardous": ["chemical", "paint", "oil", "battery", "medicine", "pharmaceutical"]
+}
+
+# Keyword automaton over WASTE_KEYWORDS, compiled once at import time
+LABEL_MATCHER = LabelMatcher(
+    ((keyword, waste_type) for waste_type, keywords in WASTE_KEYWORDS.items() for keyword in keywords),
+    WASTE_KEYWORDS
+)
+
+# Google endpoints, overridable to point at a stand-in server
+VISION_API_URL = os.environ.get("GOOGLE_VISION_API_ENDPOINT", "https://vision.googleapis.com/v1/images:annotate")
+MAPS_API_BASE_URL = os.environ.get("GOOGLE_MAPS_API_BASE_URL", "https://maps.googleapis.com/maps/api")
 
 def classify_waste_image(image_data, api_key):
     """
@@ -27,7 +52,7 @@ def classify_waste_image(image_data, api_key):
         encoded_image = base64.b64encode(image_data).decode('utf-8')
         
         # Prepare request to Vision API
-        vision_api_url = f"https://vision.googleapis.com/v1/images:annotate?key={api_key}"
+        vision_api_url = f"{VISION_API_URL}?key={api_key}"
         
         request_data = {
             "requests": [
@@ -45,8 +70,9 @@ def classify_waste_image(image_data, api_key):
             ]
         }
         
-        # Send request to Vision API
-        response = requests.post(vision_api_url, json=request_data)
+        # Send request to Vision API, with the shared timeouts, retries and
+        # circuit breaker of get_upstream() (needs an app context)
+        response = get_upstream('vision').post(vision_api_url, json=request_data)
         response.raise_for_status()
         
         result = response.json()
@@ -54,28 +80,10 @@ def classify_waste_image(image_data, api_key):
         # Process API response
         labels = result["responses"][0]["labelAnnotations"]
         
-        # Map labels to waste categories
-        waste_keywords = {
-            "plastic": ["plastic", "bottle", "container", "packaging", "polymer"],
-            "paper": ["paper", "cardboard", "carton", "newspaper", "magazine", "book"],
-            "glass": ["glass", "bottle", "jar", "window"],
-            "metal": ["metal", "aluminum", "steel", "tin", "can", "foil"],
-            "organic": ["food", "fruit", "vegetable", "meat", "leaf", "plant", "wood", "garden"],
-            "electronic": ["electronic", "device", "computer", "phone", "battery", "cable"],
-            "textile": ["clothing", "fabric", "textile", "shirt", "pants", "cloth"],
-            "hazardous": ["chemical", "paint", "oil", "battery", "medicine", "pharmaceutical"]
-        }
-        
-        # Check each label against waste categories
-        waste_type_scores = {waste_type: 0 for waste_type in waste_keywords}
-        
-        for label in labels:
-            label_name = label["description"].lower()
-            score = label["score"]
-            
-            for waste_type, keywords in waste_keywords.items():
-                if any(keyword in label_name for keyword in keywords):
-                    waste_type_scores[waste_type] += score
+        # Check each label against waste categories in one automaton pass
+        waste_type_scores = LABEL_MATCHER.score_any(
+            [(label["description"], label["score"]) for label in labels]
+        )
         
         # Find the waste type with the highest score
         best_match = max(waste_type_scores.items(), key=lambda x: x[1])
@@ -130,7 +138,7 @@ def get_nearby_recycling_centers(latitude, longitude, radius_km, api_key):
         radius_meters = radius_km * 1000
         
         # Prepare request to Places API
-        places_api_url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+        places_api_url = f"{MAPS_API_BASE_URL}/place/nearbysearch/json"
         params = {
             "location": f"{latitude},{longitude}",
             "radius": radius_meters,
@@ -138,8 +146,8 @@ def get_nearby_recycling_centers(latitude, longitude, radius_km, api_key):
             "key": api_key
         }
         
-        # Send request to Places API
-        response = requests.get(places_api_url, params=params)
+        # Send request to Places API, through the shared Places upstream
+        response = get_upstream('places').get(places_api_url, params=params)
         response.raise_for_status()
         
         result = response.json()
@@ -212,30 +220,25 @@ def fallback_recycling_centers(latitude, longitude):
     ]
     
     # Filter centers that are within a reasonable distance
-    nearby_centers = []
-    for center in centers:
-        distance = haversine_distance(latitude, longitude, center["latitude"], center["longitude"])
-        if distance < 10:  # 10 km radius
-            nearby_centers.append(center)
-    
-    return nearby_centers
+    distances = haversine_distance(
+        latitude, longitude,
+        np.array([center["latitude"] for center in centers]),
+        np.array([center["longitude"] for center in centers])
+    )
+    return [center for center, distance in zip(centers, distances) if distance < 10]  # 10 km radius
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     """
     Calculate the great circle distance between two points 
     on the earth (specified in decimal degrees)
-    """
-    # Convert decimal degrees to radians
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
     
-    # Haversine formula
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    r = 6371  # Radius of earth in kilometers
-    
-    return c * r
+    The second point may also be arrays of latitudes and longitudes, whose
+    distances are then computed in one vectorized pass.
+    """
+    lat2_rad = np.radians(np.atleast_1d(lat2).astype(float))
+    distances = haversine_distances(lat1, lon1, lat2_rad, np.radians(np.atleast_1d(lon2).astype(float)),
+                                    np.cos(lat2_rad))
+    return distances if np.ndim(lat2) else float(distances[0])
 
 def calculate_carbon_savings(waste_type, weight):
     """
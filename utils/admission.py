@@ -0,0 +1,307 @@
+import os
+import math
+import time
+import sqlite3
+import logging
+import threading
+from functools import wraps
+from flask import current_app, jsonify, make_response, request
+from flask_login import current_user
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_RATE = 0.5              # tokens per second refilled into each user's bucket
+DEFAULT_USER_BURST = 10              # largest number of tokens a user's bucket holds
+DEFAULT_GLOBAL_RATE = 20.0           # tokens per second refilled into the shared bucket
+DEFAULT_GLOBAL_BURST = 60            # largest number of tokens the shared bucket holds
+DEFAULT_MAX_IN_FLIGHT = 4            # admitted requests running at once on this host
+DEFAULT_USER_MAX_IN_FLIGHT = 2       # admitted requests running at once per user
+DEFAULT_LEASE_TTL = 300              # seconds before a lease of a crashed worker is dropped
+DEFAULT_BULK_BYTES_PER_TOKEN = 1024 * 1024  # bulk upload bytes charged as one token
+
+# Key of the bucket and leases shared by every user
+GLOBAL_KEY = '*'
+
+# Retry-After sent when only the in-flight limit refused a request
+IN_FLIGHT_RETRY_AFTER = 1
+
+# Longest wait for the admission database lock before letting a request through
+LOCK_TIMEOUT = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_key TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_leases_user_key ON leases (user_key);
+CREATE INDEX IF NOT EXISTS ix_leases_expires_at ON leases (expires_at);
+"""
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of admitted"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"{reason}, retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+class Admission:
+    """An admitted request; release() frees its in-flight slot."""
+
+    def __init__(self, controller, lease_id):
+        self._controller = controller
+        self._lease_id = lease_id
+
+    def release(self):
+        lease_id, self._lease_id = self._lease_id, None
+        if lease_id is not None:
+            self._controller.release(lease_id)
+
+class AdmissionController:
+    """
+    Token buckets and in-flight limits shared by all workers of a host.
+
+    Each user has a bucket refilled at `user_rate` tokens per second up to
+    `user_burst`, and all users together draw from a shared bucket. A request
+    is admitted only if both buckets hold enough tokens and neither the user
+    nor the host is at its in-flight limit; otherwise it is rejected with the
+    number of seconds after which a retry can succeed, so excess load is shed
+    right away instead of queueing in front of the workers. The state lives
+    in a small SQLite file and every decision is one IMMEDIATE transaction,
+    which keeps gunicorn worker processes consistent without a separate
+    server. Leases of workers that died mid-request expire after `lease_ttl`.
+    """
+
+    def __init__(self, path, user_rate=DEFAULT_USER_RATE, user_burst=DEFAULT_USER_BURST,
+                 global_rate=DEFAULT_GLOBAL_RATE, global_burst=DEFAULT_GLOBAL_BURST,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, user_max_in_flight=DEFAULT_USER_MAX_IN_FLIGHT,
+                 lease_ttl=DEFAULT_LEASE_TTL):
+        self.path = path
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.max_in_flight = max_in_flight
+        self.user_max_in_flight = user_max_in_flight
+        self.lease_ttl = lease_ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {'admitted': 0, 'rejected_rate': 0, 'rejected_in_flight': 0, 'errors': 0}
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _connection(self):
+        # One connection per thread, reopened in each forked worker
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return conn
+
+    def admit(self, user_id, cost=1):
+        """
+        Admit a request or shed it
+
+        Args:
+            user_id: ID of the user making the request
+            cost (float): Tokens the request takes from the buckets
+
+        Returns:
+            Admission: Lease to release() once the request has finished
+
+        Raises:
+            AdmissionRejected: If a bucket is empty or an in-flight limit is reached
+        """
+        user_key = str(user_id)
+        try:
+            lease_id = self._admit(user_key, cost)
+        except sqlite3.Error as e:
+            # Admission control must not take the endpoints down with it
+            logger.error(f"Error in admission control, admitting request: {str(e)}")
+            self._count('errors')
+            return Admission(self, None)
+        self._count('admitted')
+        return Admission(self, lease_id)
+
+    def _admit(self, user_key, cost):
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+
+            running = conn.execute("SELECT COUNT(*) FROM leases").fetchone()[0]
+            user_running = conn.execute("SELECT COUNT(*) FROM leases WHERE user_key = ?", (user_key,)).fetchone()[0]
+            if running >= self.max_in_flight or user_running >= self.user_max_in_flight:
+                self._count('rejected_in_flight')
+                scope = 'user' if user_running >= self.user_max_in_flight else 'server'
+                raise AdmissionRejected(f"Too many {scope} requests in flight", IN_FLIGHT_RETRY_AFTER)
+
+            buckets = [
+                (user_key, self.user_rate, self.user_burst),
+                (GLOBAL_KEY, self.global_rate, self.global_burst)
+            ]
+            levels = []
+            wait = 0.0
+            for key, rate, burst in buckets:
+                row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = burst if row is None else min(burst, row[0] + max(now - row[1], 0) * rate)
+                levels.append((key, tokens))
+                if tokens < cost:
+                    wait = max(wait, (cost - tokens) / rate if rate > 0 else float(self.lease_ttl))
+            if wait:
+                self._count('rejected_rate')
+                raise AdmissionRejected("Rate limit exceeded", max(math.ceil(wait), 1))
+
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                [(key, tokens - cost, now) for key, tokens in levels]
+            )
+            lease_id = conn.execute(
+                "INSERT INTO leases (user_key, expires_at) VALUES (?, ?)",
+                (user_key, now + self.lease_ttl)
+            ).lastrowid
+            conn.execute("COMMIT")
+            return lease_id
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def release(self, lease_id):
+        """
+        Free the in-flight slot of an admitted request
+
+        Args:
+            lease_id (int): Lease returned by admit()
+        """
+        try:
+            self._connection().execute("DELETE FROM leases WHERE id = ?", (lease_id,))
+        except sqlite3.Error as e:
+            # The lease expires on its own after lease_ttl
+            logger.error(f"Error releasing admission lease {lease_id}: {str(e)}")
+
+    def stats(self):
+        """
+        Admission counters of this process and requests in flight on the host
+
+        Returns:
+            dict: Admitted, rejected and failed decisions plus the in-flight count
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        try:
+            stats['in_flight'] = self._connection().execute(
+                "SELECT COUNT(*) FROM leases WHERE expires_at > ?", (time.time(),)
+            ).fetchone()[0]
+        except sqlite3.Error:
+            stats['in_flight'] = None
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+def get_admission_controller():
+    """
+    Get the admission controller configured for this app
+
+    Returns:
+        AdmissionController: Controller backed by ADMISSION_DB_PATH
+    """
+    config = current_app.config
+    path = config["ADMISSION_DB_PATH"]
+    controller = _controllers.get(path)
+    if controller is None:
+        with _controllers_lock:
+            controller = _controllers.get(path)
+            if controller is None:
+                controller = _controllers[path] = AdmissionController(
+                    path,
+                    user_rate=config.get("ADMISSION_USER_RATE", DEFAULT_USER_RATE),
+                    user_burst=config.get("ADMISSION_USER_BURST", DEFAULT_USER_BURST),
+                    global_rate=config.get("ADMISSION_GLOBAL_RATE", DEFAULT_GLOBAL_RATE),
+                    global_burst=config.get("ADMISSION_GLOBAL_BURST", DEFAULT_GLOBAL_BURST),
+                    max_in_flight=config.get("ADMISSION_MAX_IN_FLIGHT", DEFAULT_MAX_IN_FLIGHT),
+                    user_max_in_flight=config.get("ADMISSION_USER_MAX_IN_FLIGHT", DEFAULT_USER_MAX_IN_FLIGHT),
+                    lease_ttl=config.get("ADMISSION_LEASE_TTL", DEFAULT_LEASE_TTL)
+                )
+    return controller
+
+def bulk_upload_cost():
+    """
+    Tokens charged for a bulk upload: one per ADMISSION_BULK_BYTES_PER_TOKEN
+    of request body
+
+    The image count is only known once the body has been read, so the size
+    stands in for it. The cost is capped at the smaller bucket, since a
+    larger cost could never be admitted; uploads of unknown size pay the cap.
+
+    Returns:
+        int: Tokens to take from the buckets
+    """
+    controller = get_admission_controller()
+    cap = max(1, int(min(controller.user_burst, controller.global_burst)))
+    if request.content_length is None:
+        return cap
+    per_token = current_app.config.get("ADMISSION_BULK_BYTES_PER_TOKEN", DEFAULT_BULK_BYTES_PER_TOKEN)
+    return min(max(1, math.ceil(request.content_length / per_token)), cap)
+
+def admission_controlled(view=None, cost=None):
+    """
+    Admit a view's requests through the admission controller
+
+    Place below @login_required. Shed requests get a 429 with Retry-After;
+    admitted ones hold an in-flight slot until their response has been sent,
+    which for streamed responses is after the last chunk. Requests cost one
+    token unless `cost` is given, e.g. @admission_controlled(cost=bulk_upload_cost).
+
+    Args:
+        view: The view, when used without arguments
+        cost (callable, optional): Returns the tokens the current request takes
+    """
+    if view is None:
+        return lambda view: admission_controlled(view, cost=cost)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_app.config.get("ADMISSION_ENABLED", True):
+            return view(*args, **kwargs)
+
+        try:
+            admission = get_admission_controller().admit(current_user.id, cost=cost() if cost else 1)
+        except AdmissionRejected as e:
+            logger.info(f"Shed request from user {current_user.id}: {e}")
+            return jsonify({'error': f"{e.reason}, please retry later", 'retry_after': e.retry_after}), \
+                429, {'Retry-After': str(e.retry_after)}
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except BaseException:
+            admission.release()
+            raise
+        if response.is_streamed:
+            response.call_on_close(admission.release)
+        else:
+            admission.release()
+        return response
+    return wrapper
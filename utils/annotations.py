@@ -0,0 +1,219 @@
+import json
+import logging
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import WasteEntry, ImageAnnotation
+from utils.carbon_calculator import calculate_carbon_savings_batch
+from utils.emission_factors import load_factor_version
+
+logger = logging.getLogger(__name__)
+
+# Vision scores are kept to this many decimals
+SCORE_DECIMALS = 4
+
+DEFAULT_CHUNK_SIZE = 10000
+
+def encode_annotations(labels, objects=None):
+    """
+    Serialize Vision annotations compactly
+
+    Args:
+        labels: List of (description, score) tuples from label detection
+        objects: Optional list of (name, score) tuples from object localization
+
+    Returns:
+        str: JSON like {"l":[["Plastic bottle",0.9731]],"o":[["Bottle",0.88]]}
+    """
+    data = {'l': [[description, round(float(score), SCORE_DECIMALS)] for description, score in labels]}
+    if objects:
+        data['o'] = [[name, round(float(score), SCORE_DECIMALS)] for name, score in objects]
+    return json.dumps(data, separators=(',', ':'))
+
+def decode_annotations(text):
+    """
+    Parse annotations stored by encode_annotations()
+
+    Args:
+        text (str): Stored annotations
+
+    Returns:
+        tuple: (labels, objects) lists of (description, score) tuples
+    """
+    data = json.loads(text)
+    return [tuple(label) for label in data.get('l', [])], [tuple(obj) for obj in data.get('o', [])]
+
+def store_annotations(content_hash, labels, objects=None):
+    """
+    Keep the raw Vision output for an image so it can be re-scored later
+
+    Annotations are stored once per image content; storing the same image
+    again is a no-op. Failures are logged and never fail a classification.
+
+    Args:
+        content_hash (str): SHA-256 of the image, as stored in WasteEntry.image_hash
+        labels: List of (description, score) tuples
+        objects: Optional list of (name, score) tuples
+    """
+    if not content_hash:
+        return
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(db.insert(ImageAnnotation.__table__).values(
+                content_hash=content_hash,
+                annotations=encode_annotations(labels, objects)
+            ))
+    except IntegrityError:
+        pass
+    except Exception as e:
+        logger.error(f"Error storing Vision annotations: {str(e)}")
+
+class LabelScorer:
+    """
+    Vectorized replay of LabelMatcher.score() over many label lists.
+
+    A label's contribution to the category scores is its Vision score times
+    a fixed weight vector, so each distinct label is run through the matcher
+    once and every entry's category scores become one weighted bincount per
+    category. Localized objects are added to entries whose labels score
+    below `object_threshold`, like the live Vision tier does.
+    """
+
+    def __init__(self, matcher, partial_weight=0.7, default=('non-recyclable', 0.5), object_threshold=0.1):
+        self.matcher = matcher
+        self.partial_weight = partial_weight
+        self.default = default
+        self.object_threshold = object_threshold
+        self.categories = list(matcher.categories)
+        self._rows = {}
+        self._weights = np.zeros((0, len(self.categories)))
+
+    def _label_rows(self, names):
+        new = [name for name in set(names) if name not in self._rows]
+        if new:
+            weights = []
+            for name in new:
+                scores = self.matcher.score([(name, 1.0)], partial_weight=self.partial_weight)
+                self._rows[name] = len(self._rows)
+                weights.append([scores[category] for category in self.categories])
+            self._weights = np.vstack([self._weights, np.array(weights)])
+        return np.fromiter((self._rows[name] for name in names), dtype=np.int64, count=len(names))
+
+    def score(self, label_lists, object_lists=None):
+        """
+        Pick the waste type for each label list
+
+        Args:
+            label_lists: List of label lists, each of (description, score) tuples
+            object_lists (optional): Matching list of (name, score) object lists
+
+        Returns:
+            tuple: (waste_types, confidences) with one entry per label list
+        """
+        totals = self._totals(label_lists)
+        if object_lists is not None:
+            weak = totals.max(axis=1) < self.object_threshold
+            if weak.any():
+                totals[weak] += self._totals(object_lists)[weak]
+
+        # argmax keeps the first category on ties, like max() over the score dict
+        count = len(label_lists)
+        best = totals.argmax(axis=1)
+        confidences = totals[np.arange(count), best]
+        matched = confidences > 0
+
+        waste_types = np.where(matched, np.array(self.categories, dtype=object)[best], self.default[0])
+        confidences = np.where(matched, confidences, self.default[1])
+        return list(waste_types), confidences
+
+    def _totals(self, label_lists):
+        count = len(label_lists)
+        owners = []
+        names = []
+        scores = []
+        for position, labels in enumerate(label_lists):
+            for description, score in labels:
+                owners.append(position)
+                names.append(description.lower())
+                scores.append(score)
+
+        totals = np.zeros((count, len(self.categories)))
+        if names:
+            owners = np.array(owners, dtype=np.int64)
+            rows = self._label_rows(names)
+            contributions = np.array(scores, dtype=np.float64)[:, None] * self._weights[rows]
+            for column in range(len(self.categories)):
+                totals[:, column] = np.bincount(owners, weights=contributions[:, column], minlength=count)
+        return totals
+
+def rescore_waste_entries(scorer, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, progress=None):
+    """
+    Re-map stored Vision labels and objects of past entries with the current keywords
+
+    Entries are read in id order, `chunk_size` at a time (keyset pagination,
+    so each chunk is an index range scan), scored in one vectorized pass and
+    the changed ones updated in one transaction per chunk, with their carbon
+    recomputed from the current emission factors. No external calls are
+    made.
+
+    Args:
+        scorer (LabelScorer): Scorer built from the current label mapping
+        chunk_size (int): Entries per chunk and transaction
+        dry_run (bool): Count changes without writing them
+        progress (callable, optional): Called with the running totals after each chunk
+
+    Returns:
+        dict: Entries scanned, changed and the resulting waste type moves
+    """
+    entries = WasteEntry.__table__
+    annotations = ImageAnnotation.__table__
+    factors = load_factor_version()
+    totals = {'scanned': 0, 'changed': 0, 'moves': {}}
+    last_id = 0
+
+    while True:
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                db.select(entries.c.id, entries.c.waste_type, entries.c.weight, annotations.c.annotations)
+                .join(annotations, annotations.c.content_hash == entries.c.image_hash)
+                .where(entries.c.id > last_id)
+                .order_by(entries.c.id)
+                .limit(chunk_size)
+            ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        decoded = [decode_annotations(row.annotations) for row in rows]
+        waste_types, _ = scorer.score([labels for labels, _ in decoded], [objects for _, objects in decoded])
+
+        changed = [(row, waste_type) for row, waste_type in zip(rows, waste_types) if waste_type != row.waste_type]
+        carbon = calculate_carbon_savings_batch([waste_type for _, waste_type in changed],
+                                                [row.weight for row, _ in changed], factors=factors)
+
+        updates = []
+        for (row, waste_type), carbon_saved in zip(changed, carbon.tolist()):
+            updates.append({
+                'entry_id': row.id,
+                'new_type': waste_type,
+                'new_carbon': carbon_saved
+            })
+            move = f"{row.waste_type} -> {waste_type}"
+            totals['moves'][move] = totals['moves'].get(move, 0) + 1
+
+        if updates and not dry_run:
+            with db.engine.begin() as conn:
+                conn.execute(
+                    db.update(entries)
+                    .where(entries.c.id == db.bindparam('entry_id'))
+                    .values(waste_type=db.bindparam('new_type'), carbon_saved=db.bindparam('new_carbon'),
+                            factor_version=factors.version),
+                    updates
+                )
+
+        totals['scanned'] += len(rows)
+        totals['changed'] += len(updates)
+        if progress:
+            progress(totals)
+
+    return totals
@@ -0,0 +1,382 @@
+import os
+import json
+import zipfile
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from flask import current_app
+from app import db
+from models import User, WasteEntry, EcoActivity
+from utils.classification_cache import get_classification_cache
+from utils.image_hashing import get_near_duplicate_index
+from utils.image_decoding import decode_image
+from utils.image_preprocessing import DEFAULT_MAX_DIMENSION, DEFAULT_JPEG_QUALITY
+from utils.offline_model import IMAGE_EXTENSIONS
+from utils.vision_batcher import get_vision_batcher
+from utils.resilience import get_upstream
+from utils.executors import ProcessLocalExecutor
+from utils.carbon_calculator import calculate_carbon_savings
+from utils.emission_factors import get_emission_factors
+from utils.annotations import store_annotations
+from utils.image_store import get_image_store, image_url
+from utils.waste_classifier import (
+    CACHE_NAMESPACE, get_classification_cascade, get_vision_labels, get_vision_objects, local_classify_pixels,
+    needs_objects, score_labels
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_IMAGES = 500             # images classified per bulk request
+
+# Thumbnails run through the local classifier in one vectorized pass, and
+# the group's rows are written with one bulk insert and commit
+LOCAL_BATCH_SIZE = 32
+
+STORE_ERROR = 'Could not save the classification, please upload the image again'
+
+ZIP_MIMETYPES = ('application/zip', 'application/x-zip-compressed')
+
+def iter_zip_images(archive_file, max_image_bytes):
+    """
+    Yield the images stored in a ZIP archive, one at a time
+
+    Args:
+        archive_file: Seekable binary file object holding the archive
+        max_image_bytes (int): Largest accepted image
+
+    Yields:
+        tuple: (filename, content, error) where error is a message for
+        images that were skipped and content is None
+    """
+    with zipfile.ZipFile(archive_file) as archive:
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or name.startswith('.') or not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+
+            if info.file_size > max_image_bytes:
+                yield info.filename, None, f"Image exceeds {max_image_bytes} bytes"
+                continue
+
+            # The size in the archive header is not trusted
+            with archive.open(info) as member:
+                content = member.read(max_image_bytes + 1)
+            if len(content) > max_image_bytes:
+                yield info.filename, None, f"Image exceeds {max_image_bytes} bytes"
+            else:
+                yield info.filename, content, None
+
+def iter_upload_images(files, max_image_bytes):
+    """
+    Yield the images of a multi-file upload, expanding ZIP archives
+
+    Args:
+        files: List of Werkzeug FileStorage objects
+        max_image_bytes (int): Largest accepted image
+
+    Yields:
+        tuple: (filename, content, error) as for iter_zip_images()
+    """
+    for upload in files:
+        filename = upload.filename or ''
+        if filename.lower().endswith('.zip') or upload.mimetype in ZIP_MIMETYPES:
+            try:
+                yield from iter_zip_images(upload.stream, max_image_bytes)
+            except zipfile.BadZipFile:
+                yield filename, None, "Not a valid ZIP archive"
+            continue
+
+        content = upload.stream.read(max_image_bytes + 1)
+        if len(content) > max_image_bytes:
+            yield filename, None, f"Image exceeds {max_image_bytes} bytes"
+        else:
+            yield filename, content, None
+
+def decode_workers():
+    """
+    Number of decode processes: BULK_DECODE_WORKERS, or one per CPU when unset
+
+    Returns:
+        int: Process count
+    """
+    return current_app.config.get("BULK_DECODE_WORKERS") or os.cpu_count() or 1
+
+def _start_decode_pool():
+    # Worker processes come from a forkserver rather than a fork of this
+    # threaded web worker, so they never inherit its locks, sockets or
+    # database connections. They only import utils.image_decoding, which
+    # leaves out the app, its models and the classifiers
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(['utils.image_decoding'])
+    return ProcessPoolExecutor(max_workers=decode_workers(), mp_context=context)
+
+_pool = ProcessLocalExecutor(_start_decode_pool)
+
+def get_decode_pool():
+    """
+    Get this process's pool of image decoding processes
+
+    Returns:
+        ProcessPoolExecutor: Shared pool of decode_workers() processes
+    """
+    return _pool.get()
+
+class BulkClassification:
+    """
+    Classifies the images of one bulk upload and stores them in batches.
+
+    Images are decoded in a process pool a few at a time, so only a bounded
+    window of uploads is held in memory. Decoded thumbnails go through the
+    local classifier in vectorized groups; the images it is unsure about are
+    submitted to Vision together, so the batcher can send them in shared
+    annotate calls. Each group's WasteEntry and EcoActivity rows are written
+    with bulk inserts and committed before its results are streamed, so a
+    result the client receives is a stored one.
+    """
+
+    def __init__(self, user_id, details):
+        config = current_app.config
+        self.user_id = user_id
+        self.details = details
+        self.max_images = config.get("BULK_MAX_IMAGES", DEFAULT_MAX_IMAGES)
+        self.max_dimension = config.get("VISION_MAX_DIMENSION", DEFAULT_MAX_DIMENSION)
+        self.quality = config.get("VISION_JPEG_QUALITY", DEFAULT_JPEG_QUALITY)
+        self.use_vision = bool(config.get("GOOGLE_VISION_API_KEY"))
+        self.store = get_image_store()
+        self.factors = get_emission_factors()
+        self._entries = []
+        self._activities = []
+        self._points = []
+        self.summary = {
+            'images': 0,
+            'classified': 0,
+            'failed': 0,
+            'truncated': False,
+            'carbon_saved': 0.0,
+            'points_earned': 0,
+            'tiers': {}
+        }
+
+    def run(self, images):
+        """
+        Classify and store a stream of images
+
+        Rows for images reported so far are stored even if the client
+        disconnects before the stream ends. Images whose rows could not be
+        stored are reported as failed.
+
+        Args:
+            images: Iterable of (filename, content, error) tuples
+
+        Yields:
+            dict: One result per image as it finishes, carrying the image's
+            upload index, then {'summary': ...}
+        """
+        pool = get_decode_pool()
+        # Enough uploads in flight to keep every decode process busy
+        window = decode_workers() * 2
+        decoding = deque()
+        decoded = []
+
+        try:
+            for index, (filename, content, error) in enumerate(images):
+                if index >= self.max_images:
+                    self.summary['truncated'] = True
+                    break
+
+                self.summary['images'] += 1
+                if error:
+                    yield self._failure(index, filename, error)
+                    continue
+
+                future = pool.submit(decode_image, content, self.max_dimension, self.quality,
+                                     self.store.thumbnail_size)
+                decoding.append((index, filename, content, future))
+                yield from self._drain(decoding, decoded, window - 1)
+
+            yield from self._drain(decoding, decoded, 0)
+            if decoded:
+                yield from self._flush(self._classify_group(decoded))
+
+        finally:
+            for *_, future in decoding:
+                future.cancel()
+
+        self.summary['carbon_saved'] = round(self.summary['carbon_saved'], 2)
+        yield {'summary': self.summary}
+
+    def _drain(self, decoding, decoded, keep):
+        # Wait for decodes until at most `keep` are pending, classifying full groups
+        while len(decoding) > keep:
+            yield from self._collect(decoding.popleft(), decoded)
+            if len(decoded) >= LOCAL_BATCH_SIZE:
+                yield from self._flush(self._classify_group(decoded))
+                decoded.clear()
+
+    def _collect(self, pending, decoded):
+        index, filename, content, future = pending
+        try:
+            content_hash, prepared, pixels, fingerprint, thumbnail = future.result()
+        except Exception as e:
+            logger.error(f"Error decoding bulk upload image {filename}: {str(e)}")
+            yield self._failure(index, filename, 'Could not read image')
+            return
+
+        try:
+            self.store.put(content, content_hash, thumbnail=thumbnail)
+        except Exception as e:
+            logger.error(f"Error storing bulk upload image: {str(e)}")
+        decoded.append((index, filename, content_hash, prepared, pixels, fingerprint))
+
+    def _classify_group(self, group):
+        cache = get_classification_cache()
+        near_duplicates = get_near_duplicate_index()
+
+        answers = {}
+        fresh = []
+        for position, (_, _, content_hash, _, _, fingerprint) in enumerate(group):
+            cached = cache.get(CACHE_NAMESPACE, content_hash)
+            if cached is None:
+                cached = near_duplicates.lookup(CACHE_NAMESPACE, fingerprint)
+            if cached is not None:
+                answers[position] = (cached[0], cached[1], 'cache')
+            else:
+                fresh.append(position)
+
+        if fresh:
+            local_results = local_classify_pixels(np.stack([group[position][4] for position in fresh]))
+            cascade = get_classification_cascade()
+            # Local answers only while Vision's circuit is open
+            use_vision = self.use_vision and get_upstream('vision').available()
+
+            escalated = []
+            for position, result in zip(fresh, local_results):
+                if use_vision and not cascade.is_confident(result):
+                    escalated.append((position, result))
+                else:
+                    answers[position] = (result.waste_type, result.confidence, 'local')
+
+            # Submit every escalation before waiting, so they share batches
+            batcher = get_vision_batcher() if escalated else None
+            futures = [batcher.submit(group[position][3]) if batcher else None for position, _ in escalated]
+
+            for (position, local_result), future in zip(escalated, futures):
+                try:
+                    if future is not None:
+                        response = future.result(timeout=batcher.timeout * 2)
+                        labels = [(label["description"], label["score"])
+                                  for label in response.get("labelAnnotations", [])]
+                    else:
+                        labels = get_vision_labels(group[position][3])
+                    objects = None
+                    if needs_objects(labels):
+                        try:
+                            objects = get_vision_objects(group[position][3])
+                        except Exception as e:
+                            logger.error(f"Error in Vision object localization: {str(e)}")
+                    result = score_labels(labels, objects)
+                    answers[position] = (result.waste_type, result.confidence, 'vision')
+                    store_annotations(group[position][2], labels, objects)
+                except Exception as e:
+                    # Keep the local answer, but do not remember it
+                    logger.error(f"Vision failed for bulk upload image {group[position][1]}: {str(e)}")
+                    answers[position] = (local_result.waste_type, local_result.confidence, 'local')
+                    fresh.remove(position)
+
+            for position in fresh:
+                waste_type, confidence, _ = answers[position]
+                _, _, content_hash, _, _, fingerprint = group[position]
+                cached = [waste_type, float(confidence)]
+                cache.set(CACHE_NAMESPACE, content_hash, cached)
+                near_duplicates.remember(CACHE_NAMESPACE, fingerprint, cached)
+
+        return [
+            self._store(index, filename, content_hash, *answers[position])
+            for position, (index, filename, content_hash, *_) in enumerate(group)
+        ]
+
+    def _store(self, index, filename, content_hash, waste_type, confidence, tier):
+        confidence = float(confidence)
+        weight = self.details.get('weight', 0.5)
+        carbon_saved = calculate_carbon_savings(waste_type, weight, factors=self.factors)
+        points_earned = 10 if waste_type == 'recyclable' else 5
+        stored_url = image_url(content_hash) if self.store.exists(content_hash) else None
+
+        self._entries.append({
+            'user_id': self.user_id,
+            'waste_type': waste_type,
+            'weight': weight,
+            'carbon_saved': carbon_saved,
+            'factor_version': self.factors.version,
+            'latitude': self.details.get('latitude'),
+            'longitude': self.details.get('longitude'),
+            'location_name': self.details.get('location_name', ''),
+            'image_hash': content_hash,
+            'image_url': stored_url
+        })
+        self._activities.append({
+            'user_id': self.user_id,
+            'activity_type': "waste_classification",
+            'points_earned': points_earned,
+            'carbon_saved': carbon_saved,
+            'details': json.dumps({
+                "waste_type": waste_type,
+                "weight": weight,
+                "confidence": confidence,
+                "filename": filename
+            })
+        })
+        self._points.append(points_earned)
+
+        return {
+            'index': index,
+            'filename': filename,
+            'waste_type': waste_type,
+            'confidence': confidence,
+            'tier': tier,
+            'carbon_saved': carbon_saved,
+            'points_earned': points_earned,
+            'thumbnail_url': image_url(content_hash, thumbnail=True) if stored_url else None
+        }
+
+    def _failure(self, index, filename, error):
+        self.summary['failed'] += 1
+        return {'index': index, 'filename': filename, 'error': error}
+
+    def _flush(self, results):
+        # Commit the rows of a classified group, then report its results;
+        # when the commit fails the images are reported as failed instead
+        try:
+            entry_ids = db.session.scalars(
+                db.insert(WasteEntry).returning(WasteEntry.id, sort_by_parameter_order=True), self._entries
+            ).all()
+            for activity, entry_id in zip(self._activities, entry_ids):
+                activity['waste_entry_id'] = entry_id
+            db.session.execute(db.insert(EcoActivity), self._activities)
+
+            # Award the points one image at a time, so levels work out as
+            # they would for separate uploads
+            user = db.session.get(User, self.user_id)
+            for points in self._points:
+                user.add_points(points, commit=False)
+
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error storing bulk classification results: {str(e)}")
+            for result in results:
+                yield self._failure(result['index'], result['filename'], STORE_ERROR)
+            return
+        finally:
+            self._entries = []
+            self._activities = []
+            self._points = []
+
+        for result in results:
+            self.summary['classified'] += 1
+            self.summary['carbon_saved'] += result['carbon_saved']
+            self.summary['points_earned'] += result['points_earned']
+            self.summary['tiers'][result['tier']] = self.summary['tiers'].get(result['tier'], 0) + 1
+            yield result
@@ -1,5 +1,7 @@
 import math
 import logging
+from itertools import repeat
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -26,7 +28,15 @@ CARBON_SAVINGS = {
     'non-recyclable': 0.0    # No carbon saved for non-recyclable waste
 }
 
-def calculate_carbon_savings(waste_type, weight=1.0, specific_type=None):
+# Real-world equivalents of 1 kg CO2e: kg per unit and decimals shown
+CARBON_EQUIVALENTS = {
+    'driving': (0.2, 1),             # km not driven in average car
+    'tree_days': (0.022, 1),         # days of tree absorbing CO2
+    'phone_charges': (0.005, 0),     # smartphone charges
+    'light_bulb_hours': (0.01, 0)    # hours of LED light bulb
+}
+
+def calculate_carbon_savings(waste_type, weight=1.0, specific_type=None, factors=None):
     """
     Calculate the carbon emissions saved by proper waste disposal
     
@@ -34,27 +44,32 @@ def calculate_carbon_savings(waste_type, weight=1.0, specific_type=None):
         waste_type (str): Type of waste (recyclable, organic, hazardous, non-recyclable)
         weight (float): Weight of waste in kg
         specific_type (str, optional): Specific subtype of waste
+        factors (FactorTable, optional): Emission factors to use instead of
+            the built-in CARBON_SAVINGS
         
     Returns:
         float: Carbon savings in kg CO2e
     """
     try:
-        if waste_type == 'non-recyclable':
-            return 0.0
-            
-        if waste_type not in CARBON_SAVINGS:
+        savings_table = (factors or DEFAULT_FACTORS).savings
+        
+        if waste_type not in savings_table:
             logger.warning(f"Unknown waste type: {waste_type}")
             return 0.0
             
-        if isinstance(CARBON_SAVINGS[waste_type], dict):
+        if isinstance(savings_table[waste_type], dict):
             # If we have a specific type and it's in our dictionary
-            if specific_type and specific_type in CARBON_SAVINGS[waste_type]:
-                carbon_factor = CARBON_SAVINGS[waste_type][specific_type]
+            if specific_type and specific_type in savings_table[waste_type]:
+                carbon_factor = savings_table[waste_type][specific_type]
             else:
                 # Use the general factor for this waste type
-                carbon_factor = CARBON_SAVINGS[waste_type]['general']
+                carbon_factor = savings_table[waste_type]['general']
         else:
-            carbon_factor = CARBON_SAVINGS[waste_type]
+            carbon_factor = savings_table[waste_type]
+            
+        # No carbon saved for waste like non-recyclable
+        if carbon_factor == 0:
+            return 0.0
             
         # Calculate savings
         savings = weight * carbon_factor
@@ -77,10 +92,8 @@ def get_carbon_equivalents(carbon_saved):
     """
     try:
         equivalents = {
-            'driving': round(carbon_saved / 0.2, 1),  # km not driven in average car
-            'tree_days': round(carbon_saved / 0.022, 1),  # days of tree absorbing CO2
-            'phone_charges': round(carbon_saved / 0.005, 0),  # smartphone charges
-            'light_bulb_hours': round(carbon_saved / 0.01, 0),  # hours of LED light bulb
+            name: round(carbon_saved / divisor, ndigits)
+            for name, (divisor, ndigits) in CARBON_EQUIVALENTS.items()
         }
         
         return equivalents
@@ -94,6 +107,187 @@ def get_carbon_equivalents(carbon_saved):
             'light_bulb_hours': 0
         }
 
+def validate_factors(savings):
+    """
+    Check an emission factor table before it is used or stored
+
+    Args:
+        savings (dict): Shaped like CARBON_SAVINGS: waste type to a factor,
+            or to subtype factors including 'general'
+
+    Raises:
+        ValueError: If the table is malformed
+    """
+    if not isinstance(savings, dict) or not savings:
+        raise ValueError("Emission factors must be a non-empty object of waste types")
+    for waste_type, subtypes in savings.items():
+        values = subtypes if isinstance(subtypes, dict) else {None: subtypes}
+        if isinstance(subtypes, dict) and 'general' not in subtypes:
+            raise ValueError(f"Waste type {waste_type} has subtypes but no 'general' factor")
+        for specific_type, factor in values.items():
+            if isinstance(factor, bool) or not isinstance(factor, (int, float)) or not math.isfinite(factor) or factor < 0:
+                name = waste_type if specific_type is None else f"{waste_type}.{specific_type}"
+                raise ValueError(f"Factor for {name} must be a non-negative number, got {factor!r}")
+
+class FactorTable:
+    """
+    Emission factors compiled into a flat array for vectorized lookups.
+
+    `savings` keeps the nested CARBON_SAVINGS-shaped dict for scalar
+    lookups; `factors` holds every factor once (index 0 is the 0.0 of
+    unknown types) and `codes()` maps (type, subtype) columns to indexes
+    into it through a small type x subtype table.
+    """
+
+    def __init__(self, savings, version=None):
+        self.savings = savings
+        self.version = version
+
+        factors = [0.0]
+        index = {}
+        for waste_type, subtypes in savings.items():
+            if not isinstance(subtypes, dict):
+                index[(waste_type, None)] = len(factors)
+                factors.append(subtypes)
+                continue
+            for specific_type, factor in subtypes.items():
+                index[(waste_type, specific_type)] = len(factors)
+                factors.append(factor)
+            index[(waste_type, None)] = index[(waste_type, 'general')]
+        self.factors = np.array(factors, dtype=np.float64)
+
+        # Every known type and subtype gets a small code; code 0 is unknown
+        self.type_codes = {waste_type: code for code, waste_type in enumerate(savings, 1)}
+        self.subtype_codes = {}
+        for subtypes in savings.values():
+            if isinstance(subtypes, dict):
+                for specific_type in subtypes:
+                    self.subtype_codes.setdefault(specific_type, len(self.subtype_codes) + 1)
+        self.table = np.zeros((len(self.type_codes) + 1, len(self.subtype_codes) + 1), dtype=np.intp)
+        for waste_type, type_code in self.type_codes.items():
+            self.table[type_code, :] = index[(waste_type, None)]
+            for specific_type, subtype_code in self.subtype_codes.items():
+                self.table[type_code, subtype_code] = index.get((waste_type, specific_type), index[(waste_type, None)])
+
+    def codes(self, waste_types, specific_types=None):
+        """
+        Factor indexes for columns of waste types and subtypes
+
+        Args:
+            waste_types (numpy.ndarray): 1-D object array of waste types
+            specific_types (optional): Sequence of subtypes, aligned with waste_types
+
+        Returns:
+            tuple: (indexes into `factors`, type codes where 0 marks unknown types)
+        """
+        count = len(waste_types)
+        rows = np.fromiter(map(self.type_codes.get, waste_types.tolist(), repeat(0)), dtype=np.intp, count=count)
+        if specific_types is None:
+            return self.table[rows, 0], rows
+        columns = np.fromiter(map(self.subtype_codes.get, specific_types, repeat(0)), dtype=np.intp, count=count)
+        return self.table[rows, columns], rows
+
+# The built-in factors, used when no factor version is given
+DEFAULT_FACTORS = FactorTable(CARBON_SAVINGS)
+
+def _product_error(values, scale):
+    # Exact rounding error of values * scale (Dekker's two-product), so that
+    # values * scale == product + error holds exactly
+    product = values * scale
+    with np.errstate(invalid='ignore', over='ignore'):
+        split = values * 134217729.0
+        high = split - (split - values)
+        low = values - high
+        scale_split = scale * 134217729.0
+        scale_high = scale_split - (scale_split - scale)
+        scale_low = scale - scale_high
+        error = ((high * scale_high - product) + high * scale_low + low * scale_high) + low * scale_low
+    return product, error
+
+def round_like_python(values, ndigits):
+    """
+    Round an array exactly like the built-in round(value, ndigits)
+
+    round() rounds the exact binary value half to even, while np.round()
+    rounds the already rounded product value * 10**ndigits, so the two
+    disagree when that product lands exactly on a tie. Those ties are
+    settled with the exact rounding error of the product.
+
+    Args:
+        values (numpy.ndarray): Float64 values
+        ndigits (int): Decimals to keep, 0 or more
+
+    Returns:
+        numpy.ndarray: Rounded values
+    """
+    scale = 10.0 ** ndigits
+    scaled, error = _product_error(np.asarray(values, dtype=np.float64), scale)
+    rounded = np.rint(scaled)
+
+    with np.errstate(invalid='ignore'):
+        floor = np.floor(scaled)
+        ties = (scaled - floor == 0.5) & np.isfinite(error) & (error != 0)
+    # A tie in the product is not one in the exact value: round towards it
+    rounded[ties] = np.where(error[ties] > 0, floor[ties] + 1, floor[ties])
+    return rounded / scale
+
+def calculate_carbon_savings_batch(waste_types, weights, specific_types=None, factors=None):
+    """
+    Calculate carbon savings for many entries in one vectorized pass
+
+    Gives the same values as calculate_carbon_savings() called per entry, so
+    it can recompute stored WasteEntry.carbon_saved values: each distinct
+    (type, subtype) pair is looked up once, then the weights are multiplied
+    with their factors and rounded as arrays. Unknown types are logged once
+    per call instead of once per entry.
+
+    Args:
+        waste_types: Sequence or array of waste types
+        weights: Sequence or array of weights in kg; None and NaN (a NULL
+            column) give 0.0
+        specific_types (optional): Sequence or array of subtypes, aligned
+            with waste_types
+        factors (FactorTable, optional): Emission factors to use instead of
+            the built-in CARBON_SAVINGS
+
+    Returns:
+        numpy.ndarray: Carbon savings in kg CO2e per entry
+    """
+    factors = factors or DEFAULT_FACTORS
+    waste_types = np.ravel(np.asarray(waste_types, dtype=object))
+    weights = np.ravel(np.asarray(weights, dtype=np.float64))
+    if specific_types is not None:
+        specific_types = np.ravel(np.asarray(specific_types, dtype=object)).tolist()
+
+    codes, rows = factors.codes(waste_types, specific_types)
+
+    if not rows.all():
+        unknown = set(map(str, waste_types[rows == 0].tolist()))
+        logger.warning(f"Unknown waste types: {', '.join(sorted(unknown))}")
+
+    factors = factors.factors
+    savings = round_like_python(weights * factors[codes], 2)
+    # Unknown and non-recyclable types as well as missing weights save nothing
+    savings[(codes == 0) | (factors[codes] == 0.0) | np.isnan(weights)] = 0.0
+    return savings
+
+def get_carbon_equivalents_batch(carbon_saved):
+    """
+    Real-world equivalents for many carbon savings at once
+
+    Args:
+        carbon_saved: Sequence or array of carbon savings in kg CO2e
+
+    Returns:
+        dict: The keys of get_carbon_equivalents(), each an array with the
+        value per entry
+    """
+    carbon_saved = np.asarray(carbon_saved, dtype=np.float64)
+    return {
+        name: round_like_python(carbon_saved / divisor, ndigits)
+        for name, (divisor, ndigits) in CARBON_EQUIVALENTS.items()
+    }
+
 def calculate_household_footprint(people=1, has_car=True, diet_type='mixed', recycling_level='medium'):
     """
     Calculate approximate annual carbon footprint for a household
@@ -0,0 +1,358 @@
+import time
+import logging
+import threading
+import numpy as np
+from flask import current_app
+from sqlalchemy import event
+from app import db
+from models import RecyclingCenter
+from utils.geo import encode_geohash, covering_cells, geohash_value, geohash_values, haversine_distances
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_INTERVAL = 30        # seconds between pulls of centers added by other workers
+DEFAULT_REBUILD_INTERVAL = 600       # seconds between full reloads, which pick up moved and deleted centers
+
+# Geohash length of the grid cells (about 4.9 x 4.9 km at the equator)
+GRID_PRECISION = 5
+
+# Rows read per query while loading the index
+LOAD_CHUNK_SIZE = 10000
+
+# Writes kept aside before they are merged into the arrays
+COMPACT_THRESHOLD = 256
+
+# Catalog rows per covering cell beyond which a query scans the whole catalog
+# instead, as enumerating the cells then costs more than the distances
+FULL_SCAN_RATIO = 32
+
+class _Catalog:
+    """Center positions as parallel arrays, ordered by grid cell."""
+
+    def __init__(self, ids, latitudes, longitudes):
+        cells = geohash_values(latitudes, longitudes, GRID_PRECISION)
+        order = np.argsort(cells, kind='stable')
+        self.ids = ids[order]
+        self.cells = cells[order]
+        self.latitudes = latitudes[order]
+        self.longitudes = longitudes[order]
+        self.lat = np.radians(self.latitudes)
+        self.lng = np.radians(self.longitudes)
+        self.cos_lat = np.cos(self.lat)
+
+    @classmethod
+    def from_positions(cls, positions):
+        """Build a catalog from an {id: (latitude, longitude)} dict."""
+        ids = np.fromiter(positions.keys(), dtype=np.int64, count=len(positions))
+        coordinates = np.array(list(positions.values()), dtype=np.float64).reshape(-1, 2)
+        return cls(ids, coordinates[:, 0], coordinates[:, 1])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self, cells):
+        # Indexes of the rows in the given sorted cells: each cell is a run
+        # of the cell-ordered arrays
+        starts = np.searchsorted(self.cells, cells, 'left')
+        lengths = np.searchsorted(self.cells, cells, 'right') - starts
+        offsets = np.cumsum(lengths) - lengths
+        return np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)
+
+    def distances(self, latitude, longitude, rows=slice(None)):
+        return haversine_distances(latitude, longitude, self.lat[rows], self.lng[rows], self.cos_lat[rows])
+
+_EMPTY = _Catalog(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+
+class CenterIndex:
+    """
+    In-memory catalog of recycling center locations for radius, k-nearest
+    and distance-ordered queries.
+
+    Center ids, latitudes and longitudes in radians and the cosines of the
+    latitudes are kept as NumPy arrays (a struct of arrays), so a query
+    computes the haversine distances to all the centers it looks at in one
+    vectorized pass and ranks them with argsort/argpartition, without a
+    Python object per center. The arrays are ordered by the geohash cell
+    (GRID_PRECISION characters) of each center: a radius query only reads
+    the runs of the cells covering the search circle, while k-nearest and
+    full orderings go over the whole catalog.
+
+    Centers saved in this process are applied right away through SQLAlchemy
+    mapper events. Arrays are not resized on every write: writes are kept
+    aside (`_pending` and `_removed`) and queried alongside the arrays until
+    COMPACT_THRESHOLD of them pile up and are merged in. Centers added by
+    other workers are pulled every `refresh_interval` seconds (rows with a
+    higher id), and the whole catalog is reloaded every `rebuild_interval`
+    seconds.
+    """
+
+    def __init__(self, refresh_interval=DEFAULT_REFRESH_INTERVAL, rebuild_interval=DEFAULT_REBUILD_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self._catalog = _EMPTY
+        self._pending = {}
+        self._removed = set()
+        self._delta = None
+        self._last_id = 0
+        self._loaded_at = None
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def add(self, center_id, latitude, longitude):
+        """
+        Index a center, replacing its previous location
+
+        Args:
+            center_id (int): RecyclingCenter.id
+            latitude (float): Latitude in degrees
+            longitude (float): Longitude in degrees
+        """
+        with self._lock:
+            # Hides its previous row in the arrays, if any
+            self._removed.add(center_id)
+            self._pending[center_id] = (latitude, longitude)
+            self._delta = None
+
+    def remove(self, center_id):
+        """
+        Drop a center from the index
+
+        Args:
+            center_id (int): RecyclingCenter.id
+        """
+        with self._lock:
+            self._removed.add(center_id)
+            self._pending.pop(center_id, None)
+            self._delta = None
+
+    def _view(self):
+        # The arrays, the pending writes as a small catalog of their own and
+        # the ids hidden from the arrays, consistent with each other
+        with self._lock:
+            if len(self._removed) + len(self._pending) >= COMPACT_THRESHOLD:
+                self._compact()
+            if self._delta is None and (self._pending or self._removed):
+                self._delta = (_Catalog.from_positions(self._pending),
+                               np.fromiter(self._removed, dtype=np.int64, count=len(self._removed)))
+            if self._delta is None:
+                return self._catalog, None, None
+            return self._catalog, self._delta[0], self._delta[1]
+
+    def _compact(self):
+        catalog = self._catalog
+        keep = ~np.isin(catalog.ids, np.fromiter(self._removed, dtype=np.int64, count=len(self._removed)))
+        pending = _Catalog.from_positions(self._pending)
+        self._catalog = _Catalog(
+            np.concatenate([catalog.ids[keep], pending.ids]),
+            np.concatenate([catalog.latitudes[keep], pending.latitudes]),
+            np.concatenate([catalog.longitudes[keep], pending.longitudes])
+        )
+        self._pending = {}
+        self._removed = set()
+        self._delta = None
+
+    def within(self, latitude, longitude, radius_km):
+        """
+        Centers within a radius, nearest first
+
+        Args:
+            latitude (float): Latitude of the location
+            longitude (float): Longitude of the location
+            radius_km (float): Search radius in kilometers
+
+        Returns:
+            tuple: (distances_km, center_ids) arrays sorted by distance
+        """
+        self.sync()
+        catalog, delta, removed = self._view()
+
+        distances, ids = [], []
+        for part in (catalog, delta):
+            if not part:
+                continue
+            limit = max(len(part) // FULL_SCAN_RATIO, 1)
+            cells = covering_cells(latitude, longitude, radius_km, GRID_PRECISION, limit=limit)
+            if cells is None:
+                rows = slice(None)
+            else:
+                rows = part.rows(np.unique(np.fromiter(map(geohash_value, cells), dtype=np.int64, count=len(cells))))
+            part_distances = part.distances(latitude, longitude, rows)
+            part_ids = part.ids[rows]
+            inside = part_distances <= radius_km
+            if part is catalog and removed is not None:
+                inside &= ~np.isin(part_ids, removed)
+            distances.append(part_distances[inside])
+            ids.append(part_ids[inside])
+
+        if not distances:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        distances = np.concatenate(distances)
+        ids = np.concatenate(ids)
+        order = np.argsort(distances)
+        return distances[order], ids[order]
+
+    def nearest(self, latitude, longitude, k, max_radius_km=None):
+        """
+        The k centers closest to a location
+
+        Args:
+            latitude (float): Latitude of the location
+            longitude (float): Longitude of the location
+            k (int): Number of centers
+            max_radius_km (float, optional): Ignore centers farther away
+
+        Returns:
+            tuple: (distances_km, center_ids) arrays of up to k centers,
+            sorted by distance
+        """
+        return self._ranked(latitude, longitude, k, max_radius_km)
+
+    def sorted_by_distance(self, latitude, longitude, limit=None):
+        """
+        The whole catalog ordered by distance from a location
+
+        Args:
+            latitude (float): Latitude of the location
+            longitude (float): Longitude of the location
+            limit (int, optional): Only return the closest centers
+
+        Returns:
+            tuple: (distances_km, center_ids) arrays sorted by distance
+        """
+        return self._ranked(latitude, longitude, limit, None)
+
+    def _ranked(self, latitude, longitude, k, max_radius_km):
+        self.sync()
+        catalog, delta, removed = self._view()
+
+        distances = catalog.distances(latitude, longitude)
+        ids = catalog.ids
+        if removed is not None:
+            distances[np.isin(ids, removed)] = np.inf
+        if delta:
+            distances = np.concatenate([distances, delta.distances(latitude, longitude)])
+            ids = np.concatenate([ids, delta.ids])
+        if max_radius_km is not None:
+            distances[distances > max_radius_km] = np.inf
+
+        if k is not None and k < len(distances):
+            if k <= 0:
+                return np.empty(0), np.empty(0, dtype=np.int64)
+            # Only the k closest are sorted
+            top = np.argpartition(distances, k - 1)[:k]
+            order = top[np.argsort(distances[top])]
+        else:
+            order = np.argsort(distances)
+        order = order[np.isfinite(distances[order])]
+        return distances[order], ids[order]
+
+    def sync(self):
+        """Load the index, or pull changes from other workers when they are due."""
+        now = time.monotonic()
+        if self._refreshed_at is not None and now - self._refreshed_at < self.refresh_interval:
+            return
+
+        with self._sync_lock:
+            if self._refreshed_at is not None and now - self._refreshed_at < self.refresh_interval:
+                return
+            rebuild = self._loaded_at is None or now - self._loaded_at >= self.rebuild_interval
+            self._refreshed_at = now
+            try:
+                self._load(rebuild)
+            except Exception as e:
+                logger.error(f"Error refreshing recycling center index: {str(e)}")
+                return
+            if rebuild:
+                self._loaded_at = now
+
+    def _load(self, rebuild):
+        centers = RecyclingCenter.__table__
+        last_id = 0 if rebuild else self._last_id
+        positions = {}
+        missing = []
+
+        while True:
+            with db.engine.connect() as conn:
+                rows = conn.execute(
+                    db.select(centers.c.id, centers.c.latitude, centers.c.longitude, centers.c.geohash)
+                    .where(centers.c.id > last_id)
+                    .order_by(centers.c.id)
+                    .limit(LOAD_CHUNK_SIZE)
+                ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            for row in rows:
+                if row.latitude is None or row.longitude is None:
+                    continue
+                if row.geohash is None:
+                    missing.append({'center_id': row.id, 'geohash': encode_geohash(row.latitude, row.longitude)})
+                positions[row.id] = (row.latitude, row.longitude)
+
+        # Only rows read here move the high-water mark: centers added through
+        # events meanwhile are read again by the next refresh
+        if rebuild:
+            catalog = _Catalog.from_positions(positions)
+            with self._lock:
+                self._catalog = catalog
+                self._pending = {}
+                self._removed = set()
+                self._delta = None
+            logger.info(f"Indexed {len(catalog)} recycling centers")
+        else:
+            with self._lock:
+                self._removed.update(positions)
+                self._pending.update(positions)
+                self._delta = None
+        self._last_id = last_id
+
+        if missing:
+            # Centers stored before the geohash column existed
+            with db.engine.begin() as conn:
+                conn.execute(
+                    db.update(centers).where(centers.c.id == db.bindparam('center_id'))
+                    .values(geohash=db.bindparam('geohash')),
+                    missing
+                )
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_center_index():
+    """
+    Get the process-wide recycling center index, configured from the app config
+
+    Returns:
+        CenterIndex: Shared index, loaded on first use
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                config = current_app.config
+                _index = CenterIndex(
+                    refresh_interval=config.get("CENTER_INDEX_REFRESH_INTERVAL", DEFAULT_REFRESH_INTERVAL),
+                    rebuild_interval=config.get("CENTER_INDEX_REBUILD_INTERVAL", DEFAULT_REBUILD_INTERVAL)
+                )
+    return _index
+
+@event.listens_for(RecyclingCenter, 'before_insert')
+@event.listens_for(RecyclingCenter, 'before_update')
+def _set_geohash(mapper, connection, center):
+    if center.latitude is not None and center.longitude is not None:
+        center.geohash = encode_geohash(center.latitude, center.longitude)
+
+@event.listens_for(RecyclingCenter, 'after_insert')
+@event.listens_for(RecyclingCenter, 'after_update')
+def _index_center(mapper, connection, center):
+    # Centers of a rolled back flush may linger until the next rebuild;
+    # queries load the matched rows and skip ids that do not exist
+    if _index is not None and center.latitude is not None and center.longitude is not None:
+        _index.add(center.id, center.latitude, center.longitude)
+
+@event.listens_for(RecyclingCenter, 'after_delete')
+def _unindex_center(mapper, connection, center):
+    if _index is not None:
+        _index.remove(center.id)
@@ -0,0 +1,98 @@
+import hashlib
+import logging
+import threading
+from flask import current_app
+from models import ClassificationResult
+from utils.two_tier_cache import TwoTierCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 1024            # entries kept in the in-process LRU tier
+DEFAULT_CACHE_TTL = 30 * 24 * 3600   # seconds a cached classification stays valid
+DEFAULT_CACHE_MAX_ROWS = 100000      # rows kept in the database tier
+
+def hash_image_content(content):
+    """
+    Build the content address used as cache key for an image
+
+    Args:
+        content: Raw image bytes, or a binary file object which is hashed
+            in chunks and rewound afterwards
+
+    Returns:
+        str: Hex encoded SHA-256 digest of the bytes
+    """
+    if hasattr(content, 'read'):
+        content.seek(0)
+        digest = hashlib.file_digest(content, 'sha256').hexdigest()
+        content.seek(0)
+        return digest
+    return hashlib.sha256(content).hexdigest()
+
+class ClassificationCache(TwoTierCache):
+    """
+    Two-tier cache of classification results keyed by image content hash.
+
+    The first tier is an in-process LRU dictionary, the second tier is the
+    ClassificationResult table, so results survive restarts and are shared
+    between gunicorn workers. Both tiers expire entries after `ttl` seconds.
+    """
+
+    model = ClassificationResult
+    description = 'classification cache'
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL,
+                 max_rows=DEFAULT_CACHE_MAX_ROWS):
+        super().__init__(max_entries, ttl, max_rows, counters=('stores',))
+
+    def _key(self, namespace, content_hash):
+        return f"{namespace}:{content_hash}"
+
+    def get(self, namespace, content_hash):
+        """
+        Look up a cached classification
+
+        Args:
+            namespace (str): Classifier the result belongs to
+            content_hash (str): Content hash of the image
+
+        Returns:
+            The cached result, or None on a miss
+        """
+        entry = self._lookup(self._key(namespace, content_hash))
+        return None if entry is None else entry[1]
+
+    def set(self, namespace, content_hash, result):
+        """
+        Store a classification result in both tiers
+
+        Args:
+            namespace (str): Classifier the result belongs to
+            content_hash (str): Content hash of the image
+            result: JSON serializable classification result
+        """
+        with self._lock:
+            self._stats['stores'] += 1
+        self._store(self._key(namespace, content_hash), result)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_classification_cache():
+    """
+    Get the process-wide classification cache, configured from the app config
+
+    Returns:
+        ClassificationCache: Shared cache instance
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = current_app.config
+                _cache = ClassificationCache(
+                    max_entries=config.get('CLASSIFICATION_CACHE_SIZE', DEFAULT_CACHE_SIZE),
+                    ttl=config.get('CLASSIFICATION_CACHE_TTL', DEFAULT_CACHE_TTL),
+                    max_rows=config.get('CLASSIFICATION_CACHE_MAX_ROWS', DEFAULT_CACHE_MAX_ROWS)
+                )
+    return _cache
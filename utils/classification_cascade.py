@@ -0,0 +1,129 @@
+import time
+import logging
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIDENCE_THRESHOLD = 0.8   # below this a tier escalates to the next one
+DEFAULT_AMBIGUITY_MARGIN = 0.2       # top-2 probability gap treated as ambiguous
+
+# What a tier returns; margin is the gap between the two best categories,
+# or None when the tier cannot tell; annotations is the raw upstream output
+# (Vision labels) when the tier has any
+TierResult = namedtuple('TierResult', ['waste_type', 'confidence', 'margin', 'annotations'], defaults=[None])
+
+# What the cascade returns; degraded is set when a later tier failed and an
+# earlier, less confident answer had to be used
+CascadeResult = namedtuple('CascadeResult', ['waste_type', 'confidence', 'tier', 'degraded', 'annotations'],
+                           defaults=[None])
+
+class ClassificationCascade:
+    """
+    Runs classifier tiers from cheapest to most expensive.
+
+    Each tier is a callable taking the image (as passed to classify()) and
+    returning a TierResult. A result is accepted when its confidence reaches
+    `confidence_threshold` and the two best categories are at least
+    `ambiguity_margin` apart; otherwise the image escalates to the next
+    tier. The last tier's answer is always accepted.
+    """
+
+    def __init__(self, tiers, confidence_threshold=DEFAULT_CONFIDENCE_THRESHOLD,
+                 ambiguity_margin=DEFAULT_AMBIGUITY_MARGIN):
+        self.tiers = list(tiers)
+        self.confidence_threshold = confidence_threshold
+        self.ambiguity_margin = ambiguity_margin
+        self._lock = threading.Lock()
+        self._stats = {
+            name: {'calls': 0, 'accepted': 0, 'escalated': 0, 'errors': 0,
+                   'latency_ms': 0.0, 'compared': 0, 'agreed': 0}
+            for name, _ in self.tiers
+        }
+
+    def is_confident(self, result):
+        """
+        Whether a tier result is good enough to stop the cascade
+
+        Args:
+            result (TierResult): Output of a tier
+
+        Returns:
+            bool: True if no escalation is needed
+        """
+        if result.confidence < self.confidence_threshold:
+            return False
+        return result.margin is None or result.margin >= self.ambiguity_margin
+
+    def classify(self, content):
+        """
+        Classify an image, escalating through the tiers as needed
+
+        Args:
+            content: Image, handed unchanged to every tier
+
+        Returns:
+            CascadeResult: Final answer and the tier that produced it
+        """
+        escalated = []
+
+        for position, (name, tier) in enumerate(self.tiers):
+            is_last = position == len(self.tiers) - 1
+            start = time.perf_counter()
+            try:
+                result = tier(content)
+            except Exception as e:
+                self._record(name, start, error=True)
+                if not escalated:
+                    raise
+                # Keep serving with the best earlier answer
+                logger.error(f"Classification tier {name} failed: {str(e)}")
+                fallback_name, fallback = escalated[-1]
+                return CascadeResult(fallback.waste_type, fallback.confidence, fallback_name, True, fallback.annotations)
+
+            if is_last or self.is_confident(result):
+                self._record(name, start, accepted=True, escalated_from=escalated, final=result)
+                return CascadeResult(result.waste_type, result.confidence, name, False, result.annotations)
+
+            self._record(name, start)
+            escalated.append((name, result))
+
+    def stats(self):
+        """
+        Per-tier counters for monitoring
+
+        Returns:
+            dict: Calls, average latency, escalation rate and agreement rate
+            with the tier that finally answered, for each tier
+        """
+        with self._lock:
+            stats = {name: dict(counters) for name, counters in self._stats.items()}
+
+        for counters in stats.values():
+            calls = counters['calls']
+            counters['avg_latency_ms'] = round(counters['latency_ms'] / calls, 3) if calls else 0.0
+            counters['escalation_rate'] = round(counters['escalated'] / calls, 4) if calls else 0.0
+            counters['agreement_rate'] = (
+                round(counters['agreed'] / counters['compared'], 4) if counters['compared'] else None
+            )
+            counters['latency_ms'] = round(counters['latency_ms'], 3)
+        return stats
+
+    def _record(self, name, start, accepted=False, error=False, escalated_from=(), final=None):
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            counters = self._stats[name]
+            counters['calls'] += 1
+            counters['latency_ms'] += elapsed
+            if error:
+                counters['errors'] += 1
+            elif accepted:
+                counters['accepted'] += 1
+                # How often the cheaper tiers would have been right anyway
+                for earlier_name, earlier in escalated_from:
+                    earlier_counters = self._stats[earlier_name]
+                    earlier_counters['compared'] += 1
+                    if earlier.waste_type == final.waste_type:
+                        earlier_counters['agreed'] += 1
+            else:
+                counters['escalated'] += 1
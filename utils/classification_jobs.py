@@ -0,0 +1,368 @@
+import json
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app import app, db
+from models import User, WasteEntry, EcoActivity, ClassificationJob
+from utils.waste_classifier import classify_upload
+from utils.carbon_calculator import calculate_carbon_savings
+from utils.emission_factors import get_emission_factors
+from utils.image_store import save_upload
+from utils.executors import ProcessLocalExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4                  # jobs classified concurrently per process
+DEFAULT_MAX_PENDING = 64             # queued plus running jobs per process
+DEFAULT_JOB_TTL = 24 * 3600          # seconds finished jobs can still be polled
+DEFAULT_JOB_TIMEOUT = 10 * 60        # seconds before an unfinished job counts as abandoned
+
+# How many submissions happen between passes that delete old jobs
+PRUNE_INTERVAL = 100
+
+FINISHED_STATUSES = ('done', 'failed')
+
+ABANDONED_ERROR = 'Classification did not finish, the worker running it stopped'
+
+class JobQueueFullError(Exception):
+    """Raised when a process already has its maximum number of pending jobs"""
+
+def record_classification(user, waste_type, confidence, weight=0.5, latitude=None,
+                          longitude=None, location_name='', image_hash=None, image_url=None):
+    """
+    Store a classified upload: waste entry, points and activity log
+
+    Args:
+        user (User): User who uploaded the image
+        waste_type (str): Classified waste type
+        confidence (float): Classifier confidence
+        weight (float): Estimated weight in kg
+        latitude (float, optional): Where the waste was found
+        longitude (float, optional): Where the waste was found
+        location_name (str): Name of the location
+        image_hash (str, optional): Content hash of the classified image
+        image_url (str, optional): Where the stored image is served
+
+    Returns:
+        dict: The /api/classify response body
+    """
+    # Calculate carbon savings with the current emission factors
+    factors = get_emission_factors()
+    carbon_saved = calculate_carbon_savings(waste_type, weight, factors=factors)
+
+    # Save the waste entry
+    waste_entry = WasteEntry(
+        user_id=user.id,
+        waste_type=waste_type,
+        weight=weight,
+        carbon_saved=carbon_saved,
+        factor_version=factors.version,
+        latitude=latitude,
+        longitude=longitude,
+        location_name=location_name,
+        image_hash=image_hash,
+        image_url=image_url
+    )
+
+    db.session.add(waste_entry)
+    db.session.flush()
+
+    # Award points to the user, committed with the entry below
+    points_earned = 10 if waste_type == 'recyclable' else 5
+    user.add_points(points_earned, commit=False)
+
+    # Record the activity
+    activity = EcoActivity(
+        user_id=user.id,
+        activity_type="waste_classification",
+        points_earned=points_earned,
+        carbon_saved=carbon_saved,
+        waste_entry_id=waste_entry.id,
+        details=json.dumps({
+            "waste_type": waste_type,
+            "weight": weight,
+            "confidence": confidence
+        })
+    )
+    db.session.add(activity)
+
+    db.session.commit()
+
+    response = {
+        'success': True,
+        'waste_type': waste_type,
+        'confidence': confidence,
+        'carbon_saved': carbon_saved,
+        'points_earned': points_earned,
+        'message': f'Successfully classified as {waste_type} waste!'
+    }
+    if image_url:
+        response['image_url'] = image_url
+        response['thumbnail_url'] = image_url + '/thumbnail'
+    return response
+
+def get_job(job_id):
+    """
+    Read the current state of a classification job
+
+    The row is read on its own connection so repeated polls see updates made
+    by worker threads of any process.
+
+    Args:
+        job_id (str): Job id returned by submit()
+
+    Returns:
+        dict: Job columns with the result decoded, or None if there is no such job
+    """
+    table = ClassificationJob.__table__
+    with db.engine.connect() as conn:
+        row = conn.execute(db.select(table).where(table.c.id == job_id)).mappings().first()
+
+    if row is None:
+        return None
+
+    job = dict(row)
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+class ClassificationJobQueue:
+    """
+    Runs /api/classify uploads on a bounded pool of background threads.
+
+    The web worker only stores the job row and hands the upload to the pool,
+    so a slow Vision round trip no longer blocks it. At most `max_pending`
+    jobs are queued or running per process; beyond that submit() refuses new
+    work instead of buffering uploads without limit. Job state lives in the
+    ClassificationJob table, so any worker can answer a poll.
+
+    A job whose process dies (restart, OOM kill) would stay queued or running
+    forever, so jobs unfinished after `job_timeout` are marked failed.
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING,
+                 job_ttl=DEFAULT_JOB_TTL, job_timeout=DEFAULT_JOB_TIMEOUT):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self.job_timeout = job_timeout
+        self._lock = threading.Lock()
+        self._executor = ProcessLocalExecutor(self._start_executor)
+        self._pending = 0
+        self._events = {}
+        self._submissions_since_prune = 0
+        self._stats = {'submitted': 0, 'rejected': 0, 'done': 0, 'failed': 0}
+
+    def submit(self, user_id, image_file, details=None):
+        """
+        Queue an upload for classification
+
+        The queue takes over the file: it is closed when the job finishes,
+        or right away when the job cannot be queued.
+
+        Args:
+            user_id (int): User who uploaded the image
+            image_file: Seekable binary file object holding the image, e.g.
+                a spooled temporary file rather than the bytes in memory
+            details (dict, optional): Keyword arguments for record_classification()
+
+        Returns:
+            str: Id of the new job
+        """
+        self._executor.get()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats['rejected'] += 1
+                image_file.close()
+                raise JobQueueFullError(f"{self._pending} classification jobs pending")
+            self._pending += 1
+
+        job_id = uuid.uuid4().hex
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(db.insert(ClassificationJob.__table__).values(
+                    id=job_id, user_id=user_id, status='queued'
+                ))
+            with self._lock:
+                self._events[job_id] = threading.Event()
+            self._executor.submit(self._run, job_id, user_id, image_file, details or {})
+        except Exception:
+            image_file.close()
+            self._finish(job_id, None)
+            raise
+
+        with self._lock:
+            self._stats['submitted'] += 1
+            self._submissions_since_prune += 1
+            should_prune = self._submissions_since_prune >= PRUNE_INTERVAL
+            if should_prune:
+                self._submissions_since_prune = 0
+
+        if should_prune:
+            self.prune()
+
+        return job_id
+
+    def wait(self, job_id, timeout):
+        """
+        Block until a job started by this process finishes
+
+        Jobs queued by other processes cannot be observed here, so for them
+        this simply waits out the timeout and callers re-read the job row.
+
+        Args:
+            job_id (str): Job id
+            timeout (float): Seconds to wait at most
+
+        Returns:
+            bool: True if the job is known to have finished
+        """
+        with self._lock:
+            event = self._events.get(job_id)
+        if event is None:
+            time.sleep(timeout)
+            return False
+        return event.wait(timeout)
+
+    def stats(self):
+        """
+        Get queue counters for monitoring
+
+        Returns:
+            dict: Jobs submitted, rejected, finished and currently pending
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = self._pending
+        return stats
+
+    def is_abandoned(self, job):
+        """
+        Check whether a job read by get_job() is unfinished past `job_timeout`
+
+        Args:
+            job (dict): Job as returned by get_job()
+
+        Returns:
+            bool: True if the job should be failed by fail_abandoned()
+        """
+        return (job['status'] not in FINISHED_STATUSES and job['created_at'] is not None
+                and job['created_at'] < datetime.utcnow() - timedelta(seconds=self.job_timeout))
+
+    def fail_abandoned(self):
+        """
+        Mark jobs still queued or running after `job_timeout` as failed
+
+        Returns:
+            int: Number of jobs marked failed
+        """
+        table = ClassificationJob.__table__
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=self.job_timeout)
+        try:
+            with db.engine.begin() as conn:
+                failed = conn.execute(
+                    db.update(table)
+                    .where(table.c.created_at < cutoff, table.c.status.notin_(FINISHED_STATUSES))
+                    .values(status='failed', error=ABANDONED_ERROR, finished_at=now)
+                ).rowcount
+        except Exception as e:
+            logger.error(f"Error failing abandoned classification jobs: {str(e)}")
+            return 0
+
+        if failed:
+            logger.warning(f"Marked {failed} abandoned classification jobs as failed")
+        return failed
+
+    def prune(self):
+        """
+        Fail abandoned jobs, then delete finished jobs older than `job_ttl`
+
+        Returns:
+            int: Number of rows deleted
+        """
+        self.fail_abandoned()
+
+        table = ClassificationJob.__table__
+        cutoff = datetime.utcnow() - timedelta(seconds=self.job_ttl)
+        try:
+            with db.engine.begin() as conn:
+                return conn.execute(
+                    db.delete(table).where(table.c.created_at < cutoff,
+                                           table.c.status.in_(FINISHED_STATUSES))
+                ).rowcount
+        except Exception as e:
+            logger.error(f"Error pruning classification jobs: {str(e)}")
+            return 0
+
+    def _start_executor(self):
+        # Jobs pending in the parent process are not this process's to count
+        with self._lock:
+            self._pending = 0
+            self._events = {}
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='classification-job')
+
+    def _run(self, job_id, user_id, image_file, details):
+        status = 'failed'
+        try:
+            with app.app_context():
+                self._update(job_id, status='running')
+                try:
+                    classification = classify_upload(image_file)
+                    stored_url = save_upload(image_file, classification.content_hash)
+                    user = db.session.get(User, user_id)
+                    result = record_classification(user, classification.waste_type, classification.confidence,
+                                                   image_hash=classification.content_hash,
+                                                   image_url=stored_url, **details)
+                    self._update(job_id, status='done', result=json.dumps(result),
+                                 finished_at=datetime.utcnow())
+                    status = 'done'
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error in classification job {job_id}: {str(e)}")
+                    self._update(job_id, status='failed', error=str(e), finished_at=datetime.utcnow())
+        except Exception as e:
+            logger.error(f"Error updating classification job {job_id}: {str(e)}")
+        finally:
+            image_file.close()
+            self._finish(job_id, status)
+
+    def _update(self, job_id, **values):
+        table = ClassificationJob.__table__
+        with db.engine.begin() as conn:
+            conn.execute(db.update(table).where(table.c.id == job_id).values(**values))
+
+    def _finish(self, job_id, status):
+        with self._lock:
+            self._pending -= 1
+            if status is not None:
+                self._stats[status] += 1
+            event = self._events.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_classification_queue():
+    """
+    Get the process-wide classification job queue, configured from the app config
+
+    Returns:
+        ClassificationJobQueue: Shared queue instance
+    """
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                config = current_app.config
+                _queue = ClassificationJobQueue(
+                    max_workers=config.get("CLASSIFICATION_WORKERS", DEFAULT_WORKERS),
+                    max_pending=config.get("CLASSIFICATION_MAX_PENDING", DEFAULT_MAX_PENDING),
+                    job_ttl=config.get("CLASSIFICATION_JOB_TTL", DEFAULT_JOB_TTL),
+                    job_timeout=config.get("CLASSIFICATION_JOB_TIMEOUT", DEFAULT_JOB_TIMEOUT)
+                )
+    return _queue
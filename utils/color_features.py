@@ -0,0 +1,136 @@
+import io
+import numpy as np
+
+# Images are reduced to this size before any colour statistics are taken
+THUMBNAIL_SIZE = (100, 100)
+
+HUE_BINS = 12
+SATURATION_BINS = 4
+VALUE_BINS = 4
+
+# Column layout of extract_features(); channel means are in 0-255, the rest in 0-1
+FEATURE_NAMES = (
+    ['r_mean', 'g_mean', 'b_mean',
+     'saturation_mean', 'saturation_std', 'value_mean', 'value_std'] +
+    [f'hue_hist_{i}' for i in range(HUE_BINS)] +
+    [f'saturation_hist_{i}' for i in range(SATURATION_BINS)] +
+    [f'value_hist_{i}' for i in range(VALUE_BINS)]
+)
+
+def load_thumbnail(image):
+    """
+    Decode an image into a fixed-size RGB pixel array
+
+    JPEG files are decoded in draft mode, which lets libjpeg scale the image
+    down by up to 8x while decoding instead of producing every full-size pixel.
+
+    Args:
+        image: Raw image bytes, a file object or a PIL Image
+
+    Returns:
+        numpy.ndarray: uint8 array of shape (100, 100, 3)
+    """
+    from PIL import Image
+
+    if isinstance(image, (bytes, bytearray)):
+        image = io.BytesIO(image)
+    if not isinstance(image, Image.Image):
+        if hasattr(image, 'seek'):
+            image.seek(0)
+        image = Image.open(image)
+        image.draft('RGB', THUMBNAIL_SIZE)
+
+    image = image.convert('RGB').resize(THUMBNAIL_SIZE)
+    return np.asarray(image, dtype=np.uint8)
+
+def to_planar(pixels):
+    """
+    Convert a stack of RGB thumbnails into contiguous per-channel planes
+
+    Reductions over interleaved RGB data stride through memory, so every
+    vectorized statistic below works on planes of shape (3, N, P) instead.
+
+    Args:
+        pixels (numpy.ndarray): uint8 array of shape (N, H, W, 3)
+
+    Returns:
+        numpy.ndarray: uint8 array of shape (3, N, H * W)
+    """
+    return np.ascontiguousarray(pixels.reshape(len(pixels), -1, 3).transpose(2, 0, 1))
+
+def channel_means(planes):
+    """
+    Mean R, G and B value of each image
+
+    The sums are exact integers, so the means equal a plain Python
+    sum(...) / len(...) over the same pixels.
+
+    Args:
+        planes (numpy.ndarray): uint8 array of shape (3, N, P) from to_planar()
+
+    Returns:
+        numpy.ndarray: float64 array of shape (N, 3) with values in 0-255
+    """
+    return planes.sum(axis=2, dtype=np.uint32).T / float(planes.shape[2])
+
+def rgb_to_hsv(planes):
+    """
+    Vectorized RGB to HSV conversion
+
+    Args:
+        planes (numpy.ndarray): uint8 array of shape (3, N, P) from to_planar()
+
+    Returns:
+        tuple: hue, saturation and value arrays of shape (N, P), all in 0-1
+    """
+    r, g, b = planes.astype(np.float32)
+
+    value = np.maximum(np.maximum(r, g), b)
+    delta = value - np.minimum(np.minimum(r, g), b)
+    chromatic = delta > 0
+    safe_delta = np.where(chromatic, delta, 1.0)
+
+    saturation = np.divide(delta, value, out=np.zeros_like(delta), where=value > 0)
+
+    hue = np.where(value == r, (g - b) / safe_delta,
+                   np.where(value == g, 2.0 + (b - r) / safe_delta, 4.0 + (r - g) / safe_delta))
+    hue = np.where(chromatic, (hue / 6.0) % 1.0, 0.0)
+
+    return hue, saturation, value / 255.0
+
+def _histograms(values, bins, weights=None):
+    # Per-image normalized histograms of (N, P) values in 0-1 with one bincount
+    count = len(values)
+    index = np.minimum((values * bins).astype(np.int64), bins - 1)
+    index += np.arange(count, dtype=np.int64)[:, None] * bins
+    hist = np.bincount(index.ravel(), weights=None if weights is None else weights.ravel(),
+                       minlength=count * bins).reshape(count, bins)
+    totals = hist.sum(axis=1, keepdims=True)
+    return hist / np.where(totals > 0, totals, 1.0)
+
+def extract_features(pixels):
+    """
+    Compute colour features for a stack of thumbnails in one vectorized pass
+
+    Args:
+        pixels (numpy.ndarray): uint8 array of shape (N, H, W, 3)
+
+    Returns:
+        numpy.ndarray: float64 array of shape (N, len(FEATURE_NAMES))
+    """
+    planes = to_planar(pixels)
+    hue, saturation, value = rgb_to_hsv(planes)
+
+    moments = np.stack([
+        saturation.mean(axis=1), saturation.std(axis=1),
+        value.mean(axis=1), value.std(axis=1)
+    ], axis=1)
+
+    return np.hstack([
+        channel_means(planes),
+        moments,
+        # Grey pixels have no meaningful hue, so hues are weighted by saturation
+        _histograms(hue, HUE_BINS, weights=saturation),
+        _histograms(saturation, SATURATION_BINS),
+        _histograms(value, VALUE_BINS)
+    ])
@@ -0,0 +1,252 @@
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import WasteEntry, EcoActivity, EmissionFactorVersion
+from utils.carbon_calculator import CARBON_SAVINGS, DEFAULT_FACTORS, FactorTable, validate_factors, \
+    calculate_carbon_savings_batch
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_INTERVAL = 30        # seconds between checks for a newer factor version
+DEFAULT_CHUNK_SIZE = 1000            # entries per recompute chunk and transaction
+DEFAULT_PAUSE = 0.05                 # seconds between recompute chunks, left to live traffic
+
+def load_factor_version(version=None):
+    """
+    Load and compile a stored emission factor version
+
+    The built-in CARBON_SAVINGS are stored as version 1 the first time no
+    version exists.
+
+    Args:
+        version (int, optional): Version to load; the current (highest) one by default
+
+    Returns:
+        FactorTable: Compiled factors, with their version number
+    """
+    query = EmissionFactorVersion.query
+    if version is None:
+        row = query.order_by(EmissionFactorVersion.version.desc()).first()
+        if row is None:
+            row = _seed_factors()
+    else:
+        row = query.get(version)
+        if row is None:
+            raise ValueError(f"Unknown emission factor version {version}")
+    return FactorTable(json.loads(row.factors), version=row.version)
+
+def _seed_factors():
+    try:
+        row = EmissionFactorVersion(version=1, factors=json.dumps(CARBON_SAVINGS), note='Built-in factors')
+        db.session.add(row)
+        db.session.commit()
+        return row
+    except IntegrityError:
+        # Seeded by another worker in the meantime
+        db.session.rollback()
+        return EmissionFactorVersion.query.get(1)
+
+def publish_emission_factors(savings, note=None):
+    """
+    Store a new emission factor version, which becomes current
+
+    Existing entries keep their carbon_saved until recompute_carbon_saved()
+    has moved them to the new version.
+
+    Args:
+        savings (dict): Factors shaped like CARBON_SAVINGS
+        note (str, optional): Why the factors changed, e.g. their source
+
+    Returns:
+        int: The new version number
+
+    Raises:
+        ValueError: If the factors are malformed
+    """
+    validate_factors(savings)
+    current = load_factor_version()
+    row = EmissionFactorVersion(version=current.version + 1, factors=json.dumps(savings), note=note)
+    db.session.add(row)
+    db.session.commit()
+    logger.info(f"Published emission factor version {row.version}")
+    return row.version
+
+class EmissionFactorRegistry:
+    """
+    The current emission factors of a process, compiled once per version.
+
+    Workers check for a newer version at most every `refresh_interval`
+    seconds, so new entries use published factors shortly after they are
+    published without a query per classification.
+    """
+
+    def __init__(self, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._factors = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self):
+        """
+        Get the current emission factors
+
+        Returns:
+            FactorTable: Compiled factors of the current version, or the
+            built-in factors without a version if they cannot be loaded
+        """
+        now = time.monotonic()
+        with self._lock:
+            factors = self._factors
+            if factors is not None and now - self._checked_at < self.refresh_interval:
+                return factors
+            self._checked_at = now
+
+        try:
+            latest = db.session.query(db.func.max(EmissionFactorVersion.version)).scalar()
+            if factors is None or latest != factors.version:
+                factors = load_factor_version()
+                logger.info(f"Using emission factor version {factors.version}")
+        except Exception as e:
+            logger.error(f"Error loading emission factors: {str(e)}")
+            db.session.rollback()
+            return factors or DEFAULT_FACTORS
+
+        with self._lock:
+            self._factors = factors
+        return factors
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_emission_factors():
+    """
+    Get the current emission factors for this process
+
+    Returns:
+        FactorTable: Compiled factors with their version number
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = EmissionFactorRegistry(
+                    refresh_interval=current_app.config.get("EMISSION_FACTORS_REFRESH_INTERVAL",
+                                                            DEFAULT_REFRESH_INTERVAL)
+                )
+    return _registry.current()
+
+def recompute_carbon_saved(chunk_size=DEFAULT_CHUNK_SIZE, pause=DEFAULT_PAUSE, restart=False, progress=None):
+    """
+    Move entries computed with older factors to the current version
+
+    Stale entries are read in id order, `chunk_size` at a time (keyset
+    pagination), recomputed in one vectorized pass and updated in one short
+    transaction per chunk, together with the EcoActivity rows linked to them
+    and the progress stored on the factor version. An interrupted run resumes after the last finished chunk, and
+    the live database never sees more than one chunk-sized UPDATE at a time.
+    The job stops when a newer version is published meanwhile; running it
+    again then works towards that version.
+
+    Args:
+        chunk_size (int): Entries per chunk and transaction
+        pause (float): Seconds to sleep between chunks
+        restart (bool): Start from the first entry instead of resuming
+        progress (callable, optional): Called with the running totals after each chunk
+
+    Returns:
+        dict: Target version, entries updated, the change of the total
+        carbon saved and whether the run was superseded by a newer version
+    """
+    factors = load_factor_version()
+    version = factors.version
+    entries = WasteEntry.__table__
+    activities = EcoActivity.__table__
+    versions = EmissionFactorVersion.__table__
+
+    row = EmissionFactorVersion.query.get(version)
+    last_id = 0 if restart else row.recompute_last_id or 0
+    totals = {
+        'version': version,
+        'resumed_after': last_id,
+        'updated': 0,
+        'carbon_delta': 0.0,
+        'superseded_by': None
+    }
+    stale = db.or_(entries.c.factor_version.is_(None), entries.c.factor_version != version)
+    if restart:
+        with db.engine.begin() as conn:
+            conn.execute(
+                db.update(versions).where(versions.c.version == version)
+                .values(recompute_last_id=0, recomputed_entries=0, carbon_delta=0.0, recompute_finished_at=None)
+            )
+
+    while True:
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                db.select(entries.c.id, entries.c.waste_type, entries.c.weight, entries.c.carbon_saved)
+                .where(entries.c.id > last_id, stale)
+                .order_by(entries.c.id)
+                .limit(chunk_size)
+            ).all()
+
+        with db.engine.begin() as conn:
+            latest = conn.execute(db.select(db.func.max(versions.c.version))).scalar()
+            if latest != version:
+                totals['superseded_by'] = latest
+                break
+
+            if not rows:
+                conn.execute(
+                    db.update(versions).where(versions.c.version == version)
+                    .values(recompute_finished_at=datetime.utcnow())
+                )
+                break
+
+            carbon = calculate_carbon_savings_batch([r.waste_type for r in rows], [r.weight for r in rows],
+                                                    factors=factors).tolist()
+            last_id = rows[-1].id
+
+            # Entries a concurrent run moved since they were read no longer
+            # match `stale`; only the ones updated here are counted and have
+            # their activities updated
+            update_entry = (
+                db.update(entries)
+                .where(entries.c.id == db.bindparam('entry_id'), stale)
+                .values(carbon_saved=db.bindparam('new_carbon'), factor_version=version)
+            )
+            updates = []
+            delta = 0.0
+            for r, new in zip(rows, carbon):
+                params = {'entry_id': r.id, 'new_carbon': new}
+                if conn.execute(update_entry, params).rowcount:
+                    updates.append(params)
+                    delta += new - (r.carbon_saved or 0.0)
+
+            if updates:
+                conn.execute(
+                    db.update(activities)
+                    .where(activities.c.waste_entry_id == db.bindparam('entry_id'))
+                    .values(carbon_saved=db.bindparam('new_carbon')),
+                    updates
+                )
+            conn.execute(
+                db.update(versions).where(versions.c.version == version)
+                .values(recompute_last_id=last_id,
+                        recomputed_entries=versions.c.recomputed_entries + len(updates),
+                        carbon_delta=versions.c.carbon_delta + delta)
+            )
+
+        totals['updated'] += len(updates)
+        totals['carbon_delta'] += delta
+        if progress:
+            progress(totals)
+        if pause:
+            time.sleep(pause)
+
+    totals['carbon_delta'] = round(totals['carbon_delta'], 2)
+    return totals
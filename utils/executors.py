@@ -0,0 +1,42 @@
+import os
+import threading
+
+class ProcessLocalExecutor:
+    """
+    An executor created lazily in each process that uses it.
+
+    Threads do not survive a fork, so a pool created in the gunicorn master
+    (or at import time) is unusable in its workers. get() calls `factory`
+    the first time it runs in a process and returns that process's executor
+    afterwards. The factory runs under a lock and may also reset per-process
+    state that belongs with the executor, such as in-flight bookkeeping.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Get this process's executor, creating it on first use
+
+        Returns:
+            Executor: Whatever `factory` returned in this process
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = self.factory()
+                    self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Submit a call to this process's executor
+
+        Returns:
+            Future: Future of the call
+        """
+        return self.get().submit(fn, *args, **kwargs)
@@ -0,0 +1,257 @@
+import math
+import numpy as np
+
+# Mean Earth radius in kilometers, as used by the haversine distances
+EARTH_RADIUS_KM = 6371.0
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Characters stored in RecyclingCenter.geohash (cells of about 5 m)
+GEOHASH_PRECISION = 9
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculate the Haversine distance between two points in kilometers
+
+    Args:
+        lat1, lon1: Coordinates of the first point
+        lat2, lon2: Coordinates of the second point
+
+    Returns:
+        float: Distance in kilometers
+    """
+    lat1_rad = math.radians(lat1)
+    lon1_rad = math.radians(lon1)
+    lat2_rad = math.radians(lat2)
+    lon2_rad = math.radians(lon2)
+
+    dlon = lon2_rad - lon1_rad
+    dlat = lat2_rad - lat1_rad
+
+    a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+def haversine_distances(latitude, longitude, lat_rad, lng_rad, cos_lat):
+    """
+    Haversine distances from one point to many, vectorized
+
+    Args:
+        latitude (float): Latitude of the point in degrees
+        longitude (float): Longitude of the point in degrees
+        lat_rad (numpy.ndarray): Latitudes of the other points in radians
+        lng_rad (numpy.ndarray): Longitudes of the other points in radians
+        cos_lat (numpy.ndarray): Precomputed cosines of lat_rad
+
+    Returns:
+        numpy.ndarray: Distances in kilometers
+    """
+    lat0 = math.radians(latitude)
+    lng0 = math.radians(longitude)
+
+    # In place, so a large catalog costs two temporaries rather than a dozen
+    a = np.subtract(lat_rad, lat0)
+    a *= 0.5
+    np.sin(a, out=a)
+    a *= a
+    b = np.subtract(lng_rad, lng0)
+    b *= 0.5
+    np.sin(b, out=b)
+    b *= b
+    b *= cos_lat
+    b *= math.cos(lat0)
+    a += b
+
+    np.minimum(a, 1.0, out=a)
+    np.sqrt(a, out=a)
+    np.arcsin(a, out=a)
+    a *= 2 * EARTH_RADIUS_KM
+    return a
+
+def geohash_value(geohash):
+    """
+    Integer value of a geohash, ordered like the geohashes of its precision
+
+    Args:
+        geohash (str): Geohash
+
+    Returns:
+        int: The geohash's bits as an integer
+    """
+    value = 0
+    for char in geohash:
+        value = (value << 5) | GEOHASH_ALPHABET.index(char)
+    return value
+
+def _cell_bits(precision):
+    # Geohash bits alternate longitude/latitude, starting with longitude
+    bits = precision * 5
+    return (bits + 1) // 2, bits // 2
+
+def cell_size(precision):
+    """
+    Size of the geohash cells of a precision
+
+    Args:
+        precision (int): Geohash length
+
+    Returns:
+        tuple: (latitude, longitude) extent of a cell in degrees
+    """
+    lng_bits, lat_bits = _cell_bits(precision)
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+def cell_bounds(latitude, longitude, precision):
+    """
+    Extent of the geohash cell containing a location
+
+    Args:
+        latitude (float): Latitude in degrees
+        longitude (float): Longitude in degrees
+        precision (int): Geohash length
+
+    Returns:
+        tuple: (min_lat, max_lat, min_lng, max_lng) of the cell
+    """
+    lng_bits, lat_bits = _cell_bits(precision)
+    lat_span, lng_span = cell_size(precision)
+    row = _cell_index(max(-90.0, min(90.0, latitude)), -90.0, 180.0, lat_bits)
+    column = _cell_index(max(-180.0, min(180.0, longitude)), -180.0, 360.0, lng_bits)
+    min_lat = -90.0 + row * lat_span
+    min_lng = -180.0 + column * lng_span
+    return min_lat, min_lat + lat_span, min_lng, min_lng + lng_span
+
+def _cell_index(value, low, span, bits):
+    return min(int((value - low) / span * (1 << bits)), (1 << bits) - 1)
+
+def _spread(value):
+    # Move bit i of a 32-bit value to bit 2i
+    value &= 0xFFFFFFFF
+    value = (value | (value << 16)) & 0x0000FFFF0000FFFF
+    value = (value | (value << 8)) & 0x00FF00FF00FF00FF
+    value = (value | (value << 4)) & 0x0F0F0F0F0F0F0F0F
+    value = (value | (value << 2)) & 0x3333333333333333
+    return (value | (value << 1)) & 0x5555555555555555
+
+def _geohash(lat_index, lng_index, precision):
+    # Bits alternate longitude/latitude from the most significant one, which
+    # is a longitude bit; with an odd bit count longitude has the lowest too
+    lng_bits, lat_bits = _cell_bits(precision)
+    if lng_bits > lat_bits:
+        value = _spread(lng_index) | (_spread(lat_index) << 1)
+    else:
+        value = (_spread(lng_index) << 1) | _spread(lat_index)
+
+    chars = []
+    for _ in range(precision):
+        chars.append(GEOHASH_ALPHABET[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+def _spread_array(values):
+    # _spread() over an array of cell indexes
+    values = values.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+def geohash_values(latitudes, longitudes, precision):
+    """
+    geohash_value() of the geohashes of many locations, vectorized
+
+    Args:
+        latitudes (numpy.ndarray): Latitudes in degrees
+        longitudes (numpy.ndarray): Longitudes in degrees
+        precision (int): Geohash length
+
+    Returns:
+        numpy.ndarray: int64 geohash values, equal to
+        geohash_value(encode_geohash(lat, lng, precision))
+    """
+    lng_bits, lat_bits = _cell_bits(precision)
+    lat_index = np.minimum(((np.clip(latitudes, -90.0, 90.0) + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64),
+                           (1 << lat_bits) - 1)
+    lng_index = np.minimum(((np.clip(longitudes, -180.0, 180.0) + 180.0) / 360.0 * (1 << lng_bits)).astype(np.int64),
+                           (1 << lng_bits) - 1)
+    if lng_bits > lat_bits:
+        values = _spread_array(lng_index) | (_spread_array(lat_index) << np.uint64(1))
+    else:
+        values = (_spread_array(lng_index) << np.uint64(1)) | _spread_array(lat_index)
+    return values.astype(np.int64)
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """
+    Geohash of a location
+
+    Args:
+        latitude (float): Latitude in degrees
+        longitude (float): Longitude in degrees
+        precision (int): Number of characters
+
+    Returns:
+        str: Geohash; its prefixes are the enclosing coarser cells
+    """
+    lng_bits, lat_bits = _cell_bits(precision)
+    lat_index = _cell_index(max(-90.0, min(90.0, latitude)), -90.0, 180.0, lat_bits)
+    lng_index = _cell_index(max(-180.0, min(180.0, longitude)), -180.0, 360.0, lng_bits)
+    return _geohash(lat_index, lng_index, precision)
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    Smallest latitude/longitude box containing a circle on the sphere
+
+    Args:
+        latitude (float): Center latitude in degrees
+        longitude (float): Center longitude in degrees
+        radius_km (float): Circle radius in kilometers
+
+    Returns:
+        tuple: (min_lat, max_lat, min_lng, max_lng); longitudes may lie
+        outside -180..180 when the box crosses the antimeridian, and span
+        the full circle when it contains a pole
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    dlat = math.degrees(angle)
+    min_lat, max_lat = latitude - dlat, latitude + dlat
+    if min_lat <= -90.0 or max_lat >= 90.0 or angle >= math.pi / 2:
+        return max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0
+
+    # Widest longitude reached by the circle, at the tangent points
+    dlng = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(latitude)))))
+    return min_lat, max_lat, longitude - dlng, longitude + dlng
+
+def covering_cells(latitude, longitude, radius_km, precision, limit=None):
+    """
+    Geohash cells of a precision that together cover a circle
+
+    Args:
+        latitude (float): Center latitude in degrees
+        longitude (float): Center longitude in degrees
+        radius_km (float): Circle radius in kilometers
+        precision (int): Geohash length of the cells
+        limit (int, optional): Give up and return None beyond this many cells
+
+    Returns:
+        list: Geohashes of the cells intersecting the circle's bounding box
+    """
+    lng_bits, lat_bits = _cell_bits(precision)
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, radius_km)
+
+    first_row = _cell_index(min_lat, -90.0, 180.0, lat_bits)
+    last_row = _cell_index(max_lat, -90.0, 180.0, lat_bits)
+    columns = 1 << lng_bits
+    if max_lng - min_lng >= 360.0:
+        first_column, column_count = 0, columns
+    else:
+        # Column indexes wrap around the antimeridian
+        first_column = int(math.floor((min_lng + 180.0) / 360.0 * columns))
+        column_count = int(math.floor((max_lng + 180.0) / 360.0 * columns)) - first_column + 1
+
+    if limit is not None and (last_row - first_row + 1) * column_count > limit:
+        return None
+    return [
+        _geohash(row, (first_column + offset) % columns, precision)
+        for row in range(first_row, last_row + 1)
+        for offset in range(column_count)
+    ]
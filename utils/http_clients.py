@@ -0,0 +1,133 @@
+import os
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from app import app
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 10   # keep-alive connections per host and session
+
+_lock = threading.Lock()
+_sessions = {}
+_vision_clients = {}
+_request_counts = {}
+_pid = os.getpid()
+
+def _reset_after_fork():
+    # Sockets and gRPC channels inherited from the gunicorn master must not be
+    # shared with the worker, so every child builds its own clients
+    global _lock, _pid
+    _lock = threading.Lock()
+    _sessions.clear()
+    _vision_clients.clear()
+    _request_counts.clear()
+    _pid = os.getpid()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _check_pid():
+    # Fallback for fork paths that skip the at-fork hooks
+    if _pid != os.getpid():
+        _reset_after_fork()
+
+def get_session(name):
+    """
+    Get the shared keep-alive HTTP session for an upstream service
+
+    Sessions pool their TCP/TLS connections, so repeated calls to the same
+    Google endpoint skip the connection setup.
+
+    Args:
+        name (str): Upstream service name, e.g. 'maps' or 'vision'
+
+    Returns:
+        requests.Session: Process-wide session for the service
+    """
+    _check_pid()
+    session = _sessions.get(name)
+    if session is not None:
+        return session
+
+    with _lock:
+        session = _sessions.get(name)
+        if session is None:
+            pool_size = app.config.get('HTTP_POOL_SIZE', DEFAULT_POOL_SIZE)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.hooks['response'].append(_count_request(name))
+
+            _sessions[name] = session
+            _request_counts[name] = 0
+    return session
+
+def _count_request(name):
+    def hook(response, *args, **kwargs):
+        _request_counts[name] = _request_counts.get(name, 0) + 1
+        return response
+    return hook
+
+def get_vision_client(credentials_file=None):
+    """
+    Get the shared Google Cloud Vision client
+
+    Building an ImageAnnotatorClient sets up credentials and a gRPC channel,
+    so one client is reused for the lifetime of the worker process.
+
+    Args:
+        credentials_file (str, optional): Service account JSON file, application
+            default credentials are used when omitted
+
+    Returns:
+        ImageAnnotatorClient: Process-wide Vision client
+    """
+    _check_pid()
+    client = _vision_clients.get(credentials_file)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _vision_clients.get(credentials_file)
+        if client is None:
+            from google.cloud import vision
+
+            if credentials_file:
+                client = vision.ImageAnnotatorClient.from_service_account_json(credentials_file)
+            else:
+                client = vision.ImageAnnotatorClient()
+            _vision_clients[credentials_file] = client
+            logger.info("Created shared Google Vision client")
+    return client
+
+def get_connection_stats():
+    """
+    Report connection reuse for the shared HTTP sessions
+
+    Returns:
+        dict: Per session request count, opened connections and reuse ratio
+    """
+    stats = {}
+    for name, session in list(_sessions.items()):
+        connections = 0
+        pool_requests = 0
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+                    pool_requests += pool.num_requests
+
+        reused = max(pool_requests - connections, 0)
+        stats[name] = {
+            'requests': _request_counts.get(name, 0),
+            'connections_opened': connections,
+            'connections_reused': reused,
+            'reuse_ratio': round(reused / pool_requests, 4) if pool_requests else 0.0
+        }
+    return stats
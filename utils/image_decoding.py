@@ -0,0 +1,144 @@
+import io
+import hashlib
+from collections import namedtuple
+from PIL import Image, ImageOps
+from utils.color_features import load_thumbnail
+
+# This module is all the bulk decode processes import, so it must not pull
+# in the app, the models or Flask; keep its imports to PIL and NumPy
+
+# dHash compares horizontally adjacent pixels of a 9x8 grayscale thumbnail
+HASH_WIDTH = 9
+HASH_HEIGHT = 8
+
+THUMBNAIL_QUALITY = 80
+
+# content: bytes to send upstream; image: decoded, upright RGB image for the
+# local classifiers; original_bytes/bytes_saved/original_size: size accounting
+PreparedImage = namedtuple('PreparedImage', ['content', 'image', 'original_bytes', 'bytes_saved', 'original_size'])
+
+def decode_prepared(content, max_dimension, quality):
+    """
+    Decode an upload, turn it upright, shrink it and re-encode it as JPEG
+
+    JPEGs are decoded in draft mode, so libjpeg only produces about the
+    pixels that are kept. The original bytes are kept when the image needed
+    neither rotating nor resizing and re-encoding would not make it smaller.
+
+    Args:
+        content: Raw image, as bytes or a seekable binary file object
+        max_dimension (int): Longest side in pixels
+        quality (int): JPEG quality
+
+    Returns:
+        PreparedImage: Bytes to upload plus the decoded image
+    """
+    if hasattr(content, 'read'):
+        original_bytes = content.seek(0, io.SEEK_END)
+        content.seek(0)
+        image = Image.open(content)
+    else:
+        original_bytes = len(content)
+        image = Image.open(io.BytesIO(content))
+    original_size = image.size
+    if image.format == 'JPEG':
+        image.draft('RGB', (max_dimension, max_dimension))
+
+    orientation = image.getexif().get(ImageOps.ExifTags.Base.Orientation, 1)
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    image.thumbnail((max_dimension, max_dimension))
+
+    # Small, upright images only get re-encoded when that actually pays off
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality, optimize=True)
+    prepared = buffer.getvalue()
+    unchanged = image.size == original_size and orientation == 1
+    if unchanged and len(prepared) >= original_bytes:
+        if hasattr(content, 'read'):
+            content.seek(0)
+            prepared = content.read()
+        else:
+            prepared = content
+
+    return PreparedImage(prepared, image, original_bytes, original_bytes - len(prepared), original_size)
+
+def make_thumbnail(image, size):
+    """
+    Square thumbnail of an image, cropped to fill it
+
+    Args:
+        image: A PIL Image, or a seekable binary file object to decode
+        size (int): Side of the thumbnail in pixels
+
+    Returns:
+        PIL.Image: RGB thumbnail
+    """
+    if not isinstance(image, Image.Image):
+        image.seek(0)
+        image = Image.open(image)
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+    return ImageOps.fit(image.convert('RGB'), (size, size))
+
+def compute_dhash(image):
+    """
+    Compute a 64-bit difference hash of an image
+
+    Resized and re-encoded copies of the same photo produce hashes that
+    differ in only a few bits, unlike a hash of the raw bytes.
+
+    Args:
+        image: Raw image bytes, a file object or a PIL Image
+
+    Returns:
+        int: Unsigned 64-bit perceptual hash
+    """
+    if isinstance(image, (bytes, bytearray)):
+        image = io.BytesIO(image)
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+        # Let the JPEG decoder skip most of the work, we only need a thumbnail
+        image.draft('L', (HASH_WIDTH * 8, HASH_HEIGHT * 8))
+
+    pixels = list(image.convert('L').resize((HASH_WIDTH, HASH_HEIGHT), Image.BILINEAR).getdata())
+
+    value = 0
+    for row in range(HASH_HEIGHT):
+        offset = row * HASH_WIDTH
+        for col in range(HASH_WIDTH - 1):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def decode_image(content, max_dimension, quality, thumbnail_size=None):
+    """
+    CPU-bound part of classifying one bulk upload image, run in the decode
+    process pool
+
+    Args:
+        content (bytes): Raw image bytes
+        max_dimension (int): Longest side of the image sent to Vision
+        quality (int): JPEG quality of the image sent to Vision
+        thumbnail_size (int, optional): Side of the image store thumbnail
+            to make from the already decoded image
+
+    Returns:
+        tuple: (content_hash, prepared_bytes, thumbnail_pixels, fingerprint,
+        store_thumbnail) where store_thumbnail is JPEG bytes, or None
+        without a thumbnail_size
+    """
+    content_hash = hashlib.sha256(content).hexdigest()
+    prepared = decode_prepared(content, max_dimension, quality)
+
+    store_thumbnail = None
+    if thumbnail_size:
+        buffer = io.BytesIO()
+        make_thumbnail(prepared.image, thumbnail_size).save(buffer, format='JPEG', quality=THUMBNAIL_QUALITY)
+        store_thumbnail = buffer.getvalue()
+
+    return (
+        content_hash,
+        prepared.content,
+        load_thumbnail(prepared.image),
+        compute_dhash(prepared.image),
+        store_thumbnail
+    )
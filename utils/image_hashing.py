@@ -0,0 +1,489 @@
+import os
+import json
+import time
+import logging
+import threading
+from functools import lru_cache
+from itertools import combinations
+from datetime import datetime, timedelta
+import numpy as np
+from flask import current_app
+from app import app, db
+from models import ImageFingerprint
+from utils.image_decoding import compute_dhash
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+
+# The 64-bit hash is split into 16-bit chunks for multi-index hashing
+CHUNK_BITS = 16
+CHUNK_COUNT = HASH_BITS // CHUNK_BITS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+DEFAULT_MAX_DISTANCE = 6        # Hamming distance still treated as the same photo
+DEFAULT_REFRESH_INTERVAL = 30   # seconds between pulls of other workers' fingerprints
+DEFAULT_TTL = 180 * 24 * 3600   # seconds a fingerprint stays reusable
+DEFAULT_MAX_ROWS = 1000000      # fingerprints kept per namespace
+
+# Hashes added since the chunk tables were built are verified by a linear
+# scan; past this many the next refresh rebuilds the tables
+COMPACT_THRESHOLD = 4096
+
+# When the probed buckets hold more than 1/FULL_SCAN_RATIO of all hashes,
+# scanning every hash is cheaper than gathering the buckets
+FULL_SCAN_RATIO = 4
+
+# Seconds between passes that delete expired fingerprints
+PRUNE_INTERVAL = 3600
+
+# Bits set per byte value, for NumPy versions without bitwise_count
+_BYTE_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+def hamming_distance(hash1, hash2):
+    """Number of differing bits between two hashes"""
+    return (hash1 ^ hash2).bit_count()
+
+def to_signed(value):
+    """Map an unsigned 64-bit hash onto the signed range of a BigInteger column"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+def to_unsigned(value):
+    """Inverse of to_signed"""
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+@lru_cache(maxsize=None)
+def _variant_masks(radius):
+    # XOR masks turning a chunk into every chunk within `radius` bits of it
+    masks = [0]
+    for distance in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), distance):
+            masks.append(sum(1 << bit for bit in bits))
+    return np.array(masks, dtype=np.int64)
+
+def popcount(values):
+    """
+    Count the set bits of each element
+
+    Args:
+        values (numpy.ndarray): uint64 array
+
+    Returns:
+        numpy.ndarray: Bit counts
+    """
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return _BYTE_POPCOUNT[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+class HammingIndex:
+    """
+    Multi-index hashing structure for Hamming radius queries on 64-bit hashes.
+
+    Each hash is split into four 16-bit chunks with one table per chunk. By
+    the pigeonhole principle two hashes within distance r share at least one
+    chunk within distance r // 4, so a query only verifies the hashes in a
+    handful of buckets. Hashes and their integer values live in NumPy arrays
+    and each table is one array of positions sorted by chunk value plus
+    bucket offsets, so a million hashes take tens of megabytes instead of a
+    Python object each. Candidates are verified with one vectorized XOR and
+    popcount, which keeps the large buckets of skewed hash distributions
+    cheap. Hashes added after the tables were built are scanned linearly
+    until compacted() rebuilds them.
+    """
+
+    def __init__(self, hashes=None, values=None):
+        """
+        Build the index over existing hashes
+
+        Args:
+            hashes (numpy.ndarray, optional): uint64 hashes
+            values (numpy.ndarray, optional): int64 value per hash
+        """
+        hashes = np.zeros(0, dtype=np.uint64) if hashes is None else np.asarray(hashes, dtype=np.uint64)
+        values = np.zeros(0, dtype=np.int64) if values is None else np.asarray(values, dtype=np.int64)
+        self._size = self._indexed = len(hashes)
+        self._hashes = np.empty(max(self._size, 1024), dtype=np.uint64)
+        self._values = np.empty(len(self._hashes), dtype=np.int64)
+        self._hashes[:self._size] = hashes
+        self._values[:self._size] = values
+
+        self._orders = []
+        self._offsets = []
+        for index in range(CHUNK_COUNT):
+            chunks = ((hashes >> np.uint64(index * CHUNK_BITS)) & np.uint64(CHUNK_MASK)).astype(np.int64)
+            self._orders.append(np.argsort(chunks, kind='stable').astype(np.uint32))
+            offsets = np.zeros(CHUNK_MASK + 2, dtype=np.int64)
+            np.cumsum(np.bincount(chunks, minlength=CHUNK_MASK + 1), out=offsets[1:])
+            self._offsets.append(offsets)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def pending(self):
+        """Number of hashes added since the chunk tables were built"""
+        return self._size - self._indexed
+
+    def add(self, value_hash, value):
+        """
+        Add a hash to the index
+
+        Args:
+            value_hash (int): Unsigned 64-bit hash
+            value (int): Value returned by search()
+        """
+        self.add_many(np.array([value_hash], dtype=np.uint64), np.array([value], dtype=np.int64))
+
+    def add_many(self, hashes, values):
+        """
+        Add hashes to the index
+
+        Args:
+            hashes (numpy.ndarray): uint64 hashes
+            values (numpy.ndarray): int64 value per hash
+        """
+        size = self._size + len(hashes)
+        if size > len(self._hashes):
+            capacity = max(size, 2 * len(self._hashes))
+            self._hashes = np.resize(self._hashes, capacity)
+            self._values = np.resize(self._values, capacity)
+        self._hashes[self._size:size] = hashes
+        self._values[self._size:size] = values
+        self._size = size
+
+    def entries(self, start=0):
+        """
+        Hashes and values from position `start` on
+
+        Returns:
+            tuple: (hashes, values) arrays
+        """
+        return self._hashes[start:self._size].copy(), self._values[start:self._size].copy()
+
+    def compacted(self, min_value=None):
+        """
+        Build a new index with every hash in the chunk tables
+
+        Args:
+            min_value (int, optional): Leave out hashes with a smaller value
+
+        Returns:
+            HammingIndex: The new index
+        """
+        hashes, values = self.entries()
+        if min_value is not None:
+            keep = values >= min_value
+            hashes, values = hashes[keep], values[keep]
+        return HammingIndex(hashes, values)
+
+    def search(self, query_hash, max_distance):
+        """
+        Find the closest stored hash within a Hamming radius
+
+        Args:
+            query_hash (int): Unsigned 64-bit hash
+            max_distance (int): Largest accepted Hamming distance
+
+        Returns:
+            tuple: (distance, value) of the closest match, or None
+        """
+        masks = _variant_masks(max_distance // CHUNK_COUNT)
+        candidates = []
+        total = 0
+        for index in range(CHUNK_COUNT):
+            chunk = (query_hash >> (index * CHUNK_BITS)) & CHUNK_MASK
+            variants = masks ^ chunk
+            offsets = self._offsets[index]
+            order = self._orders[index]
+            for start, end in zip(offsets[variants].tolist(), offsets[variants + 1].tolist()):
+                if end > start:
+                    candidates.append(order[start:end])
+                    total += end - start
+
+        if total * FULL_SCAN_RATIO > self._indexed:
+            positions = np.arange(self._size)
+        else:
+            candidates.append(np.arange(self._indexed, self._size, dtype=np.uint32))
+            positions = np.concatenate(candidates)
+        if not len(positions):
+            return None
+
+        distances = popcount(self._hashes[positions] ^ np.uint64(query_hash))
+        best = int(distances.argmin())
+        distance = int(distances[best])
+        if distance > max_distance:
+            return None
+        return distance, int(self._values[positions[best]])
+
+class NearDuplicateIndex:
+    """
+    Process-wide near-duplicate lookup backed by the ImageFingerprint table.
+
+    The in-memory index keeps only each fingerprint's hash and row id; the
+    result of a match is read from its row. Indexes are loaded per
+    classifier namespace on a background thread, so the first lookups miss
+    instead of waiting for the table, and the same thread pulls fingerprints
+    written by other workers every `refresh_interval` seconds. Fingerprints
+    older than `ttl` or beyond the newest `max_rows` are deleted every
+    PRUNE_INTERVAL seconds and dropped from memory when the index is rebuilt.
+    """
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, refresh_interval=DEFAULT_REFRESH_INTERVAL,
+                 ttl=DEFAULT_TTL, max_rows=DEFAULT_MAX_ROWS):
+        self.max_distance = max_distance
+        self.refresh_interval = refresh_interval
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._indexes = {}
+        self._last_ids = {}
+        self._local_ids = {}
+        self._refreshed_at = {}
+        self._pruned_at = {}
+        self._refreshing = set()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'pruned': 0}
+
+    def lookup(self, namespace, fingerprint):
+        """
+        Find the classification of a previously seen near-duplicate image
+
+        Args:
+            namespace (str): Classifier the result belongs to
+            fingerprint (int): Perceptual hash of the image
+
+        Returns:
+            The stored result, or None when no image is close enough
+        """
+        index = self._get_index(namespace)
+        with self._lock:
+            match = index.search(fingerprint, self.max_distance)
+
+        result = None
+        if match is not None:
+            distance, row_id = match
+            result = self._read(row_id)
+
+        with self._lock:
+            self._stats['misses' if result is None else 'hits'] += 1
+        if result is not None:
+            logger.info(f"Near-duplicate image found at Hamming distance {distance}")
+        return result
+
+    def remember(self, namespace, fingerprint, result):
+        """
+        Store the classification of an image for future near-duplicate lookups
+
+        Args:
+            namespace (str): Classifier the result belongs to
+            fingerprint (int): Perceptual hash of the image
+            result: JSON serializable classification result
+        """
+        self._get_index(namespace)
+        table = ImageFingerprint.__table__
+        try:
+            with db.engine.begin() as conn:
+                row_id = conn.execute(db.insert(table).values(
+                    namespace=namespace,
+                    dhash=to_signed(fingerprint),
+                    result=json.dumps(result),
+                    created_at=datetime.utcnow()
+                )).inserted_primary_key[0]
+        except Exception as e:
+            logger.error(f"Error storing image fingerprint: {str(e)}")
+            return
+
+        with self._lock:
+            # A refresh running meanwhile may have indexed the row already
+            if row_id > self._last_ids[namespace]:
+                # The index may have been swapped for a rebuilt one as well
+                self._indexes[namespace].add(fingerprint, row_id)
+                # The next refresh must not index this row a second time
+                self._local_ids[namespace].add(row_id)
+            self._stats['stores'] += 1
+
+    def warm(self, namespace):
+        """
+        Start loading a namespace's fingerprints in the background
+
+        Args:
+            namespace (str): Classifier namespace
+        """
+        self._get_index(namespace)
+
+    def prune(self, namespace):
+        """
+        Delete a namespace's fingerprints older than `ttl` or beyond `max_rows`
+
+        Args:
+            namespace (str): Classifier namespace
+
+        Returns:
+            tuple: (rows deleted, smallest remaining row id or None)
+        """
+        table = ImageFingerprint.__table__
+        in_namespace = table.c.namespace == namespace
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+        deleted = 0
+        min_id = None
+        try:
+            with db.engine.begin() as conn:
+                deleted += conn.execute(db.delete(table).where(in_namespace, table.c.created_at < cutoff)).rowcount
+
+                # Oldest rows beyond the size limit are evicted first
+                overflow_id = conn.execute(
+                    db.select(table.c.id).where(in_namespace)
+                    .order_by(table.c.id.desc())
+                    .offset(self.max_rows)
+                    .limit(1)
+                ).scalar()
+                if overflow_id is not None:
+                    deleted += conn.execute(db.delete(table).where(in_namespace, table.c.id <= overflow_id)).rowcount
+
+                min_id = conn.execute(db.select(db.func.min(table.c.id)).where(in_namespace)).scalar()
+        except Exception as e:
+            logger.error(f"Error pruning image fingerprints: {str(e)}")
+
+        if deleted:
+            with self._lock:
+                self._stats['pruned'] += deleted
+        return deleted, min_id
+
+    def stats(self):
+        """
+        Get lookup counters for monitoring
+
+        Returns:
+            dict: Hit/miss counters and indexed fingerprint count
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = sum(len(index) for index in self._indexes.values())
+            stats['loading'] = len(self._refreshing)
+        return stats
+
+    def _get_index(self, namespace):
+        now = time.time()
+        with self._lock:
+            if self._pid != os.getpid():
+                # Loader threads do not survive a fork
+                self._refreshing.clear()
+                self._pid = os.getpid()
+
+            index = self._indexes.get(namespace)
+            if index is None:
+                index = self._indexes[namespace] = HammingIndex()
+                self._last_ids[namespace] = 0
+                self._local_ids[namespace] = set()
+                self._pruned_at[namespace] = 0
+            elif now - self._refreshed_at[namespace] < self.refresh_interval or namespace in self._refreshing:
+                return index
+            self._refreshed_at[namespace] = now
+            self._refreshing.add(namespace)
+
+        threading.Thread(target=self._refresh, args=(namespace,), daemon=True,
+                         name=f'near-duplicates-{namespace}').start()
+        return index
+
+    def _refresh(self, namespace):
+        try:
+            with app.app_context():
+                self._pull(namespace)
+        except Exception as e:
+            logger.error(f"Error refreshing near-duplicate index: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(namespace)
+
+    def _pull(self, namespace):
+        min_id = None
+        if time.time() - self._pruned_at[namespace] >= PRUNE_INTERVAL:
+            self._pruned_at[namespace] = time.time()
+            deleted, min_id = self.prune(namespace)
+            if not deleted:
+                min_id = None
+
+        with self._lock:
+            last_id = self._last_ids[namespace]
+        row_ids, hashes = self._load(namespace, last_id)
+
+        with self._lock:
+            index = self._indexes[namespace]
+            if len(row_ids):
+                self._last_ids[namespace] = max(self._last_ids[namespace], int(row_ids[-1]))
+            local_ids = self._local_ids[namespace]
+            if local_ids and len(row_ids):
+                # Rows written by this process were indexed by remember()
+                known = np.isin(row_ids, np.fromiter(local_ids, dtype=np.int64, count=len(local_ids)))
+                local_ids.difference_update(row_ids[known].tolist())
+                row_ids, hashes = row_ids[~known], hashes[~known]
+            index.add_many(hashes, row_ids)
+            if index.pending < COMPACT_THRESHOLD and min_id is None:
+                return
+            snapshot = len(index)
+
+        # Rebuild the chunk tables without holding the lock, then add what
+        # remember() stored meanwhile and swap the indexes
+        rebuilt = index.compacted(min_value=min_id)
+        with self._lock:
+            rebuilt.add_many(*index.entries(snapshot))
+            self._indexes[namespace] = rebuilt
+
+    def _load(self, namespace, last_id, batch_size=50000):
+        table = ImageFingerprint.__table__
+        row_ids = []
+        hashes = []
+        try:
+            with db.engine.connect() as conn:
+                while True:
+                    rows = conn.execute(
+                        db.select(table.c.id, table.c.dhash)
+                        .where(table.c.namespace == namespace, table.c.id > last_id)
+                        .order_by(table.c.id)
+                        .limit(batch_size)
+                    ).all()
+                    for row_id, value_hash in rows:
+                        row_ids.append(row_id)
+                        hashes.append(value_hash)
+                    if rows:
+                        last_id = rows[-1].id
+                    if len(rows) < batch_size:
+                        break
+        except Exception as e:
+            logger.error(f"Error loading image fingerprints: {str(e)}")
+        # Signed column values reinterpreted as unsigned, like to_unsigned()
+        return np.array(row_ids, dtype=np.int64), np.array(hashes, dtype=np.int64).view(np.uint64)
+
+    def _read(self, row_id):
+        table = ImageFingerprint.__table__
+        try:
+            with db.engine.connect() as conn:
+                text = conn.execute(db.select(table.c.result).where(table.c.id == row_id)).scalar()
+        except Exception as e:
+            logger.error(f"Error reading image fingerprint: {str(e)}")
+            return None
+        # Pruned since it was indexed
+        return json.loads(text) if text is not None else None
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_near_duplicate_index():
+    """
+    Get the process-wide near-duplicate index, configured from the app config
+
+    Returns:
+        NearDuplicateIndex: Shared index instance
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                config = current_app.config
+                _index = NearDuplicateIndex(
+                    max_distance=config.get('NEAR_DUPLICATE_MAX_DISTANCE', DEFAULT_MAX_DISTANCE),
+                    refresh_interval=config.get('NEAR_DUPLICATE_REFRESH_INTERVAL', DEFAULT_REFRESH_INTERVAL),
+                    ttl=config.get('NEAR_DUPLICATE_TTL', DEFAULT_TTL),
+                    max_rows=config.get('NEAR_DUPLICATE_MAX_ROWS', DEFAULT_MAX_ROWS)
+                )
+    return _index
@@ -0,0 +1,63 @@
+import logging
+import threading
+from flask import current_app
+from utils.image_decoding import decode_prepared
+
+logger = logging.getLogger(__name__)
+
+# Label detection gains nothing from more pixels than this on the longest side
+DEFAULT_MAX_DIMENSION = 1024
+DEFAULT_JPEG_QUALITY = 85
+
+_stats_lock = threading.Lock()
+_stats = {'images': 0, 'resized': 0, 'original_bytes': 0, 'sent_bytes': 0}
+
+def prepare_image(content, max_dimension=None, quality=None):
+    """
+    Normalize an upload before it is sent to Vision and the local classifiers
+
+    The image is decoded once (JPEGs in draft mode, so libjpeg only produces
+    about the pixels that are kept), rotated according to its EXIF
+    orientation, reduced to `max_dimension` on its longest side and
+    re-encoded as JPEG. The original bytes are kept when the image needed
+    neither rotating nor resizing and re-encoding would not make it smaller.
+
+    Args:
+        content: Raw uploaded image, as bytes or a seekable binary file
+            object (decoded in place, without reading it into memory first)
+        max_dimension (int, optional): Longest side in pixels (default: VISION_MAX_DIMENSION)
+        quality (int, optional): JPEG quality (default: VISION_JPEG_QUALITY)
+
+    Returns:
+        PreparedImage: Bytes to upload plus the decoded image
+    """
+    if max_dimension is None:
+        max_dimension = current_app.config.get('VISION_MAX_DIMENSION', DEFAULT_MAX_DIMENSION)
+    if quality is None:
+        quality = current_app.config.get('VISION_JPEG_QUALITY', DEFAULT_JPEG_QUALITY)
+
+    prepared = decode_prepared(content, max_dimension, quality)
+
+    with _stats_lock:
+        _stats['images'] += 1
+        _stats['resized'] += prepared.image.size != prepared.original_size
+        _stats['original_bytes'] += prepared.original_bytes
+        _stats['sent_bytes'] += len(prepared.content)
+
+    if prepared.bytes_saved > 0:
+        logger.debug(f"Preprocessed image {prepared.original_size} -> {prepared.image.size}, "
+                     f"saved {prepared.bytes_saved} bytes")
+
+    return prepared
+
+def get_preprocessing_stats():
+    """
+    Byte accounting of all images prepared by this process
+
+    Returns:
+        dict: Image count, resized count, bytes received, bytes sent and bytes saved
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['bytes_saved'] = stats['original_bytes'] - stats['sent_bytes']
+    return stats
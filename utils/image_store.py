@@ -0,0 +1,195 @@
+import io
+import os
+import re
+import shutil
+import logging
+import tempfile
+import threading
+from functools import lru_cache
+from flask import current_app
+from utils.classification_cache import hash_image_content
+from utils.image_decoding import THUMBNAIL_QUALITY, make_thumbnail
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THUMBNAIL_SIZE = 256
+
+ORIGINALS_DIR = 'originals'
+THUMBNAILS_DIR = 'thumbnails'
+
+CONTENT_HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Stored images are served under /images/<content_hash>
+IMAGE_URL_PREFIX = '/images/'
+
+class ImageStore:
+    """
+    Content-addressed storage for uploaded images.
+
+    Every image is stored once under its SHA-256, in directories sharded by
+    the first two byte pairs of the hash (originals/ab/cd/abcd...), so
+    identical uploads share one file. A square JPEG thumbnail is generated
+    when an image is first stored. Files are written to a temporary name and
+    renamed into place, and the thumbnail is written before the original, so
+    an existing original always has its thumbnail.
+    """
+
+    def __init__(self, root, thumbnail_size=DEFAULT_THUMBNAIL_SIZE):
+        self.root = root
+        self.thumbnail_size = thumbnail_size
+
+    def path(self, content_hash, thumbnail=False):
+        """
+        Location of a stored image
+
+        Args:
+            content_hash (str): SHA-256 of the image
+            thumbnail (bool): Whether to return the thumbnail's path
+
+        Returns:
+            str: Path of the file (which may not exist)
+        """
+        if thumbnail:
+            return os.path.join(self.root, THUMBNAILS_DIR, content_hash[:2], content_hash[2:4], content_hash + '.jpg')
+        return os.path.join(self.root, ORIGINALS_DIR, content_hash[:2], content_hash[2:4], content_hash)
+
+    def exists(self, content_hash):
+        """
+        Whether an image is stored
+
+        Args:
+            content_hash (str): SHA-256 of the image
+
+        Returns:
+            bool: True if the original is stored
+        """
+        return os.path.exists(self.path(content_hash))
+
+    def put(self, image, content_hash=None, decoded=None, thumbnail=None):
+        """
+        Store an image unless an identical one is already stored
+
+        Args:
+            image: Raw image bytes or a seekable binary file object
+            content_hash (str, optional): SHA-256 of the image, if already known
+            decoded (PIL.Image, optional): Upright decoded copy of the image
+                to make the thumbnail from, saving a second decode
+            thumbnail (bytes, optional): JPEG thumbnail already made with
+                make_thumbnail(), e.g. by a decode process
+
+        Returns:
+            str: The image's content hash
+        """
+        if isinstance(image, (bytes, bytearray)):
+            image = io.BytesIO(image)
+        if content_hash is None:
+            content_hash = hash_image_content(image)
+
+        if self.exists(content_hash):
+            return content_hash
+
+        if thumbnail is not None:
+            self._write(self.path(content_hash, thumbnail=True), lambda f: f.write(thumbnail))
+        else:
+            self._write(self.path(content_hash, thumbnail=True),
+                        lambda f: make_thumbnail(decoded or image, self.thumbnail_size)
+                        .save(f, format='JPEG', quality=THUMBNAIL_QUALITY))
+
+        image.seek(0)
+        self._write(self.path(content_hash), lambda f: shutil.copyfileobj(image, f, 64 * 1024))
+        image.seek(0)
+
+        logger.info(f"Stored image {content_hash[:12]}")
+        return content_hash
+
+    def _write(self, path, write):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+@lru_cache(maxsize=4096)
+def sniff_mimetype(path):
+    """
+    Detect the MIME type of a stored image from its header
+
+    Stored files carry no extension, and the content of a path never
+    changes, so results are cached.
+
+    Args:
+        path (str): Path of the stored image
+
+    Returns:
+        str: MIME type, application/octet-stream if unknown
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            return Image.MIME.get(image.format, 'application/octet-stream')
+    except Exception:
+        return 'application/octet-stream'
+
+def image_url(content_hash, thumbnail=False):
+    """
+    URL a stored image is served at
+
+    Built without url_for() so background workers can use it outside a
+    request.
+
+    Args:
+        content_hash (str): SHA-256 of the image
+        thumbnail (bool): Whether to return the thumbnail's URL
+
+    Returns:
+        str: Path of the image on this site
+    """
+    url = IMAGE_URL_PREFIX + content_hash
+    return url + '/thumbnail' if thumbnail else url
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_image_store():
+    """
+    Get the image store configured for this app
+
+    Returns:
+        ImageStore: Store rooted at IMAGE_STORE_PATH
+    """
+    config = current_app.config
+    root = config["IMAGE_STORE_PATH"]
+    store = _stores.get(root)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(root)
+            if store is None:
+                store = _stores[root] = ImageStore(
+                    root, thumbnail_size=config.get("IMAGE_THUMBNAIL_SIZE", DEFAULT_THUMBNAIL_SIZE)
+                )
+    return store
+
+def save_upload(image, content_hash=None):
+    """
+    Keep an uploaded image in the image store
+
+    Failures are logged and never fail a classification.
+
+    Args:
+        image: Raw image bytes or a seekable binary file object
+        content_hash (str, optional): SHA-256 of the image, if already known
+
+    Returns:
+        str: URL of the stored image, or None if it could not be stored
+    """
+    try:
+        return image_url(get_image_store().put(image, content_hash))
+    except Exception as e:
+        logger.error(f"Error storing uploaded image: {str(e)}")
+        return None
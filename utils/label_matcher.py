@@ -0,0 +1,211 @@
+import logging
+from bisect import bisect_right
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Joins the labels of one response so they can be scanned in a single pass;
+# it never occurs in a keyword, so no match can span two labels
+LABEL_SEPARATOR = '\x00'
+
+class LabelMatcher:
+    """
+    Maps Vision labels to waste categories with a compiled keyword automaton.
+
+    The keywords are compiled once into an Aho-Corasick automaton, so finding
+    every keyword contained in a label costs one pass over the label no matter
+    how many keywords there are. Exact matches use a plain dict lookup and the
+    reverse check (label contained in a keyword) uses a precomputed index of
+    keyword substrings.
+    """
+
+    def __init__(self, pairs, categories):
+        """
+        Compile the keyword tables
+
+        Args:
+            pairs: Iterable of (keyword, category) pairs; a keyword may be
+                listed under several categories
+            categories: Category names, in the order scores are reported
+        """
+        self.categories = list(categories)
+        self.keywords = []
+        self.keyword_categories = []
+        self.exact = {}
+
+        for keyword, category in pairs:
+            keyword = keyword.lower()
+            keyword_id = self.exact.get(keyword)
+            if keyword_id is None:
+                keyword_id = self.exact[keyword] = len(self.keywords)
+                self.keywords.append(keyword)
+                self.keyword_categories.append([])
+            self.keyword_categories[keyword_id].append(category)
+
+        self._build_automaton()
+        self._substrings = None
+
+    def _build_automaton(self):
+        # Trie of the keywords: transitions per node, failure links and the
+        # keyword ids recognised when a node is reached
+        goto = [{}]
+        outputs = [[]]
+        for keyword_id, keyword in enumerate(self.keywords):
+            node = 0
+            for char in keyword:
+                next_node = goto[node].get(char)
+                if next_node is None:
+                    next_node = len(goto)
+                    goto[node][char] = next_node
+                    goto.append({})
+                    outputs.append([])
+                node = next_node
+            outputs[node].append(keyword_id)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+                outputs[child] = outputs[child] + outputs[fail[child]]
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs = outputs
+
+    def find_keywords(self, labels):
+        """
+        Find the keywords contained in each label, scanning all labels at once
+
+        Args:
+            labels: List of lower-case label strings
+
+        Returns:
+            list: Sorted keyword ids contained in each label
+        """
+        found = [set() for _ in labels]
+        if not labels:
+            return []
+
+        # Offsets where each label starts in the joined text
+        starts = []
+        offset = 0
+        for label in labels:
+            starts.append(offset)
+            offset += len(label) + 1
+
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        node = 0
+        for position, char in enumerate(LABEL_SEPARATOR.join(labels)):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if outputs[node]:
+                found[bisect_right(starts, position) - 1].update(outputs[node])
+
+        return [sorted(keyword_ids) for keyword_ids in found]
+
+    def keywords_containing(self, label):
+        """
+        Keyword ids of every keyword that contains `label`
+
+        Args:
+            label (str): Lower-case label
+
+        Returns:
+            tuple: Keyword ids, in keyword order
+        """
+        if not label:
+            return tuple(range(len(self.keywords)))
+
+        if self._substrings is None:
+            substrings = {}
+            for keyword_id, keyword in enumerate(self.keywords):
+                seen = {keyword[i:j] for i in range(len(keyword)) for j in range(i + 1, len(keyword) + 1)}
+                for substring in seen:
+                    substrings.setdefault(substring, []).append(keyword_id)
+            self._substrings = {key: tuple(value) for key, value in substrings.items()}
+
+        return self._substrings.get(label, ())
+
+    def score(self, labels, partial_weight=0.7):
+        """
+        Score labels preferring exact keyword matches
+
+        A label equal to a keyword adds its full score to the keyword's
+        categories; otherwise every keyword contained in the label adds
+        `partial_weight` times the score.
+
+        Args:
+            labels: List of (description, score) tuples
+            partial_weight (float): Weight of a partial match
+
+        Returns:
+            dict: Summed score per category
+        """
+        scores = {category: 0.0 for category in self.categories}
+        names = [description.lower() for description, _ in labels]
+
+        for (_, score), name, keyword_ids in zip(labels, names, self.find_keywords(names)):
+            keyword_id = self.exact.get(name)
+            if keyword_id is not None:
+                for category in self.keyword_categories[keyword_id]:
+                    scores[category] += score
+                continue
+            for keyword_id in keyword_ids:
+                for category in self.keyword_categories[keyword_id]:
+                    scores[category] += score * partial_weight
+
+        return scores
+
+    def score_bidirectional(self, labels):
+        """
+        Score labels counting every keyword that contains or is contained in them
+
+        Each matching (category, keyword) pair adds the label's full score.
+
+        Args:
+            labels: List of (description, score) tuples
+
+        Returns:
+            dict: Summed score per category
+        """
+        scores = {category: 0.0 for category in self.categories}
+        names = [description.lower() for description, _ in labels]
+
+        for (_, score), name, keyword_ids in zip(labels, names, self.find_keywords(names)):
+            matched = set(keyword_ids)
+            matched.update(self.keywords_containing(name))
+            for keyword_id in matched:
+                for category in self.keyword_categories[keyword_id]:
+                    scores[category] += score
+
+        return scores
+
+    def score_any(self, labels):
+        """
+        Score labels counting each category at most once per label
+
+        A label adds its full score to every category with at least one
+        keyword contained in the label, however many keywords match.
+
+        Args:
+            labels: List of (description, score) tuples
+
+        Returns:
+            dict: Summed score per category
+        """
+        scores = {category: 0.0 for category in self.categories}
+        names = [description.lower() for description, _ in labels]
+
+        for (_, score), keyword_ids in zip(labels, self.find_keywords(names)):
+            matched = {category for keyword_id in keyword_ids for category in self.keyword_categories[keyword_id]}
+            for category in matched:
+                scores[category] += score
+
+        return scores
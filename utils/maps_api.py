@@ -1,12 +1,14 @@
 import os
-import requests
 import logging
 from app import app
+from utils.resilience import get_upstream, CircuitOpenError
+from utils.maps_helper import find_centers_from_db
+from utils.places_cache import get_places_cache, get_place_details_cache
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-def get_nearby_recycling_centers(latitude, longitude, radius=5000, waste_type=None):
+def get_nearby_recycling_centers(latitude, longitude, radius=5000, waste_type=None, details_deadline=None):
     """
     Gets nearby recycling centers using Google Maps API.
     
@@ -15,6 +17,8 @@ def get_nearby_recycling_centers(latitude, longitude, radius=5000, waste_type=No
         longitude: The longitude of the user's location
         radius: Search radius in meters (default: 5000)
         waste_type: Optional filter for specific waste types
+        details_deadline: Seconds to wait for place details (default: PLACE_DETAILS_DEADLINE);
+            centers whose details are not in by then are returned without them
         
     Returns:
         List of dictionaries containing recycling center information
@@ -33,25 +37,35 @@ def get_nearby_recycling_centers(latitude, longitude, radius=5000, waste_type=No
             elif waste_type == "hazardous":
                 keywords = "hazardous waste disposal"
         
+        # While Places is failing, answer from known centers right away
+        places = get_upstream('places')
+        if not places.available():
+            return _centers_from_db(latitude, longitude, radius)
+        
         # Prepare the Places API request
-        url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-        params = {
-            "location": f"{latitude},{longitude}",
-            "radius": radius,
-            "keyword": keywords,
-            "key": api_key
-        }
+        url = f"{app.config['GOOGLE_MAPS_API_BASE_URL']}/place/nearbysearch/json"
         
-        response = requests.get(url, params=params)
-        data = response.json()
+        def search(search_latitude, search_longitude, radius_meters):
+            params = {
+                "location": f"{search_latitude},{search_longitude}",
+                "radius": radius_meters,
+                "keyword": keywords,
+                "key": api_key
+            }
+            
+            response = places.get(url, params=params)
+            data = response.json()
+            
+            if response.status_code != 200 or data.get("status") not in ("OK", "ZERO_RESULTS"):
+                raise Exception(f"Maps API error: {data.get('status')} - {data.get('error_message', 'Unknown error')}")
+            return data.get("results", [])
         
-        if response.status_code != 200 or data.get("status") != "OK":
-            logger.error(f"Maps API error: {data.get('status')} - {data.get('error_message', 'Unknown error')}")
-            return []
+        # Searches are shared by everybody in the same neighbourhood
+        results = get_places_cache().lookup(latitude, longitude, radius / 1000, keywords, search)
         
         # Process the results
         centers = []
-        for place in data.get("results", []):
+        for place in results:
             center = {
                 "id": place.get("place_id"),
                 "name": place.get("name"),
@@ -63,19 +77,69 @@ def get_nearby_recycling_centers(latitude, longitude, radius=5000, waste_type=No
                 "open_now": place.get("opening_hours", {}).get("open_now")
             }
             
-            # Get additional details for each place
-            center_details = get_place_details(center["id"], api_key)
+            centers.append(center)
+        
+        # Get additional details for all places at once
+        details = get_places_details([center["id"] for center in centers if center["id"]], api_key,
+                                     deadline=details_deadline)
+        for center in centers:
+            center_details = details.get(center["id"])
             if center_details:
                 center.update(center_details)
-            
-            centers.append(center)
         
         return centers
     
+    except CircuitOpenError:
+        return _centers_from_db(latitude, longitude, radius)
+    
     except Exception as e:
         logger.error(f"Error fetching recycling centers: {str(e)}")
         return []
 
+def _centers_from_db(latitude, longitude, radius):
+    # Known centers shaped like the Places results above, for when Places
+    # is unavailable; fields only Places knows about are None
+    centers = []
+    for row in find_centers_from_db(latitude, longitude, radius / 1000):
+        centers.append({
+            "id": row["id"],
+            "name": row["name"],
+            "address": row["address"],
+            "latitude": row["latitude"],
+            "longitude": row["longitude"],
+            "rating": None,
+            "types": [],
+            "open_now": None,
+            "phone": row["phone"],
+            "website": row["website"]
+        })
+    return centers
+
+def get_places_details(place_ids, api_key, deadline=None):
+    """
+    Gets additional details for several places, fetched concurrently and
+    cached per place ID.
+    
+    Args:
+        place_ids: Place IDs from the nearby search
+        api_key: Google Maps API key
+        deadline: Seconds to wait for details that are not cached (default:
+            PLACE_DETAILS_DEADLINE); None in the config waits for all of them
+        
+    Returns:
+        Dictionary of place ID to details, for the places whose details
+        were available by the deadline
+    """
+    if deadline is None:
+        deadline = app.config.get('PLACE_DETAILS_DEADLINE')
+    try:
+        return get_place_details_cache().get_many(
+            place_ids, lambda place_id: fetch_place_details(place_id, api_key), deadline
+        )
+    except Exception as e:
+        logger.error(f"Error fetching place details: {str(e)}")
+        return {}
+
 def get_place_details(place_id, api_key):
     """
     Gets additional details for a specific place using the Places API Details endpoint.
@@ -87,36 +151,47 @@ def get_place_details(place_id, api_key):
     Returns:
         Dictionary with additional place details
     """
-    try:
-        url = "https://maps.googleapis.com/maps/api/place/details/json"
-        params = {
-            "place_id": place_id,
-            "fields": "formatted_phone_number,website,opening_hours,formatted_address",
-            "key": api_key
-        }
-        
-        response = requests.get(url, params=params)
-        data = response.json()
-        
-        if response.status_code != 200 or data.get("status") != "OK":
-            return {}
-        
-        result = data.get("result", {})
-        details = {
-            "phone": result.get("formatted_phone_number", ""),
-            "website": result.get("website", ""),
-            "full_address": result.get("formatted_address", "")
-        }
+    return get_places_details([place_id], api_key).get(place_id, {})
+
+def fetch_place_details(place_id, api_key):
+    """
+    Calls the Places API Details endpoint for a place, bypassing the cache.
+    
+    Args:
+        place_id: The place ID from the nearby search
+        api_key: Google Maps API key
         
-        # Process opening hours
-        if "opening_hours" in result and "weekday_text" in result["opening_hours"]:
-            details["hours"] = result["opening_hours"]["weekday_text"]
+    Returns:
+        Dictionary with additional place details
         
-        return details
+    Raises:
+        Exception: If the Places API call fails
+    """
+    url = f"{app.config['GOOGLE_MAPS_API_BASE_URL']}/place/details/json"
+    params = {
+        "place_id": place_id,
+        "fields": "formatted_phone_number,website,opening_hours,formatted_address",
+        "key": api_key
+    }
     
-    except Exception as e:
-        logger.error(f"Error fetching place details: {str(e)}")
-        return {}
+    response = get_upstream('places').get(url, params=params)
+    data = response.json()
+    
+    if response.status_code != 200 or data.get("status") != "OK":
+        raise Exception(f"Place details error: {data.get('status')}")
+    
+    result = data.get("result", {})
+    details = {
+        "phone": result.get("formatted_phone_number", ""),
+        "website": result.get("website", ""),
+        "full_address": result.get("formatted_address", "")
+    }
+    
+    # Process opening hours
+    if "opening_hours" in result and "weekday_text" in result["opening_hours"]:
+        details["hours"] = result["opening_hours"]["weekday_text"]
+    
+    return details
 
 def get_directions(origin_lat, origin_lng, destination_lat, destination_lng, travel_mode="driving"):
     """
@@ -138,7 +213,7 @@ def get_directions(origin_lat, origin_lng, destination_lat, destination_lng, tra
             logger.error("Google Maps API key not found")
             return {}
         
-        url = "https://maps.googleapis.com/maps/api/directions/json"
+        url = f"{app.config['GOOGLE_MAPS_API_BASE_URL']}/directions/json"
         params = {
             "origin": f"{origin_lat},{origin_lng}",
             "destination": f"{destination_lat},{destination_lng}",
@@ -146,7 +221,7 @@ def get_directions(origin_lat, origin_lng, destination_lat, destination_lng, tra
             "key": api_key
         }
         
-        response = requests.get(url, params=params)
+        response = get_upstream('directions').get(url, params=params)
         data = response.json()
         
         if response.status_code != 200 or data.get("status") != "OK":
@@ -180,6 +255,10 @@ def get_directions(origin_lat, origin_lng, destination_lat, destination_lng, tra
             ]
         }
     
+    except CircuitOpenError:
+        logger.warning("Directions API unavailable, circuit open")
+        return {}
+    
     except Exception as e:
         logger.error(f"Error fetching directions: {str(e)}")
         return {}
@@ -1,12 +1,17 @@
 import os
-import math
-import requests
 import logging
 from flask import current_app
 from models import RecyclingCenter, db
+from utils.resilience import get_upstream
+from utils.geo import haversine_distance, encode_geohash
+from utils.center_index import get_center_index
+from utils.places_cache import get_places_cache
 
 logger = logging.getLogger(__name__)
 
+# Places results this close to a known center may be the same center
+DUPLICATE_RADIUS_KM = 0.03
+
 def find_nearby_centers(latitude, longitude, radius=10):
     """
     Find recycling centers near a given location
@@ -23,7 +28,8 @@ def find_nearby_centers(latitude, longitude, radius=10):
         # Try to use Google Maps API if key is available
         api_key = current_app.config["GOOGLE_MAPS_API_KEY"]
         
-        if api_key:
+        # Skip Places while its circuit is open, it would only fail
+        if api_key and get_upstream('places').available():
             return find_centers_google_api(latitude, longitude, radius, api_key)
         else:
             # Fallback to database search
@@ -47,32 +53,39 @@ def find_centers_google_api(latitude, longitude, radius, api_key):
     Returns:
         list: List of nearby recycling centers
     """
-    # Convert radius to meters for Google API
-    radius_meters = radius * 1000
-    
     # Prepare the request URL
-    url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-    params = {
-        "location": f"{latitude},{longitude}",
-        "radius": radius_meters,
-        "keyword": "recycling center",
-        "type": "establishment",
-        "key": api_key
-    }
-    
-    response = requests.get(url, params=params)
-    
-    if response.status_code != 200:
-        raise Exception(f"Google Places API error: {response.status_code}")
+    url = f"{current_app.config['GOOGLE_MAPS_API_BASE_URL']}/place/nearbysearch/json"
+    
+    def search(search_latitude, search_longitude, radius_meters):
+        params = {
+            "location": f"{search_latitude},{search_longitude}",
+            "radius": radius_meters,
+            "keyword": "recycling center",
+            "type": "establishment",
+            "key": api_key
+        }
+        
+        response = get_upstream('places').get(url, params=params)
         
-    data = response.json()
+        if response.status_code != 200:
+            raise Exception(f"Google Places API error: {response.status_code}")
+            
+        data = response.json()
+        
+        if data["status"] != "OK" and data["status"] != "ZERO_RESULTS":
+            raise Exception(f"Google Places API error: {data['status']}")
+        
+        results = data.get("results", [])
+        save_places(results)
+        return results
     
-    if data["status"] != "OK" and data["status"] != "ZERO_RESULTS":
-        raise Exception(f"Google Places API error: {data['status']}")
+    # Searches are shared by everybody in the same neighbourhood
+    places = get_places_cache().lookup(latitude, longitude, radius, "recycling center", search,
+                                       place_type="establishment")
     
     centers = []
     
-    for place in data.get("results", []):
+    for place in places:
         # Extract data from the place result
         center = {
             "name": place["name"],
@@ -85,29 +98,141 @@ def find_centers_google_api(latitude, longitude, radius, api_key):
         }
         
         centers.append(center)
+    
+    return centers
+
+def save_places(places):
+    """
+    Save Places search results as recycling centers for future use
+    
+    All results are written in one transaction: a bulk upsert keyed by
+    place_id inserts new places and updates the name, address and location
+    of known ones when they changed. A new place_id lying within
+    DUPLICATE_RADIUS_KM of a known center (looked up in the center index
+    grid) is taken for that center when the center has no place_id yet or
+    the same name, so coordinates that jitter between searches do not add
+    the center again.
+    
+    Args:
+        places (list): Places nearby-search results
+    """
+    rows = {}
+    for place in places:
+        location = place.get("geometry", {}).get("location", {})
+        if not place.get("place_id") or "lat" not in location or "lng" not in location:
+            continue
+        rows[place["place_id"]] = {
+            "place_id": place["place_id"],
+            "name": place["name"],
+            "address": place.get("vicinity", ""),
+            "latitude": location["lat"],
+            "longitude": location["lng"],
+            # Bulk statements skip the ORM events that set it
+            "geohash": encode_geohash(location["lat"], location["lng"]),
+            "accepted_types": "recyclable,organic,hazardous"  # Default assumption
+        }
+    if not rows:
+        return
+    
+    table = RecyclingCenter.__table__
+    index = get_center_index()
+    try:
+        # Known centers near the places, looked up before the transaction
+        # as the index may load rows itself
+        nearby = {}
+        for place_id, row in rows.items():
+            _, ids = index.within(row["latitude"], row["longitude"], DUPLICATE_RADIUS_KM)
+            if len(ids):
+                nearby[place_id] = ids.tolist()
         
-        # Save to database for future use
-        try:
-            # Check if it already exists
-            existing = RecyclingCenter.query.filter_by(
-                latitude=center["latitude"],
-                longitude=center["longitude"]
-            ).first()
+        with db.engine.begin() as conn:
+            known = set(conn.execute(
+                db.select(table.c.place_id).where(table.c.place_id.in_(list(rows)))
+            ).scalars())
+            
+            candidates = {}
+            candidate_ids = sorted({center_id for place_id, ids in nearby.items() if place_id not in known
+                                    for center_id in ids})
+            if candidate_ids:
+                candidates = {
+                    candidate.id: candidate for candidate in conn.execute(
+                        db.select(table.c.id, table.c.name, table.c.place_id).where(table.c.id.in_(candidate_ids))
+                    )
+                }
+            
+            claims = []
+            claimed = set()
+            for place_id, ids in nearby.items():
+                if place_id in known:
+                    continue
+                name = _normalize_name(rows[place_id]["name"])
+                for center_id in ids:
+                    candidate = candidates.get(center_id)
+                    if candidate is None:
+                        continue
+                    if candidate.place_id is None and center_id not in claimed:
+                        # A center saved before place_ids were stored
+                        claims.append({"center_id": center_id, "new_place_id": place_id})
+                        claimed.add(center_id)
+                        del rows[place_id]
+                        break
+                    if _normalize_name(candidate.name) == name:
+                        # The same center listed twice by Places
+                        del rows[place_id]
+                        break
             
-            if not existing:
-                new_center = RecyclingCenter(
-                    name=center["name"],
-                    address=center["address"],
-                    latitude=center["latitude"],
-                    longitude=center["longitude"],
-                    accepted_types="recyclable,organic,hazardous"  # Default assumption
+            if claims:
+                conn.execute(
+                    db.update(table)
+                    .where(table.c.id == db.bindparam("center_id"), table.c.place_id.is_(None))
+                    .values(place_id=db.bindparam("new_place_id")),
+                    claims
                 )
-                db.session.add(new_center)
-                db.session.commit()
-        except Exception as e:
-            logger.error(f"Error saving recycling center to database: {str(e)}")
+            
+            changed = []
+            upsert = _upsert_centers(table, conn.dialect.name)
+            if upsert is None:
+                # Without an upsert known places are left as they are
+                upsert = db.insert(table)
+                rows = {place_id: row for place_id, row in rows.items() if place_id not in known}
+            if rows:
+                changed = conn.execute(
+                    upsert.returning(table.c.id, table.c.latitude, table.c.longitude),
+                    list(rows.values())
+                ).all()
+    except Exception as e:
+        logger.error(f"Error saving recycling centers to database: {str(e)}")
+        return
     
-    return centers
+    # The index is not told about rows written without the ORM
+    for center in changed:
+        index.add(center.id, center.latitude, center.longitude)
+
+def _normalize_name(name):
+    return " ".join((name or "").lower().split())
+
+def _upsert_centers(table, dialect_name):
+    # INSERT ... ON CONFLICT (place_id) DO UPDATE, touching only the rows
+    # whose Places data changed; None for dialects without it
+    if dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    
+    statement = insert(table)
+    excluded = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.place_id],
+        set_={column: excluded[column] for column in ("name", "address", "latitude", "longitude", "geohash")},
+        where=db.or_(
+            table.c.name != excluded.name,
+            table.c.address.is_distinct_from(excluded.address),
+            table.c.latitude != excluded.latitude,
+            table.c.longitude != excluded.longitude
+        )
+    )
 
 def find_centers_from_db(latitude, longitude, radius):
     """
@@ -121,13 +246,27 @@ def find_centers_from_db(latitude, longitude, radius):
     Returns:
         list: List of nearby recycling centers
     """
-    # Query all centers from database
-    all_centers = RecyclingCenter.query.all()
+    # The spatial index narrows the catalog to the centers within the radius,
+    # so only those rows are loaded; its vectorized distances may differ from
+    # calculate_distance() in the last bits, hence the slack
+    _, ids = get_center_index().within(latitude, longitude, radius + 1e-6)
+    if not len(ids):
+        return []
+    
+    centers = {}
+    ids = ids.tolist()
+    for start in range(0, len(ids), 500):
+        for center in RecyclingCenter.query.filter(RecyclingCenter.id.in_(ids[start:start + 500])):
+            centers[center.id] = center
     
-    # Filter centers by distance
     nearby_centers = []
     
-    for center in all_centers:
+    for center_id in ids:
+        center = centers.get(center_id)
+        if center is None:
+            continue
+        
+        # Measured again from the row, in case it moved since it was indexed
         distance = calculate_distance(
             latitude, longitude, 
             center.latitude, center.longitude
@@ -135,6 +274,7 @@ def find_centers_from_db(latitude, longitude, radius):
         
         if distance <= radius:
             nearby_centers.append({
+                "id": center.place_id or center.id,
                 "name": center.name,
                 "address": center.address,
                 "latitude": center.latitude,
@@ -161,25 +301,7 @@ def calculate_distance(lat1, lon1, lat2, lon2):
     Returns:
         float: Distance in kilometers
     """
-    # Earth radius in kilometers
-    R = 6371.0
-    
-    # Convert degrees to radians
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
-    
-    # Differences
-    dlon = lon2_rad - lon1_rad
-    dlat = lat2_rad - lat1_rad
-    
-    # Haversine formula
-    a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    distance = R * c
-    
-    return distance
+    return haversine_distance(lat1, lon1, lat2, lon2)
 
 def seed_sample_centers():
     """
@@ -0,0 +1,237 @@
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+import numpy as np
+from utils.color_features import FEATURE_NAMES, load_thumbnail, extract_features
+
+logger = logging.getLogger(__name__)
+
+# Output categories, same as the values of waste_classifier.WASTE_CATEGORIES
+CATEGORIES = ['recyclable', 'organic', 'hazardous', 'non-recyclable']
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp')
+
+WEIGHTS_FILE = 'weights.npy'
+METADATA_FILE = 'model.json'
+
+class OfflineWasteModel:
+    """
+    Softmax regression over colour features, served from a memory-mapped file.
+
+    Feature standardization is folded into the weight matrix at export time,
+    so a prediction is one matrix product plus a softmax. The weights are
+    mapped read-only, which lets every gunicorn worker share the same pages.
+    """
+
+    def __init__(self, weights, categories, metadata=None):
+        self.weights = weights
+        self.categories = list(categories)
+        self.metadata = metadata or {}
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory-map a model exported with export_model()
+
+        Args:
+            path (str): Model directory
+
+        Returns:
+            OfflineWasteModel: The loaded model
+        """
+        with open(os.path.join(path, METADATA_FILE)) as f:
+            metadata = json.load(f)
+
+        if metadata.get('feature_names') != FEATURE_NAMES:
+            raise ValueError("Model was trained on a different feature layout")
+
+        weights = np.load(os.path.join(path, WEIGHTS_FILE), mmap_mode='r')
+        return cls(weights, metadata['categories'], metadata)
+
+    def predict_proba(self, features):
+        """
+        Class probabilities for a batch of feature vectors
+
+        Args:
+            features (numpy.ndarray): Array of shape (N, len(FEATURE_NAMES))
+
+        Returns:
+            numpy.ndarray: Array of shape (N, len(categories))
+        """
+        logits = features @ self.weights[:-1] + self.weights[-1]
+        return _softmax(logits)
+
+    def predict(self, features):
+        """
+        Most likely category and its probability for each feature vector
+
+        Args:
+            features (numpy.ndarray): Array of shape (N, len(FEATURE_NAMES))
+
+        Returns:
+            list: (waste_type, confidence) tuple per row
+        """
+        probabilities = self.predict_proba(features)
+        best = probabilities.argmax(axis=1)
+        return [
+            (self.categories[index], round(float(probabilities[row, index]), 4))
+            for row, index in enumerate(best)
+        ]
+
+def _softmax(logits):
+    shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+def load_training_images(data_dir, batch_size=256):
+    """
+    Read a labelled image folder into a feature matrix
+
+    The folder holds one sub-folder per category, named like the entries
+    of CATEGORIES, each containing example images.
+
+    Args:
+        data_dir (str): Root folder of the training images
+        batch_size (int): Images decoded per vectorized feature pass
+
+    Returns:
+        tuple: (features, labels) arrays
+    """
+    paths = []
+    labels = []
+    for label, category in enumerate(CATEGORIES):
+        category_dir = os.path.join(data_dir, category)
+        if not os.path.isdir(category_dir):
+            logger.warning(f"No training images for category {category}")
+            continue
+        for filename in sorted(os.listdir(category_dir)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(category_dir, filename))
+                labels.append(label)
+
+    features = []
+    kept = []
+    for start in range(0, len(paths), batch_size):
+        thumbnails = []
+        for path, label in zip(paths[start:start + batch_size], labels[start:start + batch_size]):
+            try:
+                with open(path, 'rb') as image_file:
+                    thumbnails.append(load_thumbnail(image_file))
+                kept.append(label)
+            except Exception as e:
+                logger.warning(f"Skipping unreadable training image {path}: {str(e)}")
+        if thumbnails:
+            features.append(extract_features(np.stack(thumbnails)))
+
+    if not features:
+        return np.empty((0, len(FEATURE_NAMES))), np.empty(0, dtype=np.int64)
+    return np.vstack(features), np.array(kept, dtype=np.int64)
+
+def train_model(features, labels, epochs=500, learning_rate=0.5, l2=1e-3):
+    """
+    Fit a softmax regression model with full-batch gradient descent
+
+    Args:
+        features (numpy.ndarray): Array of shape (N, len(FEATURE_NAMES))
+        labels (numpy.ndarray): Category index per row
+        epochs (int): Gradient descent iterations
+        learning_rate (float): Step size
+        l2 (float): L2 regularization strength
+
+    Returns:
+        tuple: (weights, training_accuracy) where weights has the
+        standardization folded in and shape (len(FEATURE_NAMES) + 1, len(CATEGORIES))
+    """
+    count, dimensions = features.shape
+    classes = len(CATEGORIES)
+
+    mean = features.mean(axis=0)
+    scale = features.std(axis=0)
+    scale[scale == 0] = 1.0
+    standardized = (features - mean) / scale
+
+    targets = np.zeros((count, classes))
+    targets[np.arange(count), labels] = 1.0
+
+    weights = np.zeros((dimensions, classes))
+    bias = np.zeros(classes)
+
+    for _ in range(epochs):
+        probabilities = _softmax(standardized @ weights + bias)
+        error = (probabilities - targets) / count
+        weights -= learning_rate * (standardized.T @ error + l2 * weights)
+        bias -= learning_rate * error.sum(axis=0)
+
+    accuracy = float(((standardized @ weights + bias).argmax(axis=1) == labels).mean())
+
+    # Fold the standardization into the weights: ((x - mean) / scale) @ W == x @ (W / scale) - (mean / scale) @ W
+    folded = weights / scale[:, None]
+    folded_bias = bias - (mean / scale) @ weights
+    return np.vstack([folded, folded_bias]).astype(np.float32), accuracy
+
+def export_model(weights, path, metadata=None):
+    """
+    Write a trained model so workers can memory-map it
+
+    The weights file is written next to its final name and renamed into
+    place, so running workers never map a half-written file.
+
+    Args:
+        weights (numpy.ndarray): Output of train_model()
+        path (str): Model directory
+        metadata (dict, optional): Extra information stored with the model
+    """
+    os.makedirs(path, exist_ok=True)
+
+    info = dict(metadata or {})
+    info.update({
+        'categories': CATEGORIES,
+        'feature_names': FEATURE_NAMES,
+        'created_at': datetime.utcnow().isoformat()
+    })
+
+    weights_path = os.path.join(path, WEIGHTS_FILE)
+    np.save(weights_path + '.tmp.npy', np.ascontiguousarray(weights, dtype=np.float32))
+    os.replace(weights_path + '.tmp.npy', weights_path)
+
+    metadata_path = os.path.join(path, METADATA_FILE)
+    with open(metadata_path + '.tmp', 'w') as f:
+        json.dump(info, f, indent=2)
+    os.replace(metadata_path + '.tmp', metadata_path)
+
+_models = {}
+_models_lock = threading.Lock()
+
+def get_offline_model(path):
+    """
+    Get the memory-mapped model stored at `path`
+
+    Args:
+        path (str): Model directory
+
+    Returns:
+        OfflineWasteModel: The model, or None when no model has been exported
+    """
+    if not path or not os.path.exists(os.path.join(path, WEIGHTS_FILE)):
+        return None
+
+    # Reload when a newer model has been exported
+    mtime = os.path.getmtime(os.path.join(path, WEIGHTS_FILE))
+    cached = _models.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with _models_lock:
+        cached = _models.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            model = OfflineWasteModel.load(path)
+        except Exception as e:
+            logger.error(f"Error loading offline waste model: {str(e)}")
+            model = None
+        _models[path] = (mtime, model)
+        if model is not None:
+            logger.info(f"Loaded offline waste model from {path}")
+        return model
@@ -0,0 +1,359 @@
+import math
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from flask import current_app
+from app import app
+from models import PlacesCacheEntry, PlaceDetailsEntry
+from utils.resilience import CircuitOpenError
+from utils.executors import ProcessLocalExecutor
+from utils.two_tier_cache import TwoTierCache
+from utils.geo import encode_geohash, cell_bounds, cell_size, haversine_distance, EARTH_RADIUS_KM
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 2048            # searches kept in the in-process LRU tier
+DEFAULT_CACHE_TTL = 24 * 3600        # seconds results are served as fresh
+DEFAULT_STALE_TTL = 6 * 24 * 3600    # further seconds they are served while refreshed in the background
+DEFAULT_CACHE_MAX_ROWS = 50000       # rows kept in the database tier
+DEFAULT_DETAILS_CACHE_SIZE = 4096    # Place Details kept in the in-process LRU tier
+DEFAULT_DETAILS_TTL = 30 * 24 * 3600 # seconds Place Details stay valid
+DEFAULT_DETAILS_MAX_ROWS = 100000    # Place Details rows kept in the database tier
+DEFAULT_DETAILS_WORKERS = 16         # Place Details fetched concurrently per process
+
+# Threads refreshing stale searches in the background, per process
+REVALIDATE_WORKERS = 2
+
+# Seconds a request waits for another one already fetching the same search
+FETCH_WAIT = 10.0
+
+# Cells are at most this fraction of the search radius wide, so that one
+# search serves everybody in the cell with nearly the same area
+CELL_FRACTION = 0.5
+MIN_PRECISION = 4
+MAX_PRECISION = 8
+
+# Largest radius Places nearbysearch accepts
+MAX_SEARCH_RADIUS_M = 50000
+
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180.0
+
+def cache_precision(radius_km):
+    """
+    Geohash precision of the cells searches with a radius are cached for
+
+    Args:
+        radius_km (float): Search radius in kilometers
+
+    Returns:
+        int: The coarsest precision whose cells are at most CELL_FRACTION
+        of the radius wide
+    """
+    for precision in range(MIN_PRECISION, MAX_PRECISION):
+        if max(cell_size(precision)) * KM_PER_DEGREE <= radius_km * CELL_FRACTION:
+            return precision
+    return MAX_PRECISION
+
+def _search_area(latitude, longitude, radius_km, precision):
+    # Search around the cell center, far enough to cover the radius around
+    # any point of the cell
+    min_lat, max_lat, min_lng, max_lng = cell_bounds(latitude, longitude, precision)
+    center_lat, center_lng = (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+    half_diagonal = max(haversine_distance(center_lat, center_lng, corner_lat, max_lng)
+                        for corner_lat in (min_lat, max_lat))
+    radius_m = min(int(math.ceil((radius_km + half_diagonal) * 1000)), MAX_SEARCH_RADIUS_M)
+    return center_lat, center_lng, radius_m
+
+def _within(results, latitude, longitude, radius_km):
+    # Results of the cell-wide search that are in range of this location
+    nearby = []
+    for place in results:
+        location = place.get("geometry", {}).get("location", {})
+        if "lat" in location and "lng" in location and \
+                haversine_distance(latitude, longitude, location["lat"], location["lng"]) > radius_km:
+            continue
+        nearby.append(place)
+    return nearby
+
+class PlacesCache(TwoTierCache):
+    """
+    Two-tier cache of Places nearby-search results keyed by geohash cell.
+
+    A search is cached per (geohash cell, keyword, place type, radius), at a
+    cell precision chosen from the radius by cache_precision(). The first
+    request in a cell searches from the cell center with the radius widened
+    by the cell's half-diagonal; every request in the cell is then answered
+    from those results, keeping the places within its radius.
+
+    The first tier is an in-process LRU dictionary and the second the
+    PlacesCacheEntry table, whose rows are evicted least recently used
+    first. Results younger than `ttl` are served as they are. For
+    `stale_ttl` seconds more they are still served, while one background
+    refresh per search replaces them (stale-while-revalidate). Older results
+    are a miss. Concurrent misses for the same search wait for a single
+    upstream call.
+    """
+
+    model = PlacesCacheEntry
+    value_column = 'results'
+    time_column = 'fetched_at'
+    used_column = 'last_used_at'
+    description = 'Places cache'
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL, stale_ttl=DEFAULT_STALE_TTL,
+                 max_rows=DEFAULT_CACHE_MAX_ROWS):
+        super().__init__(max_entries, ttl, max_rows,
+                         counters=('stale_hits', 'revalidations', 'revalidation_errors'))
+        self.stale_ttl = stale_ttl
+        self._inflight = {}
+        self._pool = ProcessLocalExecutor(
+            lambda: ThreadPoolExecutor(max_workers=REVALIDATE_WORKERS, thread_name_prefix='places-revalidate')
+        )
+
+    def max_age(self):
+        """Seconds after which results are a miss rather than stale"""
+        return self.ttl + self.stale_ttl
+
+    def lookup(self, latitude, longitude, radius_km, keyword, search, place_type=None):
+        """
+        Places around a location, from the cache when possible
+
+        Args:
+            latitude (float): Latitude of the location
+            longitude (float): Longitude of the location
+            radius_km (float): Search radius in kilometers
+            keyword (str): Places keyword
+            search (callable): Called as search(latitude, longitude, radius_m)
+                to run the nearby search; returns its `results` list and
+                raises when Places fails
+            place_type (str, optional): Places type filter, part of the key
+
+        Returns:
+            list: Places results within radius_km of the location, in
+            Places order
+        """
+        precision = cache_precision(radius_km)
+        cell = encode_geohash(latitude, longitude, precision)
+        key = f"{place_type or '-'}|{keyword}|{radius_km:g}|{cell}"
+        area = _search_area(latitude, longitude, radius_km, precision)
+
+        entry = self._lookup(key)
+        if entry is None:
+            results = self._fetch(key, search, area)
+        else:
+            fetched_at, results = entry
+            if time.time() - fetched_at >= self.ttl:
+                with self._lock:
+                    self._stats['stale_hits'] += 1
+                self._revalidate(key, search, area)
+        return _within(results, latitude, longitude, radius_km)
+
+    def _fetch(self, key, search, area):
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+
+        if not leader:
+            # Another request is already searching this cell
+            event.wait(FETCH_WAIT)
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None:
+                return entry[1]
+            return self._refresh(key, search, area)
+
+        try:
+            return self._refresh(key, search, area)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def _revalidate(self, key, search, area):
+        with self._lock:
+            if key in self._inflight:
+                return
+            event = self._inflight[key] = threading.Event()
+            self._stats['revalidations'] += 1
+
+        def run():
+            try:
+                with app.app_context():
+                    self._refresh(key, search, area)
+            except Exception as e:
+                with self._lock:
+                    self._stats['revalidation_errors'] += 1
+                logger.error(f"Error refreshing cached Places search: {str(e)}")
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                event.set()
+
+        try:
+            self._pool.submit(run)
+        except RuntimeError:
+            # Interpreter shutting down; the stale results stay in place
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def _refresh(self, key, search, area):
+        results = search(*area)
+        self._store(key, results)
+        return results
+
+class PlaceDetailsCache(TwoTierCache):
+    """
+    Place Details per place_id, cached for a long time and fetched concurrently.
+
+    Phone numbers, websites and opening hours rarely change, so details are
+    kept for `ttl` seconds in an in-process LRU dictionary backed by the
+    PlaceDetailsEntry table. get_many() answers what it can from both tiers
+    (one query for all the places) and fetches the rest at the same time on
+    a pool of `workers` threads shared by the process, so a page of results
+    costs about the slowest round trip instead of their sum. A request for a
+    place_id already being fetched waits for that fetch.
+
+    Callers give a deadline and get the details that arrived by then; the
+    fetches still running complete in the background and fill the cache for
+    the next request.
+    """
+
+    model = PlaceDetailsEntry
+    key_column = 'place_id'
+    value_column = 'details'
+    time_column = 'fetched_at'
+    description = 'Place Details cache'
+
+    def __init__(self, max_entries=DEFAULT_DETAILS_CACHE_SIZE, ttl=DEFAULT_DETAILS_TTL,
+                 max_rows=DEFAULT_DETAILS_MAX_ROWS, workers=DEFAULT_DETAILS_WORKERS):
+        super().__init__(max_entries, ttl, max_rows, counters=('fetches', 'errors', 'late'))
+        self.workers = workers
+        self._inflight = {}
+        self._pool = ProcessLocalExecutor(self._start_pool)
+
+    def get_many(self, place_ids, fetch, deadline=None):
+        """
+        Details of several places, from the cache or fetched concurrently
+
+        Args:
+            place_ids (list): Places place_ids
+            fetch (callable): Called as fetch(place_id) on a worker thread,
+                within an app context; returns the details dict and raises
+                when Places fails
+            deadline (float, optional): Seconds to wait for fetches; None
+                waits for all of them, 0 only returns cached details
+
+        Returns:
+            dict: place_id -> details of the places available in time;
+            places whose fetch failed or is still running are left out
+        """
+        place_ids = list(dict.fromkeys(place_ids))
+        found = {place_id: entry[1] for place_id, entry in self._lookup_many(place_ids).items()}
+        missing = [place_id for place_id in place_ids if place_id not in found]
+        if not missing:
+            return found
+
+        futures = {self._submit(place_id, fetch): place_id for place_id in missing}
+        done, late = wait(futures, timeout=deadline)
+        for future in done:
+            if future.exception() is None:
+                found[futures[future]] = future.result()
+        if late:
+            with self._lock:
+                self._stats['late'] += len(late)
+        return found
+
+    def stats(self):
+        """
+        Get hit/miss counters for monitoring
+
+        Returns:
+            dict: Counters plus the current in-process tier size and the
+            number of fetches in flight
+        """
+        stats = super().stats()
+        with self._lock:
+            stats['in_flight'] = len(self._inflight)
+        return stats
+
+    def _start_pool(self):
+        # Fetches in flight belonged to the parent process's pool
+        with self._lock:
+            self._inflight = {}
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='place-details')
+
+    def _submit(self, place_id, fetch):
+        pool = self._pool.get()
+        with self._lock:
+            future = self._inflight.get(place_id)
+            if future is None:
+                future = self._inflight[place_id] = pool.submit(self._fetch, place_id, fetch)
+                self._stats['fetches'] += 1
+            return future
+
+    def _fetch(self, place_id, fetch):
+        try:
+            with app.app_context():
+                details = fetch(place_id)
+                self._store(place_id, details)
+            return details
+        except CircuitOpenError:
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        except Exception as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            logger.error(f"Error fetching place details: {str(e)}")
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(place_id, None)
+
+_cache = None
+_details_cache = None
+_cache_lock = threading.Lock()
+
+def get_places_cache():
+    """
+    Get the process-wide Places search cache, configured from the app config
+
+    Returns:
+        PlacesCache: Shared cache instance
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = current_app.config
+                _cache = PlacesCache(
+                    max_entries=config.get('PLACES_CACHE_SIZE', DEFAULT_CACHE_SIZE),
+                    ttl=config.get('PLACES_CACHE_TTL', DEFAULT_CACHE_TTL),
+                    stale_ttl=config.get('PLACES_CACHE_STALE_TTL', DEFAULT_STALE_TTL),
+                    max_rows=config.get('PLACES_CACHE_MAX_ROWS', DEFAULT_CACHE_MAX_ROWS)
+                )
+    return _cache
+
+def get_place_details_cache():
+    """
+    Get the process-wide Place Details cache, configured from the app config
+
+    Returns:
+        PlaceDetailsCache: Shared cache instance
+    """
+    global _details_cache
+    if _details_cache is None:
+        with _cache_lock:
+            if _details_cache is None:
+                config = current_app.config
+                _details_cache = PlaceDetailsCache(
+                    max_entries=config.get('PLACE_DETAILS_CACHE_SIZE', DEFAULT_DETAILS_CACHE_SIZE),
+                    ttl=config.get('PLACE_DETAILS_TTL', DEFAULT_DETAILS_TTL),
+                    max_rows=config.get('PLACE_DETAILS_MAX_ROWS', DEFAULT_DETAILS_MAX_ROWS),
+                    workers=config.get('PLACE_DETAILS_WORKERS', DEFAULT_DETAILS_WORKERS)
+                )
+    return _details_cache
@@ -0,0 +1,357 @@
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from flask import current_app
+from utils.executors import ProcessLocalExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONNECT_TIMEOUT = 3.05       # seconds to establish a connection
+DEFAULT_READ_TIMEOUT = 10.0          # seconds between bytes of the response
+DEFAULT_DEADLINE = 15.0              # seconds per call, retries included
+DEFAULT_RETRIES = 2                  # extra attempts after a failed one
+DEFAULT_FAILURE_THRESHOLD = 5        # consecutive failed calls that open a circuit
+DEFAULT_RESET_TIMEOUT = 30.0         # seconds an open circuit waits before probing
+
+BACKOFF_BASE = 0.2
+BACKOFF_MAX = 2.0
+
+# Threads running hedged attempts, shared by every upstream of a process
+HEDGE_WORKERS = 32
+
+RETRYABLE_ERRORS = (requests.ConnectionError, requests.Timeout, TimeoutError)
+try:
+    from google.api_core import exceptions as google_exceptions
+    RETRYABLE_ERRORS += (google_exceptions.ServiceUnavailable, google_exceptions.DeadlineExceeded,
+                         google_exceptions.TooManyRequests, google_exceptions.InternalServerError)
+except ImportError:
+    pass
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+class CircuitBreaker:
+    """
+    Stops calls to an upstream that keeps failing.
+
+    After `failure_threshold` consecutive failed calls the circuit opens and
+    calls are refused without touching the network. Once `reset_timeout`
+    seconds have passed a single probe call is let through (half-open): its
+    success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._times_opened = 0
+
+    def allow(self):
+        """
+        Whether a call may go ahead; in half-open state only the probe may
+
+        Returns:
+            bool: True if the caller should call the upstream and then report
+            the outcome with record_success() or record_failure()
+        """
+        with self._lock:
+            if self._state == 'open':
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = 'half_open'
+                self._probing = False
+            if self._state == 'half_open':
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def available(self):
+        """
+        Whether calls would currently be let through, without claiming the probe
+
+        Returns:
+            bool: False while the circuit is open
+        """
+        with self._lock:
+            return self._state != 'open' or time.monotonic() - self._opened_at >= self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            if self._state != 'closed':
+                logger.info("Circuit closed after a successful probe")
+            self._state = 'closed'
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == 'half_open' or (self._state == 'closed' and self._failures >= self.failure_threshold):
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+                self._times_opened += 1
+
+    def snapshot(self):
+        """
+        Current breaker state for monitoring
+
+        Returns:
+            dict: State, consecutive failures, times opened and seconds until
+            the next probe while open
+        """
+        with self._lock:
+            snapshot = {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'times_opened': self._times_opened
+            }
+            if self._state == 'open':
+                snapshot['retry_in'] = round(max(self.reset_timeout - (time.monotonic() - self._opened_at), 0), 1)
+        return snapshot
+
+_hedge_pool = ProcessLocalExecutor(
+    lambda: ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='upstream-hedge')
+)
+
+class Upstream:
+    """
+    Calls to one Google API endpoint with timeouts, retries, hedging and a
+    circuit breaker.
+
+    Every attempt gets a connect and a read timeout, and a call as a whole
+    never runs past `deadline` seconds. Connection errors, timeouts, 429 and
+    5xx responses are retried up to `retries` times after a jittered
+    exponential backoff. With `hedge_delay` set, an attempt still unanswered
+    after that many seconds is duplicated and the first answer wins, which
+    cuts the slow tail at the price of some extra calls; only enable it for
+    idempotent requests. Calls whose attempts all failed count against the
+    circuit breaker; while it is open calls raise CircuitOpenError at once,
+    so callers can go straight to their fallback.
+    """
+
+    def __init__(self, name, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 deadline=DEFAULT_DEADLINE, retries=DEFAULT_RETRIES, hedge_delay=0.0,
+                 breaker=None, session=None, session_name=None):
+        self.name = name
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.hedge_delay = hedge_delay
+        self.breaker = breaker or CircuitBreaker()
+        self._session = session
+        self.session_name = session_name or name
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'attempts': 0, 'retries': 0, 'hedges': 0, 'hedge_wins': 0,
+                       'failures': 0, 'short_circuited': 0}
+
+    @property
+    def session(self):
+        if self._session is not None:
+            return self._session
+        # Looked up per call: sessions are rebuilt in each forked worker
+        from utils.http_clients import get_session
+        return get_session(self.session_name)
+
+    def available(self):
+        """
+        Whether the upstream is worth calling right now
+
+        Returns:
+            bool: False while its circuit is open
+        """
+        return self.breaker.available()
+
+    def get(self, url, **kwargs):
+        """GET through request(), hedged when hedging is enabled."""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """POST through request()."""
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method, url, hedge=None, **kwargs):
+        """
+        Send an HTTP request with the upstream's timeouts and retries
+
+        Args:
+            method (str): HTTP method
+            url (str): Request URL
+            hedge (bool, optional): Whether attempts may be hedged; defaults
+                to True for GET requests
+            **kwargs: Passed on to requests.Session.request()
+
+        Returns:
+            requests.Response: The first successful response, or the last
+            429/5xx response once retries are exhausted
+        """
+        session = self.session
+        if hedge is None:
+            hedge = method == 'GET'
+        return self.call(lambda timeout: session.request(method, url, timeout=timeout, **kwargs), hedge=hedge)
+
+    def call(self, attempt, hedge=False):
+        """
+        Run a call through the breaker, retrying failed attempts
+
+        Args:
+            attempt (callable): Makes one attempt; called with the
+                (connect, read) timeout to use, in seconds
+            hedge (bool): Whether slow attempts may be duplicated
+
+        Returns:
+            The result of the first successful attempt
+        """
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        self._count('calls')
+
+        deadline = time.monotonic() + self.deadline
+        last_error = None
+        last_response = None
+        for number in range(self.retries + 1):
+            if number:
+                # Full jitter keeps retries from many workers from lining up
+                delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** number))
+                if time.monotonic() + delay >= deadline:
+                    break
+                time.sleep(delay)
+                self._count('retries')
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                result = self._attempt(attempt, remaining, hedge)
+            except RETRYABLE_ERRORS as e:
+                last_error = e
+                continue
+            except Exception:
+                self._fail()
+                raise
+
+            if self._retryable_response(result):
+                last_response = result
+                continue
+            self.breaker.record_success()
+            return result
+
+        self._fail()
+        if last_response is not None:
+            return last_response
+        logger.warning(f"{self.name} failed after {self.retries + 1} attempts: {last_error}")
+        raise last_error or TimeoutError(f"{self.name} call exceeded its {self.deadline}s deadline")
+
+    def stats(self):
+        """
+        Counters and breaker state for monitoring
+
+        Returns:
+            dict: Calls, attempts, retries, hedges, failures, short-circuited
+            calls and the breaker state
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['circuit'] = self.breaker.snapshot()
+        return stats
+
+    def _attempt(self, attempt, remaining, hedge):
+        timeout = (min(self.connect_timeout, remaining), min(self.read_timeout, remaining))
+        if not (hedge and self.hedge_delay) or remaining <= self.hedge_delay:
+            self._count('attempts')
+            return attempt(timeout)
+
+        pool = _hedge_pool.get()
+        self._count('attempts')
+        primary = pool.submit(attempt, timeout)
+        done, _ = wait([primary], timeout=self.hedge_delay)
+        if done:
+            return primary.result()
+
+        self._count('attempts')
+        self._count('hedges')
+        hedged_timeout = tuple(min(value, remaining - self.hedge_delay) for value in timeout)
+        pending = {primary, pool.submit(attempt, hedged_timeout)}
+        end = time.monotonic() + remaining - self.hedge_delay
+        failure = None
+        while pending:
+            done, pending = wait(pending, timeout=max(end - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None and not self._retryable_response(future.result()):
+                    if future is not primary:
+                        self._count('hedge_wins')
+                    return future.result()
+                failure = future
+        if failure is not None:
+            return failure.result()
+        raise TimeoutError(f"{self.name} attempt timed out")
+
+    def _retryable_response(self, result):
+        return isinstance(result, requests.Response) and (result.status_code == 429 or result.status_code >= 500)
+
+    def _fail(self):
+        self._count('failures')
+        self.breaker.record_failure()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+def get_upstream(name):
+    """
+    Get the process-wide resilient client for a Google API, configured from the app config
+
+    Args:
+        name (str): 'vision', 'places' or 'directions'
+
+    Returns:
+        Upstream: Shared instance with its own circuit breaker
+    """
+    upstream = _upstreams.get(name)
+    if upstream is not None:
+        return upstream
+
+    with _upstreams_lock:
+        upstream = _upstreams.get(name)
+        if upstream is None:
+            config = current_app.config
+            prefix = 'VISION' if name == 'vision' else 'MAPS'
+            upstream = _upstreams[name] = Upstream(
+                name,
+                connect_timeout=config.get("UPSTREAM_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT),
+                read_timeout=config.get(f"{prefix}_READ_TIMEOUT", DEFAULT_READ_TIMEOUT),
+                deadline=config.get(f"{prefix}_DEADLINE", DEFAULT_DEADLINE),
+                retries=config.get("UPSTREAM_RETRIES", DEFAULT_RETRIES),
+                hedge_delay=config.get(f"{prefix}_HEDGE_DELAY_MS", 0) / 1000.0,
+                breaker=CircuitBreaker(
+                    failure_threshold=config.get("CIRCUIT_FAILURE_THRESHOLD", DEFAULT_FAILURE_THRESHOLD),
+                    reset_timeout=config.get("CIRCUIT_RESET_TIMEOUT", DEFAULT_RESET_TIMEOUT)
+                ),
+                # Places and Directions share one keep-alive pool
+                session_name='vision' if name == 'vision' else 'maps'
+            )
+    return upstream
+
+def upstream_health():
+    """
+    State of every upstream used so far in this process
+
+    Returns:
+        dict: Upstream name to its stats()
+    """
+    return {name: upstream.stats() for name, upstream in list(_upstreams.items())}
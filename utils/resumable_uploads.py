@@ -0,0 +1,302 @@
+import os
+import re
+import json
+import time
+import uuid
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+from flask import current_app
+from utils.uploads import UploadTooLargeError, CHUNK_SIZE, DEFAULT_MAX_UPLOAD_BYTES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_UPLOAD_TTL = 24 * 3600       # seconds an upload can be resumed or its result fetched
+
+# How many new uploads happen between sweeps of expired ones
+SWEEP_INTERVAL = 100
+
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+class UploadOffsetError(Exception):
+    """Raised when a chunk does not start where the stored data ends"""
+
+    def __init__(self, offset):
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset = offset
+
+class UploadBusyError(Exception):
+    """Raised when another request is writing or finalizing the same upload"""
+
+class ResumableUploadStore:
+    """
+    Uploads sent in chunks that survive dropped connections.
+
+    An upload is a data file that chunks are only ever appended to, plus a
+    small JSON file holding its declared length, owner and classification
+    details. The stored offset is the data file's size, so a chunk cut off
+    mid-transfer keeps every byte that reached the disk and the client
+    resumes from there. A chunk is accepted only at the current offset, and
+    an exclusive file lock keeps two requests from writing the same upload.
+
+    Finalized uploads keep only their JSON file, now holding the result, so
+    a client that lost the finalize response can fetch it again. sweep()
+    deletes uploads whose expiry has passed, finished or not.
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_UPLOAD_BYTES, ttl=DEFAULT_UPLOAD_TTL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._creations_since_sweep = 0
+
+    def create(self, user_id, length, details=None):
+        """
+        Start a new upload
+
+        Args:
+            user_id (int): Owner of the upload
+            length (int): Total size of the file in bytes
+            details (dict, optional): Keyword arguments for record_classification()
+
+        Returns:
+            dict: The upload's state
+        """
+        if length > self.max_bytes:
+            raise UploadTooLargeError(f"Upload exceeds {self.max_bytes} bytes")
+
+        os.makedirs(self.root, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        upload = {
+            'id': upload_id,
+            'user_id': user_id,
+            'length': length,
+            'details': details or {},
+            'expires_at': time.time() + self.ttl,
+            'result': None
+        }
+        open(self._data_path(upload_id), 'xb').close()
+        self._save(upload)
+
+        with self._lock:
+            self._creations_since_sweep += 1
+            should_sweep = self._creations_since_sweep >= SWEEP_INTERVAL
+            if should_sweep:
+                self._creations_since_sweep = 0
+        if should_sweep:
+            self.sweep()
+
+        upload['offset'] = 0
+        return upload
+
+    def get(self, upload_id):
+        """
+        Read an upload's state
+
+        Args:
+            upload_id (str): Id returned by create()
+
+        Returns:
+            dict: State including the current offset, or None if the upload
+            does not exist or has expired
+        """
+        if not UPLOAD_ID_PATTERN.match(upload_id):
+            return None
+        try:
+            with open(self._meta_path(upload_id)) as f:
+                upload = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if upload['expires_at'] < time.time():
+            return None
+
+        if upload['result'] is not None:
+            upload['offset'] = upload['length']
+        else:
+            try:
+                upload['offset'] = os.path.getsize(self._data_path(upload_id))
+            except OSError:
+                return None
+        return upload
+
+    def append(self, upload, offset, stream, content_length=None):
+        """
+        Append a chunk to an upload
+
+        Bytes are written as they arrive, so if the connection drops the
+        part received so far is kept.
+
+        Args:
+            upload (dict): State returned by get()
+            offset (int): Offset the client believes the chunk starts at
+            stream: Readable binary stream of the chunk
+            content_length (int, optional): Declared size of the chunk
+
+        Returns:
+            int: The new offset
+        """
+        with self._locked(upload['id']) as data_file:
+            current = os.fstat(data_file.fileno()).st_size
+            if offset != current or upload['result'] is not None:
+                raise UploadOffsetError(current)
+
+            remaining = upload['length'] - current
+            if content_length is not None and content_length > remaining:
+                raise UploadTooLargeError(f"Chunk exceeds the {remaining} bytes left")
+
+            try:
+                while remaining > 0:
+                    chunk = stream.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    data_file.write(chunk)
+                    remaining -= len(chunk)
+
+                # Chunk bodies without a length are only checked once read
+                if remaining == 0 and stream.read(1):
+                    data_file.truncate(current)
+                    raise UploadTooLargeError(f"Chunk exceeds the {upload['length'] - current} bytes left")
+            finally:
+                data_file.flush()
+
+            return data_file.tell()
+
+    @contextmanager
+    def finalizing(self, upload):
+        """
+        Hold a complete upload's data while it is classified
+
+        Args:
+            upload (dict): State returned by get()
+
+        Yields:
+            file: The assembled file, opened for reading
+        """
+        with self._locked(upload['id']) as data_file:
+            size = os.fstat(data_file.fileno()).st_size
+            if size != upload['length'] or upload['result'] is not None:
+                raise UploadOffsetError(size)
+            data_file.seek(0)
+            yield data_file
+
+    def complete(self, upload, result):
+        """
+        Record an upload's result and delete its data
+
+        Args:
+            upload (dict): State returned by get()
+            result (dict): Response body of the finalize request
+        """
+        upload = {key: value for key, value in upload.items() if key != 'offset'}
+        upload['result'] = result
+        self._save(upload)
+        self._remove(self._data_path(upload['id']))
+
+    def delete(self, upload_id):
+        """
+        Delete an upload and its data
+
+        Args:
+            upload_id (str): Id returned by create()
+        """
+        self._remove(self._data_path(upload_id))
+        self._remove(self._meta_path(upload_id))
+
+    def sweep(self):
+        """
+        Delete expired uploads, along with data files left without state
+
+        Returns:
+            int: Number of uploads deleted
+        """
+        now = time.time()
+        deleted = 0
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return 0
+
+        for name in names:
+            upload_id, extension = os.path.splitext(name)
+            if not UPLOAD_ID_PATTERN.match(upload_id):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                if extension == '.json':
+                    with open(path) as f:
+                        expired = json.load(f)['expires_at'] < now
+                elif extension == '.part':
+                    # State is written right after the data file is created
+                    expired = (not os.path.exists(self._meta_path(upload_id))
+                               and os.path.getmtime(path) < now - 60)
+                else:
+                    continue
+            except (OSError, ValueError, KeyError):
+                continue
+
+            if expired:
+                self.delete(upload_id)
+                deleted += 1
+
+        if deleted:
+            logger.info(f"Deleted {deleted} expired uploads")
+        return deleted
+
+    @contextmanager
+    def _locked(self, upload_id):
+        try:
+            data_file = open(self._data_path(upload_id), 'r+b')
+        except FileNotFoundError:
+            raise UploadBusyError("Upload has been finalized or deleted")
+        with data_file:
+            try:
+                fcntl.flock(data_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadBusyError("Upload is being written by another request")
+            data_file.seek(0, os.SEEK_END)
+            yield data_file
+
+    def _save(self, upload):
+        path = self._meta_path(upload['id'])
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(upload, f)
+        os.replace(temp_path, path)
+
+    def _remove(self, path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def _data_path(self, upload_id):
+        return os.path.join(self.root, upload_id + '.part')
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.root, upload_id + '.json')
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_upload_store():
+    """
+    Get the resumable upload store configured for this app
+
+    Returns:
+        ResumableUploadStore: Store rooted at RESUMABLE_UPLOAD_PATH
+    """
+    config = current_app.config
+    root = config["RESUMABLE_UPLOAD_PATH"]
+    store = _stores.get(root)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(root)
+            if store is None:
+                store = _stores[root] = ResumableUploadStore(
+                    root,
+                    max_bytes=config.get("MAX_UPLOAD_BYTES", DEFAULT_MAX_UPLOAD_BYTES),
+                    ttl=config.get("RESUMABLE_UPLOAD_TTL", DEFAULT_UPLOAD_TTL)
+                )
+    return store
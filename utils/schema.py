@@ -0,0 +1,48 @@
+import logging
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateIndex
+
+logger = logging.getLogger(__name__)
+
+def add_missing_columns(db):
+    """
+    Add columns that were added to the models after their tables were created
+
+    db.create_all() only creates missing tables, so databases created by an
+    earlier version would lack new columns. New columns are nullable (or
+    have a server default), which lets them be added with ALTER TABLE; their
+    indexes are created as well.
+
+    Args:
+        db: The Flask-SQLAlchemy extension, inside an app context
+
+    Returns:
+        list: "table.column" names that were added
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            missing = [column for column in table.columns if column.name not in existing]
+            for column in missing:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                conn.exec_driver_sql(ddl)
+                added.append(f"{table.name}.{column.name}")
+
+            missing_names = {column.name for column in missing}
+            for index in table.indexes:
+                if missing_names.intersection(column.name for column in index.columns):
+                    conn.execute(CreateIndex(index))
+
+    for name in added:
+        logger.info(f"Added column {name}")
+    return added
@@ -0,0 +1,205 @@
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# How many database writes happen between pruning passes
+PRUNE_INTERVAL = 100
+
+class TwoTierCache:
+    """
+    Base of the caches with an in-process LRU tier in front of a table.
+
+    The first tier is an OrderedDict of key -> (stored_at, value) holding at
+    most `max_entries` values. The second is the table of `model`, so values
+    survive restarts and are shared between gunicorn workers. Entries older
+    than max_age() are expired in both tiers, and every PRUNE_INTERVAL writes
+    the table is trimmed to `max_rows` rows.
+
+    Subclasses set `model` and name its columns: `key_column`, `value_column`
+    (JSON text) and `time_column` (when the value was stored). With
+    `used_column` set, reads touch that column and size-based pruning evicts
+    the least recently used rows instead of the oldest ones.
+    """
+
+    model = None
+    key_column = 'cache_key'
+    value_column = 'result'
+    time_column = 'created_at'
+    used_column = None
+    description = 'cache'
+
+    def __init__(self, max_entries, ttl, max_rows, counters=()):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self._stats = dict.fromkeys(
+            ('memory_hits', 'db_hits', 'misses') + tuple(counters) + ('evictions', 'expired', 'pruned'), 0
+        )
+
+    def max_age(self):
+        """Seconds after which an entry is expired in both tiers"""
+        return self.ttl
+
+    def clear(self):
+        """Drop the in-process tier (the database tier is left untouched)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Get hit/miss counters for monitoring
+
+        Returns:
+            dict: Counters plus the current in-process tier size
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_rate'] = round((lookups - stats['misses']) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def prune(self):
+        """
+        Remove expired rows and trim the database tier to `max_rows`
+
+        Returns:
+            int: Number of rows deleted
+        """
+        table = self.model.__table__
+        time_column = table.c[self.time_column]
+        order_column = table.c[self.used_column or self.time_column]
+        cutoff = datetime.utcnow() - timedelta(seconds=self.max_age())
+        deleted = 0
+        try:
+            with db.engine.begin() as conn:
+                deleted += conn.execute(db.delete(table).where(time_column < cutoff)).rowcount
+
+                overflow_cutoff = conn.execute(
+                    db.select(order_column)
+                    .order_by(order_column.desc())
+                    .offset(self.max_rows)
+                    .limit(1)
+                ).scalar()
+                if overflow_cutoff is not None:
+                    deleted += conn.execute(
+                        db.delete(table).where(order_column <= overflow_cutoff)
+                    ).rowcount
+        except Exception as e:
+            logger.error(f"Error pruning {self.description}: {str(e)}")
+
+        if deleted:
+            with self._lock:
+                self._stats['pruned'] += deleted
+            logger.info(f"Pruned {deleted} {self.description} rows")
+        return deleted
+
+    def _lookup(self, key):
+        # (stored_at, value) from either tier, or None on a miss
+        return self._lookup_many([key]).get(key)
+
+    def _lookup_many(self, keys):
+        # key -> (stored_at, value) of the keys found in either tier; the
+        # database tier is read with one query for all memory misses
+        now = time.time()
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and now - entry[0] < self.max_age():
+                    self._entries.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    found[key] = entry
+                    continue
+                if entry is not None:
+                    del self._entries[key]
+                    self._stats['expired'] += 1
+                missing.append(key)
+
+        if missing:
+            loaded = self._load(missing)
+            found.update(loaded)
+            with self._lock:
+                self._stats['misses'] += len(missing) - len(loaded)
+        return found
+
+    def _store(self, key, value):
+        # Put a freshly computed value in both tiers
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, (stored_at, value))
+        self._persist(key, value, datetime.utcfromtimestamp(stored_at))
+
+    def _remember(self, key, entry):
+        # Caller must hold the lock
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _load(self, keys):
+        table = self.model.__table__
+        key_column, time_column = table.c[self.key_column], table.c[self.time_column]
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as conn:
+                rows = conn.execute(
+                    db.select(key_column, table.c[self.value_column], time_column)
+                    .where(key_column.in_(keys), time_column >= now - timedelta(seconds=self.max_age()))
+                ).all()
+                if rows and self.used_column:
+                    conn.execute(
+                        db.update(table).where(key_column.in_([row[0] for row in rows]))
+                        .values({self.used_column: now})
+                    )
+        except Exception as e:
+            logger.error(f"Error reading {self.description}: {str(e)}")
+            return {}
+
+        loaded = {}
+        with self._lock:
+            for key, value, stored_at in rows:
+                # Keep the age when promoting into the memory tier
+                entry = (time.time() - (now - stored_at).total_seconds(), json.loads(value))
+                self._remember(key, entry)
+                loaded[key] = entry
+            self._stats['db_hits'] += len(loaded)
+        return loaded
+
+    def _persist(self, key, value, stored_at):
+        table = self.model.__table__
+        row = {self.key_column: key, self.value_column: json.dumps(value), self.time_column: stored_at}
+        if self.used_column:
+            row[self.used_column] = stored_at
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(db.delete(table).where(table.c[self.key_column] == key))
+                conn.execute(db.insert(table).values(row))
+        except IntegrityError:
+            # Another worker stored the same key concurrently
+            return
+        except Exception as e:
+            logger.error(f"Error writing {self.description}: {str(e)}")
+            return
+
+        with self._lock:
+            self._writes_since_prune += 1
+            should_prune = self._writes_since_prune >= PRUNE_INTERVAL
+            if should_prune:
+                self._writes_since_prune = 0
+
+        if should_prune:
+            self.prune()
@@ -0,0 +1,120 @@
+import io
+import logging
+import tempfile
+from contextlib import contextmanager
+from flask import current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_UPLOAD_BYTES = 10 * 1024 * 1024   # largest accepted image
+DEFAULT_SPOOL_BYTES = 1024 * 1024             # kept in memory before spilling to disk
+
+# Room for the multipart boundaries and form fields around the image
+MULTIPART_OVERHEAD = 64 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload is larger than the configured limit"""
+
+def spool_stream(stream, max_bytes, spool_size=DEFAULT_SPOOL_BYTES):
+    """
+    Copy a stream into a spooled temporary file, chunk by chunk
+
+    Small uploads stay in memory; larger ones spill to a temporary file, so
+    memory use per request stays bounded by `spool_size` plus one chunk.
+
+    Args:
+        stream: Readable binary stream
+        max_bytes (int): Largest accepted size
+        spool_size (int): Bytes kept in memory before spilling to disk
+
+    Returns:
+        SpooledTemporaryFile: The copied data, positioned at the start
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    total = 0
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > max_bytes:
+                raise UploadTooLargeError(f"Upload exceeds {max_bytes} bytes")
+            spooled.write(chunk)
+    except BaseException:
+        spooled.close()
+        raise
+
+    spooled.seek(0)
+    return spooled
+
+def read_image_upload(request, field='image'):
+    """
+    Get the uploaded image of a request as a file object, without buffering it whole
+
+    multipart/form-data requests are parsed by Werkzeug, which already
+    spools file parts to temporary files; any other content type is treated
+    as the raw image and streamed from the request body. Announced sizes
+    over the limit are rejected before anything is read.
+
+    Args:
+        request: The current Flask request
+        field (str): Form field holding the image in multipart requests
+
+    Returns:
+        A seekable binary file object, or None if the request has no image
+    """
+    config = current_app.config
+    max_bytes = config.get("MAX_UPLOAD_BYTES", DEFAULT_MAX_UPLOAD_BYTES)
+
+    if request.mimetype == 'multipart/form-data':
+        limit = max_bytes + MULTIPART_OVERHEAD
+        if request.content_length is not None and request.content_length > limit:
+            raise UploadTooLargeError(f"Upload exceeds {max_bytes} bytes")
+
+        request.max_content_length = limit
+        try:
+            upload = request.files.get(field)
+        except RequestEntityTooLarge:
+            raise UploadTooLargeError(f"Upload exceeds {max_bytes} bytes")
+
+        if upload is None or upload.filename == '':
+            return None
+        return upload.stream
+
+    if request.content_length is not None and request.content_length > max_bytes:
+        raise UploadTooLargeError(f"Upload exceeds {max_bytes} bytes")
+
+    spooled = spool_stream(request.stream, max_bytes,
+                           config.get("UPLOAD_SPOOL_BYTES", DEFAULT_SPOOL_BYTES))
+    if spooled.read(1) == b'':
+        spooled.close()
+        return None
+    spooled.seek(0)
+    return spooled
+
+@contextmanager
+def open_image_source(image):
+    """
+    Open an image given as a path, raw bytes or a binary file object
+
+    Paths are opened (and closed again) here; file objects are rewound but
+    left open for the caller.
+
+    Args:
+        image: Path to the image, raw image bytes or a seekable file object
+
+    Yields:
+        A seekable binary file object positioned at the start
+    """
+    if isinstance(image, (bytes, bytearray)):
+        yield io.BytesIO(image)
+    elif hasattr(image, 'read'):
+        image.seek(0)
+        yield image
+    else:
+        with io.open(image, 'rb') as image_file:
+            yield image_file
@@ -4,6 +4,15 @@ import logging
 from google.cloud import vision
 from google.oauth2 import service_account
 from app import app
+from utils.classification_cache import get_classification_cache, hash_image_content
+from utils.image_hashing import compute_dhash, get_near_duplicate_index
+from utils.vision_batcher import get_vision_batcher
+from utils.resilience import get_upstream
+from utils import http_clients
+from utils.label_matcher import LabelMatcher
+from utils.image_preprocessing import prepare_image
+from utils.uploads import open_image_source
+from utils.annotations import store_annotations
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -17,6 +26,12 @@ WASTE_CATEGORIES = {
     'electronic': ['computer', 'phone', 'tablet', 'television', 'printer', 'keyboard', 'charger', 'cable', 'electronic device']
 }
 
+# Keyword automaton over WASTE_CATEGORIES, compiled once at import time
+LABEL_MATCHER = LabelMatcher(
+    [(item, category) for category, items in WASTE_CATEGORIES.items() for item in items],
+    WASTE_CATEGORIES.keys()
+)
+
 # Recommendations based on waste type
 WASTE_RECOMMENDATIONS = {
     'recyclable': [
@@ -51,29 +66,29 @@ WASTE_RECOMMENDATIONS = {
     ]
 }
 
+# Namespace for this classifier's entries in the classification cache
+CACHE_NAMESPACE = 'vision_api'
+
 def get_vision_client():
-    """Creates and returns a Google Vision API client."""
+    """Returns the shared Google Vision API client."""
     try:
         api_key = app.config['GOOGLE_VISION_API_KEY']
         
-        # If using API key authentication
-        if api_key:
-            client = vision.ImageAnnotatorClient.from_service_account_json(api_key)
-            return client
-        
-        # Fall back to application default credentials
-        return vision.ImageAnnotatorClient()
+        # If using API key authentication, otherwise fall back to
+        # application default credentials
+        return http_clients.get_vision_client(api_key or None)
     
     except Exception as e:
         logger.error(f"Error initializing Vision API client: {str(e)}")
         return None
 
-def classify_waste_image(image_path):
+def classify_waste_image(image):
     """
     Classifies an image of waste using Google Vision API.
     
     Args:
-        image_path: Path to the image file
+        image: Path to the image file, raw image bytes or a seekable binary
+            file object (e.g. a spooled upload), which is read in place
         
     Returns:
         Dictionary containing the classification result:
@@ -84,36 +99,55 @@ def classify_waste_image(image_path):
         }
     """
     try:
-        client = get_vision_client()
-        if not client:
-            logger.error("Failed to initialize Vision API client")
-            return None
-        
-        # Read the image file
-        with io.open(image_path, 'rb') as image_file:
-            content = image_file.read()
+        with open_image_source(image) as image_file:
+            # Repeat uploads and client retries are answered from the cache
+            cache = get_classification_cache()
+            content_hash = hash_image_content(image_file)
+            cached = cache.get(CACHE_NAMESPACE, content_hash)
+            if cached is not None:
+                return cached
+            
+            # Upright, downsized copy: smaller uploads and a stable fingerprint
+            prepared = prepare_image(
+                image_file,
+                max_dimension=app.config.get('VISION_MAX_DIMENSION'),
+                quality=app.config.get('VISION_JPEG_QUALITY')
+            )
         
-        image = vision.Image(content=content)
+        # Re-encoded or resized copies of an earlier photo reuse its result
+        near_duplicates = get_near_duplicate_index()
+        fingerprint = compute_dhash(prepared.image)
+        cached = near_duplicates.lookup(CACHE_NAMESPACE, fingerprint)
+        if cached is not None:
+            cache.set(CACHE_NAMESPACE, content_hash, cached)
+            return cached
         
-        # Detect labels in the image
-        response = client.label_detection(image=image)
-        labels = response.label_annotations
+        image = vision.Image(content=prepared.content)
+        client = None
         
-        if response.error.message:
-            logger.error(f"Vision API error: {response.error.message}")
-            return None
+        # Detect labels in the image, batched with concurrent requests when enabled
+        batcher = get_vision_batcher()
+        if batcher:
+            response = batcher.annotate(prepared.content)
+            labels = [(label['description'], label['score']) for label in response.get('labelAnnotations', [])]
+        else:
+            client = get_vision_client()
+            if not client:
+                logger.error("Failed to initialize Vision API client")
+                return None
+            
+            response = get_upstream('vision').call(
+                lambda timeout: client.label_detection(image=image, timeout=timeout[1])
+            )
+            
+            if response.error.message:
+                logger.error(f"Vision API error: {response.error.message}")
+                return None
+            
+            labels = [(label.description, label.score) for label in response.label_annotations]
         
         # Process labels to determine waste category
-        waste_scores = {category: 0 for category in WASTE_CATEGORIES}
-        
-        for label in labels:
-            label_name = label.description.lower()
-            score = label.score
-            
-            for category, items in WASTE_CATEGORIES.items():
-                for item in items:
-                    if item in label_name or label_name in item:
-                        waste_scores[category] += score
+        waste_scores = LABEL_MATCHER.score_bidirectional(labels)
         
         # Determine the most likely waste category
         max_score = 0
@@ -125,18 +159,19 @@ def classify_waste_image(image_path):
                 best_category = category
         
         # If no category had a good match, use object detection for more specific analysis
+        detected_objects = None
         if max_score < 0.1:
             # Fall back to object detection
-            objects = client.object_localization(image=image).localized_object_annotations
+            if client is None:
+                client = get_vision_client()
+            objects = get_upstream('vision').call(
+                lambda timeout: client.object_localization(image=image, timeout=timeout[1])
+            ).localized_object_annotations
             
-            for detected_object in objects:
-                object_name = detected_object.name.lower()
-                score = detected_object.score
-                
-                for category, items in WASTE_CATEGORIES.items():
-                    for item in items:
-                        if item in object_name or object_name in item:
-                            waste_scores[category] += score
+            detected_objects = [(detected_object.name, detected_object.score) for detected_object in objects]
+            object_scores = LABEL_MATCHER.score_bidirectional(detected_objects)
+            for category, score in object_scores.items():
+                waste_scores[category] += score
             
             # Recalculate best category
             for category, score in waste_scores.items():
@@ -144,14 +179,21 @@ def classify_waste_image(image_path):
                     max_score = score
                     best_category = category
         
+        # Keep the raw annotations so past results can be re-scored offline
+        store_annotations(content_hash, labels, detected_objects)
+        
         # Get recommendations for the waste type
         recommendations = WASTE_RECOMMENDATIONS.get(best_category, [])
         
-        return {
+        result = {
             'label': best_category,
             'confidence': max_score,
             'recommendations': recommendations
         }
+        cache.set(CACHE_NAMESPACE, content_hash, result)
+        near_duplicates.remember(CACHE_NAMESPACE, fingerprint, result)
+        
+        return result
     
     except Exception as e:
         logger.error(f"Error classifying waste image: {str(e)}")
@@ -0,0 +1,181 @@
+import time
+import base64
+import queue
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from flask import current_app
+from utils.http_clients import get_session
+from utils.resilience import get_upstream
+from utils.executors import ProcessLocalExecutor
+
+logger = logging.getLogger(__name__)
+
+VISION_API_ENDPOINT = "https://vision.googleapis.com/v1/images:annotate"
+
+# images:annotate accepts at most 16 images per request
+MAX_BATCH_SIZE = 16
+
+DEFAULT_FEATURES = [{"type": "LABEL_DETECTION", "maxResults": 10}]
+
+class VisionAPIError(Exception):
+    """Raised for a failed annotate call or a per-image error in its response"""
+
+class VisionBatcher:
+    """
+    Coalesces concurrent Vision annotate requests into batched calls.
+
+    Callers block in annotate() while a dispatcher thread collects requests
+    for up to `window_ms` milliseconds (or until `max_batch` images are
+    queued), sends them as one images:annotate request and hands each
+    response back to the caller that submitted the image.
+    """
+
+    def __init__(self, api_key, endpoint=VISION_API_ENDPOINT, window_ms=20,
+                 max_batch=MAX_BATCH_SIZE, max_in_flight=4, timeout=30, upstream=None):
+        self.api_key = api_key
+        self.endpoint = endpoint
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, min(max_batch, MAX_BATCH_SIZE))
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.upstream = upstream
+        self._lock = threading.Lock()
+        self._senders = ProcessLocalExecutor(self._start)
+        self._stats = {'images': 0, 'batches': 0, 'errors': 0}
+
+    def submit(self, content, features=None):
+        """
+        Queue an image for the next batch
+
+        Args:
+            content (bytes): Raw image bytes
+            features (list, optional): Vision feature list for this image
+
+        Returns:
+            Future: Resolves to the image's entry of the annotate response
+        """
+        self._senders.get()
+        future = Future()
+        self._queue.put((content, features or DEFAULT_FEATURES, future))
+        return future
+
+    def annotate(self, content, features=None, timeout=None):
+        """
+        Annotate one image through the batcher and wait for its result
+
+        Args:
+            content (bytes): Raw image bytes
+            features (list, optional): Vision feature list for this image
+            timeout (float, optional): Seconds to wait for the result
+
+        Returns:
+            dict: The image's AnnotateImageResponse as returned by the REST API
+        """
+        return self.submit(content, features).result(timeout=timeout or self.timeout * 2)
+
+    def stats(self):
+        """
+        Get batching counters for monitoring
+
+        Returns:
+            dict: Images sent, batches sent, failed batches and average batch size
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['avg_batch_size'] = round(stats['images'] / stats['batches'], 2) if stats['batches'] else 0.0
+        return stats
+
+    def _start(self):
+        # The dispatcher thread comes with the sender pool, one per process
+        self._queue = queue.Queue()
+        self._dispatcher = threading.Thread(target=self._dispatch, name='vision-batcher', daemon=True)
+        self._dispatcher.start()
+        return ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='vision-batch')
+
+    def _dispatch(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._senders.submit(self._send, batch)
+
+    def _send(self, batch):
+        request_data = {
+            "requests": [
+                {
+                    "image": {"content": base64.b64encode(content).decode('utf-8')},
+                    "features": features
+                }
+                for content, features, _ in batch
+            ]
+        }
+
+        try:
+            if self.upstream is not None:
+                # Timeouts, retries and the circuit breaker of the Vision upstream
+                response = self.upstream.post(self.endpoint, params={"key": self.api_key}, json=request_data)
+            else:
+                response = get_session('vision').post(self.endpoint, params={"key": self.api_key},
+                                                      json=request_data, timeout=self.timeout)
+            response.raise_for_status()
+            responses = response.json().get("responses", [])
+
+            if len(responses) != len(batch):
+                raise VisionAPIError(f"Expected {len(batch)} responses, got {len(responses)}")
+
+        except Exception as e:
+            logger.error(f"Error in batched Vision request: {str(e)}")
+            with self._lock:
+                self._stats['errors'] += 1
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        with self._lock:
+            self._stats['images'] += len(batch)
+            self._stats['batches'] += 1
+
+        for (_, _, future), result in zip(batch, responses):
+            if "error" in result:
+                future.set_exception(VisionAPIError(result["error"].get("message", "Unknown error")))
+            else:
+                future.set_result(result)
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def get_vision_batcher():
+    """
+    Get the process-wide Vision batcher, configured from the app config
+
+    Returns:
+        VisionBatcher: Shared batcher, or None when batching is disabled or
+        no API key is configured
+    """
+    global _batcher
+    config = current_app.config
+    if not config.get("GOOGLE_VISION_API_KEY") or config.get("VISION_BATCH_WINDOW_MS", 0) <= 0:
+        return None
+
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = VisionBatcher(
+                    api_key=config["GOOGLE_VISION_API_KEY"],
+                    endpoint=config.get("GOOGLE_VISION_API_ENDPOINT", VISION_API_ENDPOINT),
+                    window_ms=config["VISION_BATCH_WINDOW_MS"],
+                    max_batch=config.get("VISION_BATCH_MAX_SIZE", MAX_BATCH_SIZE),
+                    timeout=config.get("VISION_DEADLINE", 30),
+                    upstream=get_upstream('vision')
+                )
+    return _batcher
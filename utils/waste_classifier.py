@@ -1,9 +1,24 @@
 import os
 import io
 import logging
+from collections import namedtuple
+import numpy as np
 from google.cloud import vision
 from google.oauth2 import service_account
 from flask import current_app
+from utils.classification_cache import get_classification_cache, hash_image_content
+from utils.image_hashing import compute_dhash, get_near_duplicate_index
+from utils.vision_batcher import get_vision_batcher
+from utils.http_clients import get_vision_client
+from utils.resilience import get_upstream, CircuitOpenError
+from utils.color_features import load_thumbnail, to_planar, channel_means, extract_features
+from utils.offline_model import get_offline_model
+from utils.label_matcher import LabelMatcher
+from utils.image_preprocessing import prepare_image
+from utils.annotations import store_annotations
+from utils.classification_cascade import (
+    ClassificationCascade, TierResult, DEFAULT_CONFIDENCE_THRESHOLD, DEFAULT_AMBIGUITY_MARGIN
+)
 
 logger = logging.getLogger(__name__)
 
@@ -34,9 +49,39 @@ WASTE_CATEGORIES = {
     'diaper': 'non-recyclable'
 }
 
+# Keyword automaton over WASTE_CATEGORIES, compiled once at import time
+LABEL_MATCHER = LabelMatcher(
+    WASTE_CATEGORIES.items(),
+    ['recyclable', 'organic', 'hazardous', 'non-recyclable']
+)
+
+# Weight of a label that only contains a keyword, relative to an exact match
+PARTIAL_MATCH_WEIGHT = 0.7
+
+# Below this best label score Vision's localized objects are scored as well,
+# the same rule utils/vision_api.py applies
+OBJECT_FALLBACK_THRESHOLD = 0.1
+OBJECT_FEATURES = [{"type": "OBJECT_LOCALIZATION", "maxResults": 10}]
+
+# Results of the local colour heuristic: organic, recyclable, hazardous, default
+LOCAL_HEURISTIC_RESULTS = [
+    ('organic', 0.6),
+    ('recyclable', 0.6),
+    ('hazardous', 0.5),
+    ('non-recyclable', 0.4)
+]
+
+# Namespace for this classifier's entries in the classification cache
+CACHE_NAMESPACE = 'waste_classifier'
+
+# Result of classify_upload(); content_hash is the SHA-256 of the image, or
+# None when the upload could not be read
+Classification = namedtuple('Classification', ['waste_type', 'confidence', 'content_hash'])
+
 def classify_waste_image(image_file):
     """
-    Classify an image of waste using Google Cloud Vision API
+    Classify an image of waste, trying the local classifier first and
+    escalating to Google Cloud Vision API when it is not confident
     
     Args:
         image_file: File object containing the image
@@ -44,72 +89,272 @@ def classify_waste_image(image_file):
     Returns:
         tuple: (waste_type, confidence)
     """
+    waste_type, confidence, _ = classify_upload(image_file)
+    return waste_type, confidence
+
+def classify_upload(image_file):
+    """
+    Classify an image of waste like classify_waste_image(), also returning
+    the content hash that links the stored entry to the image
+    
+    Vision annotations obtained along the way are stored under that hash,
+    so the entry can be re-scored later without calling Vision again.
+    
+    Args:
+        image_file: File object containing the image
+        
+    Returns:
+        Classification: (waste_type, confidence, content_hash)
+    """
+    content_hash = None
     try:
+        # The upload is hashed and decoded in place rather than read into memory
+        content_hash = hash_image_content(image_file)
+        
         # Initialize Vision client
         api_key = current_app.config["GOOGLE_VISION_API_KEY"]
         if not api_key:
             # Fallback to local classification if no API key
-            return local_classify_waste(image_file)
+            return Classification(*local_classify_waste(image_file), content_hash)
             
-        # Set up the Vision client
-        client = vision.ImageAnnotatorClient()
+        # Repeat uploads and client retries are answered from the cache
+        cache = get_classification_cache()
+        cached = cache.get(CACHE_NAMESPACE, content_hash)
+        if cached is not None:
+            logger.info(f"Classification cache hit for {content_hash[:12]}")
+            return Classification(cached[0], cached[1], content_hash)
         
-        # Read the image
-        content = image_file.read()
+        # Decode once: upright, downsized image for the fingerprint and the
+        # local tier, re-encoded bytes for Vision
+        prepared = prepare_image(image_file)
         
-        # Create an Image object
-        image = vision.Image(content=content)
+        # Re-encoded or resized copies of an earlier photo reuse its result
+        near_duplicates = get_near_duplicate_index()
+        fingerprint = compute_dhash(prepared.image)
+        cached = near_duplicates.lookup(CACHE_NAMESPACE, fingerprint)
+        if cached is not None:
+            cache.set(CACHE_NAMESPACE, content_hash, cached)
+            return Classification(cached[0], cached[1], content_hash)
         
-        # Perform label detection
-        response = client.label_detection(image=image)
+        # Cheap local tier first, Vision only for images it is unsure about
+        result = get_classification_cascade().classify(prepared)
+        logger.info(f"Classified waste as {result.waste_type} with confidence {result.confidence} "
+                    f"by the {result.tier} tier")
         
-        if response.error.message:
-            raise Exception(f'Google Vision API error: {response.error.message}')
-            
-        labels = response.label_annotations
-        
-        # Map the labels to waste categories
-        waste_type_scores = {
-            'recyclable': 0.0,
-            'organic': 0.0,
-            'hazardous': 0.0,
-            'non-recyclable': 0.0
-        }
-        
-        for label in labels:
-            label_name = label.description.lower()
-            
-            # Check for exact matches
-            if label_name in WASTE_CATEGORIES:
-                category = WASTE_CATEGORIES[label_name]
-                waste_type_scores[category] += label.score
-            else:
-                # Check for partial matches
-                for keyword, category in WASTE_CATEGORIES.items():
-                    if keyword in label_name:
-                        waste_type_scores[category] += label.score * 0.7  # Reduced confidence for partial matches
-        
-        # Determine the most likely waste type
-        if max(waste_type_scores.values()) > 0:
-            most_likely_type = max(waste_type_scores, key=waste_type_scores.get)
-            confidence = waste_type_scores[most_likely_type]
-        else:
-            # If no match found, default to non-recyclable
-            most_likely_type = 'non-recyclable'
-            confidence = 0.5
-        
-        logger.info(f"Classified waste as {most_likely_type} with confidence {confidence}")
-        return most_likely_type, float(confidence)
+        if result.annotations is not None:
+            store_annotations(content_hash, *result.annotations)
+        
+        # Answers served after a failed escalation are not worth remembering
+        if not result.degraded:
+            cached = [result.waste_type, float(result.confidence)]
+            cache.set(CACHE_NAMESPACE, content_hash, cached)
+            near_duplicates.remember(CACHE_NAMESPACE, fingerprint, cached)
+        return Classification(result.waste_type, float(result.confidence), content_hash)
         
     except Exception as e:
         logger.error(f"Error in waste classification: {str(e)}")
         # Fallback to local classification on error
-        return local_classify_waste(image_file)
+        return Classification(*local_classify_waste(image_file), content_hash)
+
+def vision_classify(prepared):
+    """
+    Classification tier backed by Google Cloud Vision label detection
+    
+    Args:
+        prepared (PreparedImage): Output of prepare_image()
+        
+    Returns:
+        TierResult: Best matching waste type and its summed label score,
+        carrying (labels, objects) as annotations
+    """
+    labels = get_vision_labels(prepared.content)
+    objects = None
+    if needs_objects(labels):
+        try:
+            objects = get_vision_objects(prepared.content)
+        except Exception as e:
+            # The labels alone still give an answer
+            logger.error(f"Error in Vision object localization: {str(e)}")
+    return score_labels(labels, objects)._replace(annotations=(labels, objects))
+
+def needs_objects(labels):
+    """
+    Check whether labels match the waste categories too weakly on their own
+    
+    Args:
+        labels: List of (description, score) tuples
+        
+    Returns:
+        bool: True if localized objects should be scored as well
+    """
+    scores = LABEL_MATCHER.score(labels, partial_weight=PARTIAL_MATCH_WEIGHT)
+    return max(scores.values()) < OBJECT_FALLBACK_THRESHOLD
+
+def score_labels(labels, objects=None):
+    """
+    Map Vision labels to the most likely waste type
+    
+    Args:
+        labels: List of (description, score) tuples
+        objects (optional): List of (name, score) tuples from object
+            localization, added when the labels score below
+            OBJECT_FALLBACK_THRESHOLD
+        
+    Returns:
+        TierResult: Best matching waste type and its summed label score
+    """
+    # Map the labels to waste categories: exact matches count fully,
+    # partial matches with reduced confidence
+    waste_type_scores = LABEL_MATCHER.score(labels, partial_weight=PARTIAL_MATCH_WEIGHT)
+    
+    if objects and max(waste_type_scores.values()) < OBJECT_FALLBACK_THRESHOLD:
+        object_scores = LABEL_MATCHER.score(objects, partial_weight=PARTIAL_MATCH_WEIGHT)
+        for category, score in object_scores.items():
+            waste_type_scores[category] += score
+    
+    # Determine the most likely waste type
+    if max(waste_type_scores.values()) > 0:
+        most_likely_type = max(waste_type_scores, key=waste_type_scores.get)
+        confidence = waste_type_scores[most_likely_type]
+    else:
+        # If no match found, default to non-recyclable
+        most_likely_type = 'non-recyclable'
+        confidence = 0.5
+    
+    return TierResult(most_likely_type, float(confidence), None)
+
+def local_classify(prepared):
+    """
+    Classification tier backed by the offline model or colour heuristic
+    
+    Args:
+        prepared (PreparedImage): Output of prepare_image(); its decoded
+            image is reused, so the upload is not decoded a second time
+        
+    Returns:
+        TierResult: Predicted waste type, its probability and the gap to the
+        runner-up category (None for the heuristic, which has no runner-up)
+    """
+    return local_classify_pixels(load_thumbnail(prepared.image)[np.newaxis])[0]
+
+def local_classify_pixels(pixels):
+    """
+    Local tier for a stack of thumbnails, evaluated in one vectorized pass
+    
+    Args:
+        pixels (numpy.ndarray): uint8 array of shape (N, 100, 100, 3)
+        
+    Returns:
+        list: TierResult per thumbnail
+    """
+    model = get_local_model()
+    if model is None:
+        return [TierResult(waste_type, confidence, None)
+                for waste_type, confidence in _heuristic_predictions(pixels)]
+    
+    probabilities = model.predict_proba(extract_features(pixels))
+    ranked = np.argsort(probabilities, axis=1)[:, ::-1]
+    results = []
+    for row, (best, runner_up) in enumerate(ranked[:, :2]):
+        results.append(TierResult(
+            model.categories[best],
+            round(float(probabilities[row, best]), 4),
+            float(probabilities[row, best] - probabilities[row, runner_up])
+        ))
+    return results
+
+_cascade = None
+
+def get_classification_cascade():
+    """
+    Get the process-wide local-then-Vision cascade, configured from the app config
+    
+    Returns:
+        ClassificationCascade: Shared cascade instance
+    """
+    global _cascade
+    if _cascade is None:
+        config = current_app.config
+        _cascade = ClassificationCascade(
+            [('local', local_classify), ('vision', vision_classify)],
+            confidence_threshold=config.get("CASCADE_CONFIDENCE_THRESHOLD", DEFAULT_CONFIDENCE_THRESHOLD),
+            ambiguity_margin=config.get("CASCADE_AMBIGUITY_MARGIN", DEFAULT_AMBIGUITY_MARGIN)
+        )
+    return _cascade
+
+def get_vision_labels(content):
+    """
+    Run label detection on an image with Google Cloud Vision
+    
+    Concurrent requests are coalesced into batched annotate calls when
+    batching is enabled, otherwise the client library is called directly.
+    Raises CircuitOpenError without calling Vision while it is failing.
+    
+    Args:
+        content (bytes): Raw image bytes
+        
+    Returns:
+        list: (description, score) tuples for the detected labels
+    """
+    # While Vision is failing, fail at once so the cascade answers locally
+    upstream = get_upstream('vision')
+    if not upstream.available():
+        raise CircuitOpenError("vision circuit is open")
+    
+    batcher = get_vision_batcher()
+    if batcher:
+        response = batcher.annotate(content)
+        return [(label["description"], label["score"]) for label in response.get("labelAnnotations", [])]
+    
+    # Shared Vision client, reused across requests
+    client = get_vision_client()
+    
+    # Create an Image object
+    image = vision.Image(content=content)
+    
+    # Perform label detection, with the upstream's timeouts and retries
+    response = upstream.call(lambda timeout: client.label_detection(image=image, timeout=timeout[1]))
+    
+    if response.error.message:
+        raise Exception(f'Google Vision API error: {response.error.message}')
+    
+    return [(label.description, label.score) for label in response.label_annotations]
+
+def get_vision_objects(content):
+    """
+    Run object localization on an image with Google Cloud Vision
+    
+    Like get_vision_labels(), through the batcher when batching is enabled.
+    
+    Args:
+        content (bytes): Raw image bytes
+        
+    Returns:
+        list: (name, score) tuples for the localized objects
+    """
+    upstream = get_upstream('vision')
+    if not upstream.available():
+        raise CircuitOpenError("vision circuit is open")
+    
+    batcher = get_vision_batcher()
+    if batcher:
+        response = batcher.annotate(content, features=OBJECT_FEATURES)
+        return [(obj["name"], obj["score"]) for obj in response.get("localizedObjectAnnotations", [])]
+    
+    client = get_vision_client()
+    image = vision.Image(content=content)
+    response = upstream.call(lambda timeout: client.object_localization(image=image, timeout=timeout[1]))
+    
+    if response.error.message:
+        raise Exception(f'Google Vision API error: {response.error.message}')
+    
+    return [(obj.name, obj.score) for obj in response.localized_object_annotations]
 
 def local_classify_waste(image_file):
     """
     Fallback function for waste classification when API is not available.
-    Uses simple color-based heuristics for basic classification.
+    Uses the offline model when one has been trained, otherwise simple
+    color-based heuristics for basic classification.
     
     Args:
         image_file: File object containing the image
@@ -118,49 +363,7 @@ def local_classify_waste(image_file):
         tuple: (waste_type, confidence)
     """
     try:
-        from PIL import Image
-        
-        # Reset file pointer to the beginning
-        image_file.seek(0)
-        
-        # Open image with PIL
-        img = Image.open(image_file)
-        img = img.convert('RGB')
-        img = img.resize((100, 100))  # Resize for faster processing
-        
-        # Calculate dominant colors
-        pixels = list(img.getdata())
-        r_avg = sum(p[0] for p in pixels) / len(pixels)
-        g_avg = sum(p[1] for p in pixels) / len(pixels)
-        b_avg = sum(p[2] for p in pixels) / len(pixels)
-        
-        # Very simple heuristic based on color
-        # Green/brown -> organic
-        # Blue/transparent -> recyclable
-        # Red/yellow -> hazardous
-        # Gray/black -> non-recyclable
-        
-        if g_avg > r_avg and g_avg > b_avg:
-            # Dominant green, likely organic
-            waste_type = 'organic'
-            confidence = 0.6
-        elif b_avg > r_avg and b_avg > g_avg:
-            # Dominant blue, likely recyclable
-            waste_type = 'recyclable'
-            confidence = 0.6
-        elif r_avg > g_avg and r_avg > b_avg:
-            if r_avg > 150 and g_avg > 150:
-                # Yellow-ish, might be hazardous
-                waste_type = 'hazardous'
-                confidence = 0.5
-            else:
-                waste_type = 'non-recyclable'
-                confidence = 0.4
-        else:
-            # Default to non-recyclable
-            waste_type = 'non-recyclable'
-            confidence = 0.4
-            
+        waste_type, confidence = classify_batch([image_file])[0]
         logger.info(f"Local classification: {waste_type} with confidence {confidence}")
         return waste_type, confidence
         
@@ -168,3 +371,73 @@ def local_classify_waste(image_file):
         logger.error(f"Error in local waste classification: {str(e)}")
         # Ultimate fallback - just return a reasonable default
         return 'non-recyclable', 0.3
+
+def get_local_model():
+    """
+    Get the offline waste model configured for this app
+    
+    Returns:
+        OfflineWasteModel: The memory-mapped model, or None if none was trained
+    """
+    return get_offline_model(current_app.config.get("OFFLINE_MODEL_PATH"))
+
+def classify_batch(images):
+    """
+    Classify many images locally in a single vectorized pass.
+    
+    Every image is decoded into a 100x100 thumbnail, the thumbnails are
+    stacked into one array and the offline model (or the colour heuristic
+    if no model was trained) is evaluated for all of them at once.
+    
+    Args:
+        images: List of file objects, raw bytes or PIL Images
+        
+    Returns:
+        list: (waste_type, confidence) tuple per image, in input order
+    """
+    results = [('non-recyclable', 0.3)] * len(images)
+    
+    thumbnails = []
+    positions = []
+    for position, image in enumerate(images):
+        try:
+            thumbnails.append(load_thumbnail(image))
+            positions.append(position)
+        except Exception as e:
+            logger.error(f"Error decoding image for local classification: {str(e)}")
+    
+    if not thumbnails:
+        return results
+    
+    pixels = np.stack(thumbnails)
+    
+    # A trained offline model takes precedence over the colour heuristic
+    model = get_local_model()
+    if model is not None:
+        predictions = model.predict(extract_features(pixels))
+    else:
+        predictions = _heuristic_predictions(pixels)
+    
+    for position, prediction in zip(positions, predictions):
+        results[position] = prediction
+    
+    return results
+
+def _heuristic_predictions(pixels):
+    means = channel_means(to_planar(pixels))
+    r_avg, g_avg, b_avg = means[:, 0], means[:, 1], means[:, 2]
+    
+    # Very simple heuristic based on color
+    # Green/brown -> organic
+    # Blue/transparent -> recyclable
+    # Red/yellow -> hazardous
+    # Gray/black -> non-recyclable
+    red_dominant = (r_avg > g_avg) & (r_avg > b_avg)
+    conditions = [
+        (g_avg > r_avg) & (g_avg > b_avg),                   # Dominant green, likely organic
+        (b_avg > r_avg) & (b_avg > g_avg),                   # Dominant blue, likely recyclable
+        red_dominant & (r_avg > 150) & (g_avg > 150),        # Yellow-ish, might be hazardous
+    ]
+    type_index = np.select(conditions, [0, 1, 2], default=3)
+    
+    return [LOCAL_HEURISTIC_RESULTS[index] for index in type_index]